@@ -1,5 +1,7 @@
 import sys
 import base64
+import importlib
+import threading
 from pathlib import Path
 
 _HERE = Path(__file__).parent
@@ -8,14 +10,66 @@ if str(_HERE) not in sys.path:
 
 import streamlit as st
 
-from pages.overview import render_overview_page
-from pages.cyber_risk import render_cyber_risk_page
-from pages.isafe import render_isafe_page
-from pages.tapcare import render_tapcare_page
-from pages.homesaving import render_homesaving_page
-from pages.other_products import render_other_products_page
-from pages.complaints import render_complaints_page
-from pages.payment_retention import render_payment_retention_page
+# Trang → (module, hàm render). Chỉ module của trang đang mở được import (lúc
+# render), nên màn hình đăng nhập không phải nạp altair/pandas/duckdb.
+PAGES: dict[str, tuple[str, str]] = {
+    "Tổng quan":           ("pages.overview",          "render_overview_page"),
+    "Cyber Risk":          ("pages.cyber_risk",        "render_cyber_risk_page"),
+    "I-Safe":              ("pages.isafe",             "render_isafe_page"),
+    "TapCare":             ("pages.tapcare",           "render_tapcare_page"),
+    "Nhà và bạn":          ("pages.homesaving",        "render_homesaving_page"),
+    "Sản phẩm khác":       ("pages.other_products",    "render_other_products_page"),
+    "Thu phí & Retention": ("pages.payment_retention", "render_payment_retention_page"),
+    "Khiếu nại":           ("pages.complaints",        "render_complaints_page"),
+    "Chẩn đoán":           ("pages.diagnostics",       "render_diagnostics_page"),
+}
+_DEFAULT_PAGE = "Nhà và bạn"
+_ADMIN_PAGES = {"Chẩn đoán"}
+
+
+def _render_page(name: str) -> None:
+    module, fn = PAGES[name]
+    getattr(importlib.import_module(module), fn)()
+
+
+# ── Callbacks ────────────────────────────────────────────────────────────────
+# Nút chạy callback trước lượt chạy lại nên một lần bấm chỉ tốn một lượt
+# chạy script (không cần st.rerun() sau khi đổi session_state).
+def _go(page: str) -> None:
+    st.session_state.page = page
+
+
+def _toggle_vhct() -> None:
+    st.session_state.vhct_open = not st.session_state.vhct_open
+
+
+def _login() -> None:
+    pwd = st.session_state.login_pwd
+    # ADMIN_PASSWORD (tùy chọn) mở thêm trang Chẩn đoán
+    is_admin = bool(st.secrets.get("ADMIN_PASSWORD")) and pwd == st.secrets["ADMIN_PASSWORD"]
+    if pwd == st.secrets["APP_PASSWORD"] or is_admin:
+        st.session_state.authenticated = True
+        st.session_state.is_admin = is_admin
+    else:
+        st.session_state.login_failed = True
+
+
+@st.cache_resource(show_spinner=False)
+def _start_warmup() -> threading.Thread:
+    """
+    Một lần mỗi process, từ lượt chạy đầu tiên sau đăng nhập: import
+    cache_registry (pandas, duckdb) và khởi động luồng làm nóng trong thread
+    nền. Trước khi đăng nhập không tải gì — form đăng nhập không chạm tới
+    MotherDuck.
+    """
+    def run():
+        from cache_registry import start_warmup
+        start_warmup()
+
+    t = threading.Thread(target=run, name="ipay-warmup-start", daemon=True)
+    t.start()
+    return t
+
 
 st.set_page_config(
     page_title="VBI iPay Dashboard",
@@ -74,6 +128,8 @@ if "page" not in st.session_state:
     st.session_state.page = "Tổng quan"
 if "vhct_open" not in st.session_state:
     st.session_state.vhct_open = True
+if "is_admin" not in st.session_state:
+    st.session_state.is_admin = False
 
 if not st.session_state.authenticated:
     # Base64-encode the lock SVG so it embeds cleanly in CSS without encoding issues
@@ -213,17 +269,20 @@ if not st.session_state.authenticated:
             </div>
         """, unsafe_allow_html=True)
 
-        pwd = st.text_input("Mật khẩu", placeholder="Nhập mật khẩu", type="password",
-                            label_visibility="collapsed")
-        submitted = st.form_submit_button("Đăng nhập")
-        if submitted:
-            if pwd == st.secrets["APP_PASSWORD"]:
-                st.session_state.authenticated = True
-                st.rerun()
-            else:
-                st.error("Mật khẩu không đúng.")
+        st.text_input("Mật khẩu", placeholder="Nhập mật khẩu", type="password",
+                      label_visibility="collapsed", key="login_pwd")
+        st.form_submit_button("Đăng nhập", on_click=_login)
+        if st.session_state.pop("login_failed", False):
+            st.error("Mật khẩu không đúng.")
     st.stop()
 
+# Làm nóng mọi dataset ở nền (lượt chạy ngay sau khi đăng nhập khởi động nó)
+_start_warmup()
+
+# Sau đăng nhập mới cần tới pandas/duckdb
+from instrumentation import page as page_timer
+from local_mirror import stale_tables
+
 with st.sidebar:
     # ── Icon-only header ──────────────────────────────────────────────────────
     st.markdown("""
@@ -241,61 +300,41 @@ with st.sidebar:
     """, unsafe_allow_html=True)
 
     # ── Top-level nav item ────────────────────────────────────────────────────
-    if st.button("Tổng quan hàng ngày", key="nav_overview",
-                 width="stretch"):
-        st.session_state.page = "Tổng quan"
-        st.rerun()
+    st.button("Tổng quan hàng ngày", key="nav_overview", width="stretch",
+              on_click=_go, args=("Tổng quan",))
 
     # ── Collapsible section header ────────────────────────────────────────────
     arrow = "▾" if st.session_state.vhct_open else "▸"
-    if st.button(f"Báo cáo chi tiết {arrow}", key="nav_vhct",
-                 width="stretch"):
-        st.session_state.vhct_open = not st.session_state.vhct_open
-        st.rerun()
+    st.button(f"Báo cáo chi tiết {arrow}", key="nav_vhct", width="stretch",
+              on_click=_toggle_vhct)
 
     # ── Sub-items (shown when section is expanded) ────────────────────────────
     if st.session_state.vhct_open:
-        if st.button("Cyber Risk", key="nav_cyber", width="stretch"):
-            st.session_state.page = "Cyber Risk"
-            st.rerun()
-        if st.button("I-Safe", key="nav_isafe", width="stretch"):
-            st.session_state.page = "I-Safe"
-            st.rerun()
-        if st.button("TapCare", key="nav_tapcare", width="stretch"):
-            st.session_state.page = "TapCare"
-            st.rerun()
-        if st.button("Nhà và bạn", key="nav_homesaving", width="stretch"):
-            st.session_state.page = "Nhà và bạn"
-            st.rerun()
-        if st.button("Sản phẩm khác", key="nav_other", width="stretch"):
-            st.session_state.page = "Sản phẩm khác"
-            st.rerun()
-
-    if st.button("Thu phí & Retention", key="nav_retention", width="stretch"):
-        st.session_state.page = "Thu phí & Retention"
-        st.rerun()
-
-    if st.button("Báo cáo CSKH", key="nav_complaints", width="stretch"):
-        st.session_state.page = "Khiếu nại"
-        st.rerun()
+        st.button("Cyber Risk", key="nav_cyber", width="stretch", on_click=_go, args=("Cyber Risk",))
+        st.button("I-Safe", key="nav_isafe", width="stretch", on_click=_go, args=("I-Safe",))
+        st.button("TapCare", key="nav_tapcare", width="stretch", on_click=_go, args=("TapCare",))
+        st.button("Nhà và bạn", key="nav_homesaving", width="stretch", on_click=_go, args=("Nhà và bạn",))
+        st.button("Sản phẩm khác", key="nav_other", width="stretch", on_click=_go, args=("Sản phẩm khác",))
+
+    st.button("Thu phí & Retention", key="nav_retention", width="stretch", on_click=_go, args=("Thu phí & Retention",))
+
+    st.button("Báo cáo CSKH", key="nav_complaints", width="stretch", on_click=_go, args=("Khiếu nại",))
+
+    # ── Admin only ────────────────────────────────────────────────────────────
+    if st.session_state.is_admin:
+        st.button("Chẩn đoán", key="nav_diagnostics", width="stretch", on_click=_go, args=("Chẩn đoán",))
 
 page = st.session_state.page
 
-if page == "Tổng quan":
-    render_overview_page()
-elif page == "Cyber Risk":
-    render_cyber_risk_page()
-elif page == "I-Safe":
-    render_isafe_page()
-elif page == "TapCare":
-    render_tapcare_page()
-elif page == "Nhà và bạn":
-    render_homesaving_page()
-elif page == "Sản phẩm khác":
-    render_other_products_page()
-elif page == "Thu phí & Retention":
-    render_payment_retention_page()
-elif page == "Khiếu nại":
-    render_complaints_page()
-else:
-    render_homesaving_page()
+if stale_tables():
+    st.warning(
+        "Không kết nối được MotherDuck — đang hiển thị dữ liệu đã lưu từ lần đồng bộ gần nhất.",
+        icon="⚠️",
+    )
+
+if page not in PAGES or (page in _ADMIN_PAGES and not st.session_state.is_admin):
+    page = _DEFAULT_PAGE
+
+# Đo thời gian render (instrumentation) — xem ở trang Chẩn đoán
+with page_timer(page):
+    _render_page(page)
@@ -0,0 +1,303 @@
+"""
+benchmarks/profile_pages.py
+---------------------------
+Profile lượt render từng trang mà không cần trình duyệt: chạy app.py qua
+Streamlit ``AppTest`` (bỏ qua đăng nhập), loader đọc file DuckDB cục bộ
+(IPAY_OFFLINE=1), rồi với mỗi trang × kịch bản lọc ghi lại:
+
+  - thời gian cả lượt chạy app.py và riêng hàm render của trang
+  - thời gian theo section — section bắt đầu ở mỗi tiêu đề (markdown "#…",
+    ``<h1>`` hay tiêu đề biểu đồ in đậm) và gồm thời gian tính toán ra các
+    element của nó, cho tới tiêu đề kế tiếp
+  - số biểu đồ Altair, số byte HTML/markdown của ``st.markdown``
+  - các hàm tốn nhiều thời gian nhất (cProfile, chỉ trong hàm render trang)
+
+Mỗi kịch bản được chạy một lần để làm nóng dữ liệu rồi mới đo, nên số liệu là
+chi phí một lượt rerun (người dùng đổi bộ lọc), không gồm tải dữ liệu lần đầu;
+``--cold`` để đo cả lần đầu.
+
+  python -m benchmarks.profile_pages                            # dữ liệu giả x1
+  python -m benchmarks.profile_pages --pages "Tổng quan" --top 30
+  python -m benchmarks.profile_pages --db /path/fixture.duckdb --json out.json
+"""
+
+import argparse
+import cProfile
+import functools
+import html
+import importlib
+import io
+import json
+import os
+import pkgutil
+import pstats
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+# ── Kịch bản ─────────────────────────────────────────────────────────────────
+@dataclass(frozen=True)
+class Scenario:
+    page: str                                   # giá trị st.session_state.page
+    label: str
+    apply: Callable | None = None               # at → đổi widget trước lượt đo
+
+
+def _widget(at, key: str):
+    for kind in ("multiselect", "selectbox", "slider", "number_input", "date_input", "segmented_control"):
+        try:
+            return getattr(at, kind)(key=key)
+        except (KeyError, AttributeError):
+            continue
+    raise KeyError(key)
+
+
+def _all_years(at):
+    at.multiselect[0].set_value([])             # bỏ chọn năm = mọi năm
+
+
+def _first_option(key: str) -> Callable:
+    def apply(at):
+        w = _widget(at, key)
+        w.set_value([w.options[0]])
+    return apply
+
+
+SCENARIOS: list[Scenario] = [
+    Scenario("Tổng quan", "mặc định"),
+    Scenario("Tổng quan", "mọi năm", _all_years),
+    Scenario("Tổng quan", "lọc tháng 1–3", lambda at: [
+        _widget(at, k).set_value([1, 2, 3]) for k in ("rev_prod_months", "huy_prod_months", "new_prod_months")
+    ]),
+    *[s for page in ("Cyber Risk", "I-Safe", "TapCare", "Nhà và bạn", "Sản phẩm khác") for s in (
+        Scenario(page, "mặc định"),
+        Scenario(page, "mọi năm", _all_years),
+    )],
+    Scenario("Thu phí & Retention", "mặc định"),
+    Scenario("Thu phí & Retention", "một sản phẩm", lambda at: _widget(at, "ret_products").set_value(["Cyber Risk"])),
+    Scenario("Thu phí & Retention", "kỳ 3–5", lambda at: _widget(at, "pdt_ky").set_value((3, 5))),
+    Scenario("Khiếu nại", "mặc định"),
+    Scenario("Khiếu nại", "lọc đơn vị + ưu tiên", lambda at: [
+        _first_option("kn_sender")(at), _first_option("kn_priority")(at),
+    ]),
+]
+
+
+# ── Ghi nhận element + profile trong thread chạy script ──────────────────────
+_HEADING_HTML = re.compile(
+    r"^\s*<(h[1-6]|p)\b[^>]*font-weight:\s*[67]00[^>]*>([^<]{1,120})</\1>\s*$", re.S,
+)
+
+
+def _heading(kind: str, body: str) -> str | None:
+    """Tên section nếu element là tiêu đề, ngược lại None."""
+    if kind == "heading":
+        return body.strip()
+    if kind != "markdown":
+        return None
+    text = body.strip()
+    if text.startswith("#"):
+        return text.lstrip("#").strip()
+    m = _HEADING_HTML.match(text)
+    return html.unescape(m.group(2)).strip() if m else None
+
+
+@dataclass
+class _Recorder:
+    profile_enabled: bool = True
+    active: bool = False
+    started: float = 0.0
+    finished: float = 0.0
+    events: list = field(default_factory=list)   # (perf_counter, delta_type, body)
+    profile: cProfile.Profile | None = None
+    thread: int | None = None
+
+    def reset(self) -> None:
+        self.active, self.events, self.profile = False, [], None
+        self.started = self.finished = 0.0
+
+    def begin(self) -> None:
+        self.reset()
+        self.active, self.thread = True, threading.get_ident()
+        if self.profile_enabled:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.started = time.perf_counter()
+
+    def end(self) -> None:
+        self.finished = time.perf_counter()
+        if self.profile is not None:
+            self.profile.disable()
+        self.active = False
+
+    def record(self, kind: str, proto) -> None:
+        if self.active and threading.get_ident() == self.thread:
+            body = getattr(proto, "body", "") if kind in ("markdown", "heading") else ""
+            self.events.append((time.perf_counter(), kind, body))
+
+
+_rec = _Recorder()
+
+
+def _install_hooks() -> None:
+    """Bọc DeltaGenerator._enqueue (mọi element) và mọi ``render_*_page`` trong pages/."""
+    from streamlit.delta_generator import DeltaGenerator
+
+    enqueue = DeltaGenerator._enqueue
+
+    @functools.wraps(enqueue)
+    def _enqueue(self, delta_type, element_proto, *args, **kwargs):
+        _rec.record(delta_type, element_proto)
+        return enqueue(self, delta_type, element_proto, *args, **kwargs)
+
+    DeltaGenerator._enqueue = _enqueue
+
+    import pages
+    for info in pkgutil.iter_modules(pages.__path__):
+        module = importlib.import_module(f"pages.{info.name}")
+        for name in dir(module):
+            fn = getattr(module, name)
+            if name.startswith("render_") and name.endswith("_page") and callable(fn) \
+                    and getattr(fn, "__module__", None) == module.__name__:
+                setattr(module, name, _wrap_page(fn))
+
+
+def _wrap_page(fn):
+    @functools.wraps(fn)
+    def page(*args, **kwargs):
+        if _rec.active:                         # trang lồng trang (vd. render_product_page)
+            return fn(*args, **kwargs)
+        _rec.begin()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _rec.end()
+    return page
+
+
+# ── Đo ───────────────────────────────────────────────────────────────────────
+def _sections() -> list[dict]:
+    sections = [{"name": "(trước tiêu đề đầu tiên)", "seconds": 0.0, "elements": 0, "markdown_bytes": 0}]
+    prev = _rec.started
+    for t, kind, body in _rec.events:
+        gap, prev = t - prev, t
+        title = _heading(kind, body)
+        sections[-1]["seconds"] += gap          # việc trước một tiêu đề thuộc section trước nó
+        if title is not None:
+            sections.append({"name": title, "seconds": 0.0, "elements": 0, "markdown_bytes": 0})
+        sections[-1]["elements"] += 1
+        sections[-1]["markdown_bytes"] += len(body.encode())
+    sections[-1]["seconds"] += _rec.finished - prev
+    return [s for s in sections if s["elements"] or s["seconds"] > 0.0005]
+
+
+def _hot_spots(top: int) -> tuple[list[dict], list[dict]]:
+    """(hàm tốn nhất theo tottime, hàm của repo tốn nhất theo cumtime)."""
+    if _rec.profile is None:
+        return [], []
+    stats = pstats.Stats(_rec.profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, func), (_, nc, tt, ct, _) in stats.stats.items():
+        own = filename.startswith(str(_ROOT)) and "/benchmarks/" not in filename
+        rows.append({
+            "function": f"{os.path.relpath(filename, _ROOT) if own else filename}:{line}({func})",
+            "calls": nc, "tottime": tt, "cumtime": ct, "own": own,
+        })
+    by_self = sorted(rows, key=lambda r: r["tottime"], reverse=True)[:top]
+    by_cum = sorted((r for r in rows if r["own"]), key=lambda r: r["cumtime"], reverse=True)[:top]
+    return by_self, by_cum
+
+
+def profile_scenario(sc: Scenario, top: int, cold: bool, timeout: float) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(_ROOT / "app.py"), default_timeout=timeout)
+    at.secrets["APP_PASSWORD"] = "profile"
+    at.session_state["authenticated"] = True
+    at.session_state["page"] = sc.page
+
+    if not cold or sc.apply is not None:
+        at.run()                                # làm nóng dữ liệu / dựng widget để đổi giá trị
+    if sc.apply is not None:
+        sc.apply(at)
+    t0 = time.perf_counter()
+    at.run()
+    wall = time.perf_counter() - t0
+
+    errors = [str(e.value)[:300] for e in at.exception] + [str(e.value)[:300] for e in at.error]
+    markdown_bytes = sum(len(m.value.encode()) for m in at.markdown)
+    hot, own = _hot_spots(top)
+    return {
+        "page":           sc.page,
+        "scenario":       sc.label,
+        "run_seconds":    wall,
+        "page_seconds":   _rec.finished - _rec.started,
+        "charts":         len(at.get("vega_lite_chart")),
+        "markdown_count": len(at.markdown),
+        "markdown_bytes": markdown_bytes,
+        "sections":       _sections(),
+        "hot_spots":      hot,
+        "own_functions":  own,
+        "errors":         errors,
+    }
+
+
+def _print(res: dict) -> None:
+    print(f"\n== {res['page']} · {res['scenario']}: rerun {res['run_seconds'] * 1000:.0f} ms "
+          f"(trang {res['page_seconds'] * 1000:.0f} ms) · {res['charts']} biểu đồ · "
+          f"{res['markdown_count']} markdown / {res['markdown_bytes'] / 1024:.1f} KB")
+    for e in res["errors"]:
+        print(f"   LỖI: {e}")
+    for s in sorted(res["sections"], key=lambda s: s["seconds"], reverse=True):
+        print(f"   {s['seconds'] * 1000:8.1f} ms  {s['elements']:3d} el  {s['markdown_bytes'] / 1024:6.1f} KB  {s['name'][:70]}")
+    for title, rows in (("hàm tốn nhất (tottime)", res["hot_spots"]), ("hàm của repo (cumtime)", res["own_functions"])):
+        if rows:
+            print(f"   {'tottime':>8s} {'cumtime':>8s} {'calls':>7s}  {title}")
+            for h in rows:
+                print(f"   {h['tottime'] * 1000:8.1f} {h['cumtime'] * 1000:8.1f} {h['calls']:7d}  {h['function']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", type=Path, help="file DuckDB cho loader (mặc định: dữ liệu giả, xem --scale)")
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--pages", nargs="+", help="chỉ các trang này (theo tên trong menu)")
+    parser.add_argument("--top", type=int, default=15, help="số hàm cProfile in ra mỗi kịch bản (0 = tắt)")
+    parser.add_argument("--cold", action="store_true", help="đo cả lần tải dữ liệu đầu tiên")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", type=Path, help="ghi toàn bộ kết quả ra file JSON")
+    args = parser.parse_args()
+
+    db = args.db
+    if db is None:
+        from benchmarks.run import DEFAULT_DATA_DIR
+        from benchmarks.synthetic_data import generate
+        db = DEFAULT_DATA_DIR / f"ipay_x{args.scale:g}_s0.duckdb"
+        if not db.exists():
+            generate(db, args.scale)
+    os.environ.update(IPAY_USE_MIRROR="1", IPAY_OFFLINE="1", IPAY_MIRROR_PATH=str(db), IPAY_WARMUP="0")
+    sys.path.insert(0, str(_ROOT))
+
+    _rec.profile_enabled = args.top > 0
+    _install_hooks()
+    scenarios = [s for s in SCENARIOS if not args.pages or s.page in args.pages]
+    results = []
+    for sc in scenarios:
+        res = profile_scenario(sc, args.top, args.cold, args.timeout)
+        _print(res)
+        results.append(res)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
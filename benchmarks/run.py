@@ -0,0 +1,316 @@
+"""
+benchmarks/run.py
+-----------------
+Đo thời gian + bộ nhớ của đường chuẩn bị dữ liệu từng trang trên dữ liệu giả
+(benchmarks.synthetic_data) ở nhiều quy mô, rồi so với baseline đã lưu.
+
+Mỗi quy mô chạy trong một process riêng (mirror/kho cache là singleton của
+process, và peak RSS phải đo tách bạch). Với mỗi case:
+
+  - cold_s  : thời gian tốt nhất (qua ``--repeat`` lần) khi kho cache rỗng
+              (gồm query DuckDB + chuẩn bị)
+  - warm_s  : thời gian tốt nhất khi gọi lại ngay sau đó (đường cache hit)
+  - peak_mb : đỉnh bộ nhớ Python (tracemalloc) của một lần cold — không tính
+              bộ nhớ riêng của DuckDB/Arrow
+
+Phần "startup" (không phụ thuộc quy mô, mỗi lần đo một process mới): thời
+gian import từng module trang / loader sau khi đã có streamlit, và lượt chạy
+đầu của app.py tới form đăng nhập (AppTest).
+
+  python -m benchmarks.run                          # scale 1, so với baseline
+  python -m benchmarks.run --scales 1 10 100
+  python -m benchmarks.run --scales 1 10 --save-baseline
+  python -m benchmarks.run --skip-startup
+
+Thoát với mã 1 nếu có case chậm hơn / tốn bộ nhớ hơn baseline quá ``--tolerance``.
+"""
+
+import argparse
+import gc
+import json
+import os
+import pkgutil
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.synthetic_data import generate
+
+_HERE = Path(__file__).parent
+DEFAULT_BASELINE = _HERE / "baseline.json"
+DEFAULT_DATA_DIR = _HERE / ".data"
+
+# Chênh lệch tuyệt đối dưới ngưỡng này không tính là regression (nhiễu đo)
+_MIN_DELTA = {"cold_s": 0.025, "warm_s": 0.010, "peak_mb": 2.0}
+
+
+# ── Cases ────────────────────────────────────────────────────────────────────
+def _cases() -> dict:
+    """Tên case → hàm không tham số, tái hiện phần dữ liệu của từng trang."""
+    from cohort_matrix import load_cohort_matrix
+    from daily_metrics import doi_soat_by_day, month_metrics, render_daily_table
+    from data_loader import (
+        fetch_complaint_page, load_all_payment_tracking, load_complaint_daily, load_ipay_data,
+        load_payment_retention_by_ky_thu, load_portfolio_health, load_thu_phi_by_day, search_complaints,
+    )
+    from metric_cube import ALL, OTHER, load_metric_cube, scorecard
+    from pages.payment_retention import _PRODUCTS, _scorecard_metrics
+    from product_metrics import PRODUCTS, load_product_metrics, product_kpis
+
+    def overview_kpis():
+        cube = load_metric_cube()
+        years = cube.years(ALL)
+        for key in (ALL, OTHER):
+            scorecard(cube, key, ())
+            scorecard(cube, key, tuple(years[-1:]))
+
+    def product_daily_tables():
+        thu_phi = load_thu_phi_by_day()
+        for key, spec in PRODUCTS.items():
+            metrics = load_product_metrics(key)
+            product_kpis(key, ())
+            if metrics.daily.empty:
+                continue
+            last = metrics.daily.index.max()
+            m = month_metrics(metrics.totals[spec.code], last.year, last.month, fee=spec.fee)
+            if m is None:
+                continue
+            d = m["Ngày phát sinh"]
+            m["tien_dk"] = metrics.forecast(spec, d)
+            m["doi_soat"] = doi_soat_by_day(thu_phi, spec.san_pham, d, fee=spec.fee)
+            render_daily_table(m, show_so_don=spec.fee is not None)
+
+    def retention_heatmaps():
+        df_ky, df_month, _ = load_all_payment_tracking()
+        df_health, df_retention = load_portfolio_health(), load_payment_retention_by_ky_thu()
+        _scorecard_metrics(df_ky, df_month, df_health, df_retention, _PRODUCTS)
+        matrix = load_cohort_matrix()
+        for product in matrix.available(_PRODUCTS):
+            matrix.table(product)
+
+    def complaint_pages():
+        daily = load_complaint_daily()
+        start, end = daily["Ngày"].min().date(), daily["Ngày"].max().date()
+        first = fetch_complaint_page(start, end)
+        last = first.iloc[-1]
+        fetch_complaint_page(start, end, cursor=(last["received_date_time"].to_pydatetime(), last["id"], int(last["pos"])))
+
+    def complaint_search():
+        daily = load_complaint_daily()
+        search_complaints("hoàn tiền trừ tiền", daily["Ngày"].min().date(), daily["Ngày"].max().date())
+
+    return {
+        "overview.ipay_data":        load_ipay_data,
+        "overview.kpis":             overview_kpis,
+        "product.daily_tables":      product_daily_tables,
+        "retention.heatmaps":        retention_heatmaps,
+        "complaints.daily":          load_complaint_daily,
+        "complaints.detail_pages":   complaint_pages,
+        "complaints.search":         complaint_search,
+    }
+
+
+def _measure(fn, repeat: int) -> dict:
+    from cache_registry import reset
+
+    cold, warm = [], []
+    for _ in range(repeat):
+        reset()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        cold.append(time.perf_counter() - t0)
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        warm.append(time.perf_counter() - t0)
+
+    reset()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "cold_s":  round(min(cold), 5),
+        "warm_s":  round(min(warm), 5),
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def _worker(repeat: int) -> None:
+    """Chạy trong process con (env đã trỏ vào file dữ liệu); in kết quả JSON ra stdout."""
+    results = {name: _measure(fn, repeat) for name, fn in _cases().items()}
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"cases": results, "max_rss_mb": round(rss_kb / 1024, 1)}))
+
+
+# ── Startup ──────────────────────────────────────────────────────────────────
+_IMPORT_SNIPPET = """
+import importlib, sys, time
+import streamlit
+t0 = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(time.perf_counter() - t0)
+"""
+
+_LOGIN_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+t0 = time.perf_counter()
+at.run()
+assert not at.exception, at.exception
+print(time.perf_counter() - t0)
+"""
+
+
+def _startup_modules() -> list[str]:
+    from cache_registry import LOADER_MODULES
+
+    pages = sorted(f"pages.{m.name}" for m in pkgutil.iter_modules([str(_HERE.parent / "pages")]))
+    return ["cache_registry", "instrumentation", *LOADER_MODULES, *pages]
+
+
+def _best_of(snippet: str, args: list[str], repeat: int, env: dict) -> float:
+    """Thời gian tốt nhất (giây, do snippet tự in ra) qua ``repeat`` process mới."""
+    best = float("inf")
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", snippet, *args],
+            cwd=_HERE.parent, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"startup {args or 'login'} lỗi:\n{proc.stderr}")
+        best = min(best, float(proc.stdout.strip().splitlines()[-1]))
+    return best
+
+
+def run_startup(data_dir: Path, repeat: int) -> dict:
+    """Import từng module (process mới, streamlit đã nạp) + lượt chạy đầu tới form đăng nhập."""
+    path = data_dir / f"ipay_{_scale_key(1)}_s0.duckdb"
+    if not path.exists():
+        generate(path, 1, 0)
+    env = {**os.environ, "IPAY_USE_MIRROR": "1", "IPAY_OFFLINE": "1", "IPAY_MIRROR_PATH": str(path)}
+    cases = {
+        f"import.{module}": {"cold_s": round(_best_of(_IMPORT_SNIPPET, [module], repeat, env), 5)}
+        for module in _startup_modules()
+    }
+    cases["login.first_run"] = {"cold_s": round(_best_of(_LOGIN_SNIPPET, [], repeat, env), 5)}
+    return {"cases": cases}
+
+
+# ── Driver ───────────────────────────────────────────────────────────────────
+def _scale_key(scale: float) -> str:
+    return f"x{scale:g}"
+
+
+def run_scale(scale: float, data_dir: Path, repeat: int, seed: int = 0) -> dict:
+    path = data_dir / f"ipay_{_scale_key(scale)}_s{seed}.duckdb"
+    if not path.exists():
+        print(f"[{_scale_key(scale)}] sinh dữ liệu → {path}", file=sys.stderr)
+        generate(path, scale, seed)
+    env = {
+        **os.environ,
+        "IPAY_USE_MIRROR":  "1",
+        "IPAY_OFFLINE":     "1",
+        "IPAY_MIRROR_PATH": str(path),
+    }
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--worker", "--repeat", str(repeat)],
+        cwd=_HERE.parent, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark x{scale:g} lỗi:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Các dòng mô tả regression của ``current`` ({nhóm: {"cases": ...}}, nhóm là
+    quy mô hoặc "startup") so với phần tương ứng của ``baseline``.
+    """
+    problems = []
+    for scale, res in current.items():
+        base_cases = baseline.get(scale, {}).get("cases", {})
+        for case, metrics in res["cases"].items():
+            base = base_cases.get(case)
+            if base is None:
+                continue
+            for metric, value in metrics.items():
+                ref = base.get(metric)
+                if ref is None:
+                    continue
+                if value > ref * tolerance and value - ref > _MIN_DELTA[metric]:
+                    problems.append(f"{scale} {case} {metric}: {value:.4g} > {ref:.4g} × {tolerance:g}")
+    return problems
+
+
+def _print_table(scale: str, res: dict) -> None:
+    rss = f"  (max RSS {res['max_rss_mb']:.0f} MB)" if "max_rss_mb" in res else ""
+    print(f"\n== {scale}{rss}")
+    print(f"{'case':36s} {'cold (ms)':>10s} {'warm (ms)':>10s} {'peak (MB)':>10s}")
+    for case, m in res["cases"].items():
+        cells = [f"{m[k] * 1000:10.1f}" if k in m else f"{'':10s}" for k in ("cold_s", "warm_s")]
+        cells.append(f"{m['peak_mb']:10.1f}" if "peak_mb" in m else "")
+        print(f"{case:36s} {' '.join(cells)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="ghi kết quả lần này làm baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="hệ số cho phép so với baseline")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--skip-startup", action="store_true", help="bỏ qua đo import / lượt chạy đầu")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.repeat)
+        return 0
+
+    current = {}
+    for scale in args.scales:
+        current[_scale_key(scale)] = res = run_scale(scale, args.data_dir, args.repeat)
+        _print_table(_scale_key(scale), res)
+    startup = None
+    if not args.skip_startup:
+        startup = run_startup(args.data_dir, args.repeat)
+        _print_table("startup", startup)
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline["machine"] = f"{platform.machine()} · {os.cpu_count()} CPU · py{platform.python_version()}"
+        baseline.setdefault("scales", {}).update(current)
+        if startup is not None:
+            baseline["startup"] = startup
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n")
+        print(f"\nĐã lưu baseline: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nChưa có baseline ({args.baseline}) — chạy với --save-baseline để tạo.")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    problems = compare(current, baseline.get("scales", {}), args.tolerance)
+    if startup is not None and "startup" in baseline:
+        problems += compare({"startup": startup}, baseline, args.tolerance)
+    if problems:
+        print("\nREGRESSION:")
+        for line in problems:
+            print("  " + line)
+        return 1
+    print("\nKhông có regression so với baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
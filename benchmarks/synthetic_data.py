@@ -0,0 +1,189 @@
+"""
+benchmarks/synthetic_data.py
+----------------------------
+Sinh dữ liệu iPay giả (cùng schema với các bảng trên MotherDuck) vào một file
+DuckDB để chạy loader/trang ở chế độ offline (IPAY_OFFLINE=1 +
+IPAY_MIRROR_PATH=file) — dùng cho benchmark.
+
+``scale`` nhân số dòng của mọi bảng: một nửa (theo lũy thừa) qua số năm, nửa
+còn lại qua số sản phẩm. Ví dụ scale=100 → 10× số năm và 10× số sản phẩm.
+Sản phẩm thêm vào có mã/tên giả (``SYN_###`` / ``SP ###``) nên các trang vẫn
+chỉ hiển thị sản phẩm thật nhưng phải lọc qua dữ liệu lớn hơn.
+
+Cùng (scale, seed) luôn sinh ra cùng dữ liệu.
+
+  python -m benchmarks.synthetic_data out.duckdb --scale 10
+"""
+
+import argparse
+import math
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+END_DATE   = pd.Timestamp("2026-06-30")   # cố định để kết quả lặp lại được
+BASE_YEARS = 3
+
+GOLD_CODES = ["MIX_01", "ISAFE_CYBER", "TAPCARE", "VTB_HOMESAVING", "VTB_HS_15", "VTB_HS_25",
+              "CN.6", "XE", "CN.4.1IPAY"]
+SAN_PHAM   = ["Cyber Risk", "HomeSaving", "I-Safe", "TapCare"]
+
+# Tên sản phẩm thô trong bronze.payment_data (trước khi chuẩn hóa)
+_RAW_PAYMENT_PRODUCTS = ["Cyber Risk", "cyberisk", "Cyber Individual - iPay", "I-Safe", "iSafe",
+                         "HomeSaving", "homesaving", "TapCare", "TAPCARE", "phonecare"]
+_COMPLAINT_PRODUCTS   = ["Tapcare", "i-Safe", "Cyber Risk", "HomeSaving", "Sản phẩm khác"]
+_COMPLAINT_TYPES      = ["Hoàn phí", "Trừ tiền", "Hủy hợp đồng", "Bồi thường", "Không nhận được GCN"]
+_SENDERS              = ["VietinBank", "VBI HO", "Chi nhánh", "Khách hàng"]
+_PRIORITIES           = ["Cao", "Trung bình", "Thấp"]
+
+_BASE_PAYMENT_ROWS   = 20_000
+_BASE_COMPLAINT_ROWS = 3_000
+
+
+def scale_factors(scale: float) -> tuple[int, float]:
+    """(hệ số số năm, hệ số số sản phẩm) với tích xấp xỉ ``scale``."""
+    years = max(1, round(math.sqrt(scale)))
+    return years, scale / years
+
+
+def _names(base: list[str], factor: float, fmt: str) -> list[str]:
+    n = max(len(base), round(len(base) * factor))
+    return base + [fmt.format(i) for i in range(1, n - len(base) + 1)]
+
+
+def _split_join(rng, choices: list[str], n: int) -> np.ndarray:
+    """n chuỗi "a" hoặc "a;b" (~30%) lấy từ ``choices``, như cột đa giá trị của email."""
+    first = rng.choice(choices, n)
+    second = rng.choice(choices, n)
+    two = rng.random(n) < 0.3
+    return np.where(two, np.char.add(np.char.add(first, ";"), second), first)
+
+
+def _gold(rng, codes: list[str], dates: pd.DatetimeIndex) -> pd.DataFrame:
+    n = len(codes) * len(dates)
+    d = np.tile(dates.values, len(codes))
+    return pd.DataFrame({
+        "PROD_CODE":              np.repeat(codes, len(dates)),
+        "Năm":                    pd.DatetimeIndex(d).year,
+        "Ngày phát sinh":         d,
+        "Tiền thực thu":          rng.integers(1_000_000, 50_000_000, n).astype(float),
+        "Số đơn cấp mới":         rng.integers(0, 500, n),
+        "Số đơn cấp tái tục":     rng.integers(0, 400, n),
+        "Số đơn tái tục dự kiến": rng.integers(0, 450, n),
+        "Số đơn có hiệu lực":     rng.integers(10_000, 100_000, n),
+        "Số đơn tạm ngưng":       rng.integers(0, 10_000, n),
+        "Số đơn hủy webview":     rng.integers(0, 50, n),
+    })
+
+
+def _grid(**axes) -> pd.DataFrame:
+    """Tích Descartes của các trục (giữ thứ tự khai báo)."""
+    index = pd.MultiIndex.from_product(list(axes.values()), names=list(axes))
+    return index.to_frame(index=False)
+
+
+def generate(path: str | Path, scale: float = 1, seed: int = 0) -> dict[str, int]:
+    """Ghi (đè) file DuckDB ``path``; trả về số dòng theo bảng."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    rng = np.random.default_rng(seed)
+    years_f, products_f = scale_factors(scale)
+
+    start = (END_DATE - pd.DateOffset(years=BASE_YEARS * years_f)).normalize() + pd.Timedelta(days=1)
+    dates = pd.date_range(start, END_DATE, freq="D")
+    months = pd.date_range(start, END_DATE, freq="MS")
+    codes = _names(GOLD_CODES, products_f, "SYN_{:03d}")
+    san_pham = _names(SAN_PHAM, products_f, "SP {:03d}")
+
+    tables: dict[str, pd.DataFrame] = {}
+    tables["gold.ipay_quantity_rev_data"] = _gold(rng, codes, dates)
+
+    ky = _grid(san_pham=san_pham, cohort_month=months, ky=np.arange(2, 13),
+               trang_thai=["da_thu", "chua_thu_qua_han", "chua_den_han"])
+    ky["so_gcn"] = rng.integers(0, 1000, len(ky))
+    tables["silver.payment_tracking_by_ky"] = ky
+
+    pm = _grid(san_pham=san_pham, thang_tra_ky_k=months, ky=np.arange(2, 13))
+    pm["da_tra_ky_tiep"] = rng.integers(0, 1000, len(pm))
+    pm["chua_tra_ky_tiep"] = rng.integers(0, 300, len(pm))
+    pm["so_gcn"] = pm["da_tra_ky_tiep"] + pm["chua_tra_ky_tiep"]
+    pm["ty_le_giu_chan_pct"] = (pm["da_tra_ky_tiep"] / pm["so_gcn"].clip(lower=1) * 100).round(2)
+    tables["silver.payment_tracking_by_payment_month"] = pm[
+        ["san_pham", "thang_tra_ky_k", "ky", "so_gcn", "da_tra_ky_tiep", "chua_tra_ky_tiep", "ty_le_giu_chan_pct"]
+    ]
+
+    pd_days = dates[-min(len(dates), 660 * years_f):]
+    pdd = _grid(san_pham=san_pham, ngay_tra_ky_k=pd_days, ky=np.arange(2, 6))
+    pdd["da_tra_ky_tiep"] = rng.integers(0, 100, len(pdd))
+    pdd["chua_tra_ky_tiep"] = rng.integers(0, 30, len(pdd))
+    pdd["so_gcn"] = pdd["da_tra_ky_tiep"] + pdd["chua_tra_ky_tiep"]
+    pdd["ty_le_giu_chan_pct"] = (pdd["da_tra_ky_tiep"] / pdd["so_gcn"].clip(lower=1) * 100).round(2)
+    pdd["is_mature"] = pdd["ngay_tra_ky_k"] <= END_DATE - pd.Timedelta(days=30)
+    tables["silver.payment_tracking_by_payment_date"] = pdd[
+        ["san_pham", "ngay_tra_ky_k", "ky", "so_gcn", "da_tra_ky_tiep", "chua_tra_ky_tiep",
+         "ty_le_giu_chan_pct", "is_mature"]
+    ]
+
+    rt = _grid(san_pham=san_pham, ky=np.arange(2, 13))
+    rt["so_gcn"] = rng.integers(100, 5000, len(rt))
+    rt["da_tra_k1"] = (rt["so_gcn"] * rng.uniform(0.5, 0.95, len(rt))).astype(int)
+    rt["chua_tra_k1"] = rt["so_gcn"] - rt["da_tra_k1"]
+    rt["retention_pct"] = (rt["da_tra_k1"] / rt["so_gcn"] * 100).round(2)
+    tables["silver.payment_retention_by_ky_thu"] = rt
+
+    pb = _grid(san_pham=san_pham, ngay_thu_phi=dates)
+    pb["so_giao_dich"] = rng.integers(0, 1000, len(pb))
+    pb["tong_phi"] = rng.integers(1_000_000, 10_000_000, len(pb)).astype(float)
+    tables["silver.payment_by_day"] = pb
+
+    n = int(_BASE_PAYMENT_ROWS * scale)
+    tables["bronze.payment_data"] = pd.DataFrame({
+        "Sản phẩm":        rng.choice(_RAW_PAYMENT_PRODUCTS, n),
+        "Số hợp đồng VBI": rng.integers(0, max(5000, n // 4), n).astype(str),
+        "Ngày thu phí":    rng.choice(dates.values, n),
+    })
+
+    n = int(_BASE_COMPLAINT_ROWS * scale)
+    received = END_DATE + pd.Timedelta(hours=23) - pd.to_timedelta(
+        rng.integers(0, 500 * years_f * 24 * 3600, n), unit="s",
+    )
+    tables["silver.classified_complaints"] = pd.DataFrame({
+        "id":                 [f"msg{i:08d}" for i in range(n)],
+        "received_date_time": received,
+        "products":           _split_join(rng, _COMPLAINT_PRODUCTS, n),
+        "complaint_types":    _split_join(rng, _COMPLAINT_TYPES, n),
+        "priority":           rng.choice(_PRIORITIES, n),
+        "sender":             rng.choice(_SENDERS, n),
+        "subject":            [f"Khiếu nại hoàn phí đơn bảo hiểm số {i}" for i in range(n)],
+        "customer_request":   rng.choice(["Yêu cầu hoàn tiền", "Yêu cầu hủy hợp đồng", "Cấp lại GCN"], n),
+        "cause":              rng.choice(["Trừ tiền hai lần", "Khách hàng không đăng ký", "Lỗi hệ thống"], n),
+    })
+
+    con = duckdb.connect(str(path))
+    try:
+        for schema in ("gold", "silver", "bronze"):
+            con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        for name, df in tables.items():
+            con.register("_df", df)
+            con.execute(f"CREATE TABLE {name} AS SELECT * FROM _df")
+            con.unregister("_df")
+    finally:
+        con.close()
+    return {name: len(df) for name, df in tables.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, rows in generate(args.path, args.scale, args.seed).items():
+        print(f"{name:45s} {rows:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,599 @@
+"""
+cache_registry.py
+-----------------
+Kho kết quả dùng chung giữa các session, thay cho ``st.cache_data`` trên các
+loader.
+
+Mỗi loader được khai báo là một dataset có tên (``@dataset``) kèm các bảng
+nguồn và các dataset mà nó dựng trên đó. Phiên bản của một dataset là "dấu"
+của các bảng nguồn (số dòng, max watermark, fingerprint nội dung) — tính
+trong DuckDB, chỉ trả về một dòng mỗi bảng. Fingerprint (băm mọi dòng) chỉ
+tính lại mỗi lần kiểm tra với bảng không có watermark; bảng có watermark
+dùng số dòng + max watermark, fingerprint tính lại theo nhịp copy toàn bộ của
+mirror (``FULL_RESYNC_SECONDS``). Kết quả được lưu theo (tham số, phiên bản):
+
+  - hết ``ttl`` → vẫn trả ngay kết quả cũ, kiểm tra lại dấu nguồn ở nền;
+    nguồn không đổi thì giữ nguyên kết quả, không tải lại;
+  - ``refresh()`` (nút "⟳ Làm mới") → đọc dấu mới ngay và chỉ tải lại các
+    dataset có nguồn thay đổi (cùng các dataset phụ thuộc vào chúng);
+  - dataset có hàm ``incremental`` được cập nhật từ kết quả cũ thay vì tải
+    lại toàn bộ;
+  - single-flight: các lượt gọi đồng thời (nhiều session) cho cùng dataset và
+    tham số chờ chung một lần tải; các lần bấm làm mới gần nhau được gộp.
+
+Giống st.cache_data, kết quả được giữ ở dạng pickle và mỗi lần đọc trả về một
+bản sao, nên trang có thể sửa frame nhận được mà không ảnh hưởng cache.
+"""
+
+import functools
+import importlib
+import inspect
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import pandas as pd
+
+import instrumentation
+from local_mirror import FULL_RESYNC_SECONDS, MIRROR_TABLES, get_mirror, mirror_enabled
+from motherduck import get_pool
+
+logger = logging.getLogger(__name__)
+
+_STAMP_TTL      = 30    # giây — dấu nguồn được dùng lại trong khoảng này
+_WARM_INTERVAL  = 20    # giây giữa hai vòng quét của luồng làm nóng
+_REFRESH_MARGIN = 0.2   # luồng nền làm mới khi kết quả còn < 20% ttl
+_REFRESH_WINDOW = 10    # giây — lần bấm làm mới trong khoảng này sau lần trước dùng lại kết quả của nó
+
+# Thread nền cho stale-while-revalidate
+_background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ipay-swr")
+
+# Dấu của một bảng: (số dòng, max watermark, fingerprint nội dung — xem ``_fingerprint_due``)
+Stamp = tuple[int, str | None, int | None]
+
+# Loader đang chạy trong ``_revalidate`` của thread này (since = monotonic lúc
+# đọc dấu): dataset nó gọi tới phải khớp nguồn hiện tại, không nhận bản cũ
+# của ttl / stale-while-revalidate — nếu không kết quả cũ bị lưu dưới phiên bản mới
+_loading = threading.local()
+
+
+# ── Dấu phiên bản nguồn ──────────────────────────────────────────────────────
+_stamps: dict[str, tuple[float, Stamp]] = {}
+_fingerprints: dict[str, tuple[float, int | None]] = {}   # bảng có watermark: (monotonic lúc tính, fp)
+_stamps_lock = threading.Lock()
+
+
+def _watermark(name: str) -> str | None:
+    spec = MIRROR_TABLES.get(name)
+    return spec.watermark_expr if spec is not None and spec.watermark else None
+
+
+def _stamp_sql(name: str, fingerprint: bool) -> str:
+    wm = _watermark(name)
+    wm = f"MAX({wm})::VARCHAR" if wm else "NULL"
+    fp = "bit_xor(hash(t))" if fingerprint else "NULL::UBIGINT"
+    return f"SELECT '{name}' AS name, COUNT(*) AS n, {wm} AS wm, {fp} AS fp FROM {name} t"
+
+
+def _fingerprint_due(name: str, now: float) -> bool:
+    """
+    Có phải băm lại mọi dòng của ``name`` không: luôn với bảng không có
+    watermark; bảng có watermark thì chỉ khi chưa có, quá chu kỳ copy toàn bộ,
+    hoặc mirror vừa copy lại toàn bộ bảng (bắt thay đổi ngoài đoạn lookback).
+    """
+    if _watermark(name) is None:
+        return True
+    at = _fingerprints.get(name, (None, None))[0]
+    if at is None or now - at > FULL_RESYNC_SECONDS:
+        return True
+    full_at = get_mirror().full_synced_at(name) if mirror_enabled() else None
+    return full_at is not None and full_at > at
+
+
+def source_stamps(tables, max_age: float = _STAMP_TTL) -> dict[str, Stamp]:
+    """
+    Dấu hiện tại của các bảng nguồn, đọc lại nếu cũ hơn ``max_age`` giây.
+    Khi dùng mirror, bảng được sync trước rồi lấy dấu trên file cục bộ.
+    """
+    now = time.monotonic()
+    with _stamps_lock:
+        fresh = {t: s for t, (at, s) in _stamps.items() if t in tables and now - at < max_age}
+    missing = sorted(set(tables) - set(fresh))
+    if missing:
+        if mirror_enabled():
+            get_mirror().ensure_fresh(missing)
+        hashed_at = time.monotonic()        # sau sync: fp băm trên dữ liệu tính đến lúc này
+        with _stamps_lock:
+            hashed = {t for t in missing if _fingerprint_due(t, hashed_at)}
+        sql = "\nUNION ALL\n".join(_stamp_sql(t, t in hashed) for t in missing)
+        df = get_mirror().query_df(sql) if mirror_enabled() else get_pool().query_df(sql)
+        read = {}
+        with _stamps_lock:
+            for r in df.itertuples(index=False):
+                fp = None if pd.isna(r.fp) else int(r.fp)
+                if _watermark(r.name) is not None:
+                    if r.name in hashed:
+                        _fingerprints[r.name] = (hashed_at, fp)
+                    fp = _fingerprints.get(r.name, (None, None))[1]
+                read[r.name] = (int(r.n), None if pd.isna(r.wm) else str(r.wm), fp)
+                _stamps[r.name] = (now, read[r.name])
+        fresh.update(read)
+    return fresh
+
+
+# ── Dataset ──────────────────────────────────────────────────────────────────
+@dataclass
+class _Entry:
+    blob: bytes
+    version: tuple
+    checked_at: float            # monotonic — lần cuối xác nhận phiên bản còn đúng
+    confirmed_at: pd.Timestamp   # như checked_at nhưng theo giờ thực: "dữ liệu tính đến"
+    loaded_at: pd.Timestamp
+    call: tuple                  # (args, kwargs) để tải lại ở nền
+
+
+class Dataset:
+    """
+    Một loader đã đăng ký: gọi như hàm gốc, kết quả lấy từ kho dùng chung.
+
+    Stale-while-revalidate: khi kết quả quá ``ttl``, lượt gọi vẫn nhận ngay
+    kết quả cũ, còn việc kiểm tra dấu nguồn / tải lại chạy ở thread nền (mỗi
+    bộ tham số tối đa một việc) rồi thay kết quả mới vào kho. Chỉ lần đầu
+    (chưa có kết quả nào) mới phải chờ loader.
+
+    Single-flight: mỗi bộ tham số có tối đa một lần tải đang chạy; lượt gọi
+    đến sau (session khác, luồng nền, nút làm mới) chờ kết quả của nó thay vì
+    query lại MotherDuck.
+    """
+
+    def __init__(self, fn: Callable, name: str, sources: tuple[str, ...],
+                 depends: tuple[str, ...], ttl: float, warm, stamp: Callable | None = None):
+        functools.update_wrapper(self, fn)
+        self.fn = instrumentation.instrumented("loader", name, outcome="loads")(fn)
+        self.name, self.ttl = name, ttl
+        self.sources, self.depends = tuple(sources), tuple(depends)
+        self._stamp = stamp
+        self._sig = inspect.signature(fn)
+        if warm is None:
+            no_required = all(p.default is not p.empty for p in self._sig.parameters.values())
+            warm = [()] if no_required else []
+        self.warm = [tuple(args) for args in warm]
+        self._update: Callable | None = None
+        self._entries: dict[bytes, _Entry] = {}
+        self._flights: dict[bytes, tuple[float, Future]] = {}   # key → (monotonic lúc bắt đầu, kết quả)
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0, "stale": 0, "revalidated": 0, "loads": 0, "updates": 0, "joined": 0,
+            "load_seconds": 0.0, "errors": 0,
+        }
+
+    def all_sources(self) -> tuple[str, ...]:
+        """Bảng nguồn của dataset và mọi dataset nó phụ thuộc (bắc cầu)."""
+        out = set(self.sources)
+        for dep in self.depends:
+            out.update(DATASETS[dep].all_sources())
+        return tuple(sorted(out))
+
+    def version(self, max_age: float = _STAMP_TTL) -> tuple:
+        if self._stamp is not None:
+            return (self._stamp(),)
+        stamps = source_stamps(self.all_sources(), max_age)
+        return tuple(stamps[t] for t in self.all_sources())
+
+    def _key(self, args, kwargs) -> bytes:
+        bound = self._sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return pickle.dumps(tuple(bound.arguments.items()))
+
+    def _revalidate(self, key: bytes, args, kwargs) -> tuple[bytes, str]:
+        """
+        Kiểm tra dấu nguồn rồi lấy kết quả mới nhất: "revalidated" (nguồn
+        không đổi), "updates" (cập nhật tăng dần từ kết quả cũ) hoặc "loads"
+        (gọi loader). Kết quả mới thay vào kho trong một lần gán.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        now, wall = time.monotonic(), pd.Timestamp.now()
+        try:
+            version = self.version()
+        except Exception:
+            if entry is None:
+                version = None      # không đọc được dấu nguồn → vẫn tải, lần sau kiểm tra lại
+            else:
+                entry.checked_at = now
+                return entry.blob, "hits"
+        if entry is not None and entry.version == version:
+            entry.checked_at, entry.confirmed_at = now, wall
+            return entry.blob, "revalidated"
+
+        t0 = time.perf_counter()
+        value = None
+        outer, _loading.since = getattr(_loading, "since", None), now
+        try:
+            if entry is not None and self._update is not None:
+                try:
+                    value = self._update(pickle.loads(entry.blob), *args, **kwargs)
+                except Exception:
+                    logger.warning("%s: cập nhật tăng dần lỗi, tải lại toàn bộ", self.name, exc_info=True)
+            outcome = "updates" if value is not None else "loads"
+            if value is None:
+                value = self.fn(*args, **kwargs)
+        finally:
+            _loading.since = outer
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        seconds = time.perf_counter() - t0
+        with self._lock:
+            self._entries[key] = _Entry(blob, version, now, wall, wall, (args, kwargs))
+            self._stats[outcome] += 1
+            self._stats["load_seconds"] += seconds
+        return blob, outcome
+
+    # ── Single-flight ────────────────────────────────────────────────────────
+    def _claim(self, key: bytes, not_before: float) -> tuple[Future, bool]:
+        """
+        (future, True) nếu lượt gọi này dẫn lần tải cho ``key``; (future của
+        lần đang chạy, False) nếu chỉ cần chờ. Lần đang chạy bắt đầu trước
+        ``not_before`` (có thể dùng dấu nguồn cũ) thì chờ nó xong rồi tự dẫn.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    future = Future()
+                    self._flights[key] = (time.monotonic(), future)
+                    return future, True
+            started, future = flight
+            if started >= not_before:
+                return future, False
+            wait([future])
+
+    def _lead(self, key: bytes, future: Future, args, kwargs) -> tuple[bytes, str]:
+        try:
+            result = self._revalidate(key, args, kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _fetch(self, key: bytes, args, kwargs, not_before: float = float("-inf")) -> tuple[bytes, str]:
+        """``_revalidate`` qua single-flight: "joined" nếu dùng chung lần tải của lượt khác."""
+        future, leader = self._claim(key, not_before)
+        if leader:
+            return self._lead(key, future, args, kwargs)
+        return future.result()[0], "joined"
+
+    def _revalidate_in_background(self, key: bytes, args, kwargs) -> None:
+        future, leader = self._claim(key, float("-inf"))
+        if not leader:
+            return
+
+        def run():
+            try:
+                self._lead(key, future, args, kwargs)
+            except Exception:
+                self._count("errors")
+                logger.warning("%s: làm mới nền lỗi, tiếp tục phục vụ dữ liệu cũ", self.name, exc_info=True)
+
+        _background.submit(run)
+
+    def _get(self, args, kwargs, max_age: float, stale_ok: bool,
+             not_before: float = float("-inf")) -> tuple[bytes, str]:
+        """
+        Kết quả (pickle) cho một bộ tham số và cách có được nó: "hits" (đã
+        kiểm tra trong ``max_age`` giây), "stale" (quá hạn, trả kết quả cũ và
+        làm mới ở nền — chỉ khi ``stale_ok``) hoặc như ``_revalidate``.
+        """
+        key = self._key(args, kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.checked_at < max_age:
+            return entry.blob, "hits"
+        if entry is not None and stale_ok:
+            self._revalidate_in_background(key, args, kwargs)
+            return entry.blob, "stale"
+        return self._fetch(key, args, kwargs, not_before)
+
+    def __call__(self, *args, **kwargs) -> Any:
+        with instrumentation.span("cache", self.name) as s:
+            since = getattr(_loading, "since", None)
+            if since is None:
+                blob, outcome = self._get(args, kwargs, self.ttl, stale_ok=True)
+            else:
+                # Gọi từ loader của dataset phụ thuộc: kiểm tra lại đồng bộ
+                blob, outcome = self._get(args, kwargs, 0, stale_ok=False, not_before=since)
+            if outcome in instrumentation.CACHE_HITS:
+                self._count(outcome)
+            s.outcome, s.bytes = outcome, len(blob)
+            return pickle.loads(blob)
+
+    def _count(self, outcome: str) -> None:
+        # Gọi từ thread script, SWR và làm nóng cùng lúc
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def incremental(self, update: Callable) -> Callable:
+        """
+        Đăng ký hàm cập nhật tăng dần ``update(prev, *args, **kwargs)``: khi
+        nguồn đổi, dựng kết quả mới từ kết quả cũ thay vì gọi lại loader.
+        ``update`` trả về None (hoặc raise) → tải lại toàn bộ.
+        """
+        self._update = instrumentation.instrumented("loader", self.name, outcome="updates")(update)
+        return update
+
+    def prefetch(self, *args, **kwargs) -> str:
+        """Làm nóng trước (đồng bộ): kiểm tra lại/tải lại khi kết quả sắp tới hạn ttl."""
+        return self._get(args, kwargs, self.ttl * (1 - _REFRESH_MARGIN), stale_ok=False)[1]
+
+    def warm_calls(self) -> list[tuple]:
+        """Các bộ (args, kwargs) cần giữ nóng: khai báo ``warm`` + mọi bộ đang có trong kho."""
+        calls = {self._key(a, {}): (a, {}) for a in self.warm}
+        with self._lock:
+            calls.update({k: e.call for k, e in self._entries.items()})
+        return list(calls.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def expire_stale(self, version: tuple) -> bool:
+        """
+        Đánh dấu các kết quả khác ``version`` là hết hạn (lần đọc sau sẽ cập
+        nhật/tải lại — kết quả cũ được giữ để cập nhật tăng dần), phần còn lại
+        coi như vừa kiểm tra. True nếu có kết quả hết hạn.
+        """
+        now, wall = time.monotonic(), pd.Timestamp.now()
+        stale = False
+        with self._lock:
+            for e in self._entries.values():
+                if e.version != version:
+                    e.checked_at, stale = float("-inf"), True
+                else:
+                    e.checked_at, e.confirmed_at = now, wall
+        return stale
+
+    def reload_expired(self, not_before: float = float("-inf")) -> None:
+        """
+        Cập nhật/tải lại ngay (đồng bộ) các kết quả đã bị ``expire_stale``;
+        dùng chung lần tải đang chạy nếu nó bắt đầu từ ``not_before``.
+        """
+        with self._lock:
+            expired = [(k, e.call) for k, e in self._entries.items() if e.checked_at == float("-inf")]
+        for key, (args, kwargs) in expired:
+            self._fetch(key, args, kwargs, not_before)
+
+    def as_of(self) -> pd.Timestamp | None:
+        """Thời điểm gần nhất kết quả của dataset được xác nhận khớp nguồn."""
+        with self._lock:
+            return max((e.confirmed_at for e in self._entries.values()), default=None)
+
+    def refreshing(self) -> bool:
+        with self._lock:
+            return bool(self._flights)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+            counters = dict(self._stats)
+        return {
+            **counters,
+            "entries":   len(entries),
+            "bytes":     sum(len(e.blob) for e in entries),
+            "loaded_at": max((e.loaded_at for e in entries), default=None),
+            "as_of":     max((e.confirmed_at for e in entries), default=None),
+        }
+
+
+DATASETS: dict[str, Dataset] = {}
+
+
+def dataset(name: str, sources=(), depends=(), ttl: float = 300, warm=None, stamp: Callable | None = None):
+    """
+    Đăng ký loader vào kho dùng chung.
+
+    ``sources``: bảng nguồn đọc trực tiếp; ``depends``: tên các dataset mà
+    loader gọi tới (phiên bản của nó gồm cả nguồn của chúng); ``ttl``: số
+    giây trước khi kiểm tra lại dấu nguồn; ``warm``: các bộ tham số được làm
+    nóng khi khởi động (mặc định: gọi không tham số nếu loader cho phép);
+    ``stamp``: hàm trả về dấu phiên bản thay cho dấu bảng nguồn (vd. loader
+    giả khi kiểm thử).
+    """
+    def decorate(fn: Callable) -> Dataset:
+        ds = Dataset(fn, name, sources, depends, ttl, warm, stamp)
+        DATASETS[name] = ds
+        return ds
+    return decorate
+
+
+# ── Invalidation ─────────────────────────────────────────────────────────────
+def dependents(names) -> list[str]:
+    """``names`` cùng mọi dataset phụ thuộc (trực tiếp hoặc bắc cầu) vào chúng."""
+    out = list(names)
+    for n in out:
+        out += [d.name for d in DATASETS.values() if n in d.depends and d.name not in out]
+    return out
+
+
+def upstream(names) -> list[str]:
+    """Mọi dataset mà ``names`` dựng trên (bắc cầu), dataset gốc đứng trước, không gồm ``names``."""
+    out: list[str] = []
+
+    def visit(n: str) -> None:
+        for d in DATASETS[n].depends:
+            if d not in out:
+                visit(d)
+                out.append(d)
+
+    for n in names:
+        visit(n)
+    return [n for n in out if n not in names]
+
+
+def invalidate(names) -> None:
+    """Bỏ hẳn kết quả của ``names`` và các dataset phụ thuộc, không cần kiểm tra nguồn."""
+    for n in dependents(names):
+        DATASETS[n].clear()
+
+
+_refreshes: dict[tuple, tuple[Future, float | None]] = {}   # phạm vi → (kết quả, monotonic lúc xong)
+_refreshes_lock = threading.Lock()
+
+
+def refresh(names=None, full: bool = False) -> list[str]:
+    """
+    Đọc lại dấu nguồn ngay, rồi cập nhật/tải lại (đồng bộ — người dùng vừa
+    bấm làm mới nên chờ dữ liệu mới chứ không nhận bản cũ) các dataset có
+    nguồn thay đổi. ``names`` = None → mọi dataset; ``full`` → bỏ hẳn kết quả
+    để lần sau tải lại toàn bộ (không cập nhật tăng dần). Trả về tên các
+    dataset bị ảnh hưởng.
+
+    Các lần bấm cùng phạm vi được gộp: đang có một lần chạy → chờ nó; lần
+    trước xong chưa quá ``_REFRESH_WINDOW`` giây → dùng lại kết quả của nó.
+    """
+    # Gồm cả các dataset phía trên (đứng trước): dataset được làm mới không
+    # được dựng lại trên kết quả cũ của chúng
+    scope = upstream(names) + dependents(names) if names is not None else list(DATASETS)
+    key = (tuple(sorted(scope)), full)
+    with _refreshes_lock:
+        future, done_at = _refreshes.get(key, (None, None))
+        join = future is not None and (done_at is None or time.monotonic() - done_at < _REFRESH_WINDOW)
+        if not join:
+            future = Future()
+            _refreshes[key] = (future, None)
+    if join:
+        return list(future.result())
+    try:
+        changed = _refresh(scope, full)
+    except BaseException as e:
+        with _refreshes_lock:
+            _refreshes.pop(key, None)      # lỗi → lần bấm sau thử lại ngay
+        future.set_exception(e)
+        raise
+    with _refreshes_lock:
+        _refreshes[key] = (future, time.monotonic())
+    future.set_result(changed)
+    return list(changed)
+
+
+def _refresh(scope: list[str], full: bool) -> list[str]:
+    if full:
+        invalidate(scope)
+        return scope
+    tables = sorted({t for n in scope for t in DATASETS[n].all_sources()})
+    started = time.monotonic()
+    try:
+        source_stamps(tables, max_age=0)
+    except Exception:
+        invalidate(scope)           # không đọc được dấu nguồn → bỏ hết như clear() cũ
+        return scope
+    changed = [n for n in scope if DATASETS[n].expire_stale(DATASETS[n].version())]
+    for n in changed:
+        DATASETS[n].reload_expired(not_before=started)
+    return changed
+
+
+def reset() -> None:
+    """Bỏ mọi kết quả và dấu nguồn đã giữ, như process vừa khởi động (benchmark)."""
+    invalidate(list(DATASETS))
+    with _stamps_lock:
+        _stamps.clear()
+        _fingerprints.clear()
+    with _refreshes_lock:
+        _refreshes.clear()
+
+
+def data_as_of(names) -> pd.Timestamp | None:
+    """Mốc "dữ liệu tính đến" của một trang: cũ nhất trong các dataset ``names`` đã có kết quả."""
+    stamps = [t for t in (DATASETS[n].as_of() for n in names) if t is not None]
+    return min(stamps, default=None)
+
+
+def refreshing(names) -> bool:
+    """Có dataset nào trong ``names`` đang được làm mới ở nền không."""
+    return any(DATASETS[n].refreshing() for n in names)
+
+
+def registry_stats() -> dict[str, dict]:
+    return {name: ds.stats() for name, ds in DATASETS.items()}
+
+
+# ── Warm-up ──────────────────────────────────────────────────────────────────
+# Các module khai báo dataset. app.py chỉ import trang khi mở nên luồng làm
+# nóng tự import chúng để mọi dataset đã được đăng ký.
+LOADER_MODULES = ("data_loader", "metric_cube", "product_metrics", "cohort_matrix")
+
+_warm_stats: dict[str, dict] = {}
+_warm_lock = threading.Lock()          # mỗi lúc chỉ một vòng làm nóng
+_scheduler: threading.Thread | None = None
+_scheduler_lock = threading.Lock()
+
+
+def warm(names=None) -> bool:
+    """
+    Làm nóng ``names`` (None = mọi dataset, theo thứ tự đăng ký): tải cái
+    chưa có, kiểm tra lại cái sắp tới hạn. Ghi thời gian + lỗi theo dataset.
+    Trả về False nếu đang có một vòng khác chạy.
+    """
+    if not _warm_lock.acquire(blocking=False):
+        return False
+    try:
+        for module in LOADER_MODULES:
+            importlib.import_module(module)
+        for name in (names if names is not None else list(DATASETS)):
+            ds = DATASETS[name]
+            for args, kwargs in ds.warm_calls():
+                t0 = time.perf_counter()
+                rec = _warm_stats.setdefault(name, {"runs": 0, "failures": 0})
+                try:
+                    outcome, error = ds.prefetch(*args, **kwargs), None
+                except Exception as e:
+                    outcome, error = "error", f"{type(e).__name__}: {e}"
+                    rec["failures"] += 1
+                rec.update(
+                    runs=rec["runs"] + 1, last_outcome=outcome, last_error=error,
+                    last_seconds=time.perf_counter() - t0, last_run_at=pd.Timestamp.now(),
+                )
+        return True
+    finally:
+        _warm_lock.release()
+
+
+def warm_async(names=None) -> None:
+    """``warm`` trong một thread nền (vd. ngay sau khi đăng nhập)."""
+    threading.Thread(target=warm, args=(names,), name="ipay-warm", daemon=True).start()
+
+
+def _scheduler_loop() -> None:
+    while True:
+        warm()
+        time.sleep(_WARM_INTERVAL)
+
+
+def start_warmup() -> None:
+    """
+    Khởi động luồng làm nóng của process (một lần; gọi lại không sao): tải
+    mọi dataset ngay, sau đó cứ ``_WARM_INTERVAL`` giây làm mới các kết quả
+    sắp hết ttl để lượt render không phải chờ MotherDuck. IPAY_WARMUP=0 tắt
+    luồng này (profiler/benchmark cần đo lượt render không bị tranh CPU).
+    """
+    global _scheduler
+    if os.environ.get("IPAY_WARMUP", "1") == "0":
+        return
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(target=_scheduler_loop, name="ipay-warmup", daemon=True)
+            _scheduler.start()
+
+
+def warmup_stats() -> dict[str, dict]:
+    """Theo dataset: runs, failures, last_outcome, last_error, last_seconds, last_run_at."""
+    return {name: dict(s) for name, s in _warm_stats.items()}
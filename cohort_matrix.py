@@ -0,0 +1,97 @@
+"""
+cohort_matrix.py
+----------------
+Ma trận thu phí theo tháng hiệu lực (cohort_month × kỳ) cho heatmap Q1 của
+trang thu phí & retention.
+
+Ma trận được build một lần mỗi lần bảng silver.payment_tracking_by_ky đổi
+(cache_registry): mảng dày đặc (sản phẩm × cohort × kỳ) số HĐ đã thu / quá hạn
+chưa thu và tỉ lệ thu, cùng bảng Arrow của heatmap từng sản phẩm (nhãn phần
+trăm định dạng vector hóa). Đổi tập sản phẩm trên trang chỉ là chọn lại các
+bảng đã có — không group / pivot lại ``df_ky``.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cache_registry import dataset
+from data_loader import load_all_payment_tracking
+
+_MIN_KY = 2     # heatmap Q1 tính từ kỳ 2
+
+
+def _pct_labels(rate: np.ndarray) -> np.ndarray:
+    """Nhãn "12.3%" của mảng tỉ lệ (NaN → "—"), định dạng cả mảng một lần."""
+    labels = np.char.add(np.char.mod("%.1f", np.nan_to_num(rate) * 100), "%")
+    return np.where(np.isnan(rate), "—", labels).astype(object)
+
+
+class CohortMatrix:
+    def __init__(self, df_ky: pd.DataFrame):
+        df = df_ky[df_ky["ky"] >= _MIN_KY].dropna(subset=["san_pham", "cohort_month", "ky"])
+        self.products = sorted(df["san_pham"].unique().tolist())
+        self.cohorts  = pd.DatetimeIndex(np.sort(df["cohort_month"].unique()), name="cohort_month")
+        self.kys      = np.sort(df["ky"].unique())
+        shape = (len(self.products), len(self.cohorts), len(self.kys))
+
+        idx = (
+            pd.Index(self.products).get_indexer(df["san_pham"]),
+            self.cohorts.get_indexer(df["cohort_month"]),
+            pd.Index(self.kys).get_indexer(df["ky"]),
+        )
+        so_gcn = df["so_gcn"].fillna(0)
+        count_dtype = np.int64 if pd.api.types.is_integer_dtype(so_gcn) else float
+        counts = {}
+        for status in ("da_thu", "chua_thu_qua_han"):
+            arr = np.zeros(shape, dtype=count_dtype)
+            mask = (df["trang_thai"] == status).to_numpy()
+            np.add.at(arr, tuple(i[mask] for i in idx), so_gcn.to_numpy()[mask])
+            counts[status] = arr
+        self.da_thu = counts["da_thu"]
+        self.chua_thu_qua_han = counts["chua_thu_qua_han"]
+        # Ô có dữ liệu = có ít nhất một dòng (mọi trạng thái) của (sản phẩm, cohort, kỳ)
+        self.has = np.zeros(shape, dtype=bool)
+        self.has[idx] = True
+
+        total = (self.da_thu + self.chua_thu_qua_han).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.ty_le = np.where(total > 0, np.round(self.da_thu / total, 4), np.nan)
+
+        cohort_str = np.asarray(self.cohorts.strftime("%Y-%m"), dtype=object)
+        self._tables = {p: self._table(i, cohort_str) for i, p in enumerate(self.products)}
+
+    def _table(self, p: int, cohort_str: np.ndarray) -> pa.Table:
+        c, k = np.nonzero(self.has[p])          # thứ tự (cohort, kỳ) như groupby
+        rate = self.ty_le[p, c, k]
+        return pa.table({
+            "cohort_str":       cohort_str[c],
+            "ky":               self.kys[k],
+            "ty_le":            rate,
+            "ty_le_pct_str":    _pct_labels(rate),
+            "da_thu":           self.da_thu[p, c, k],
+            "chua_thu_qua_han": self.chua_thu_qua_han[p, c, k],
+        })
+
+    # ── Tra cứu ──────────────────────────────────────────────────────────────
+    def available(self, products) -> list[str]:
+        """Các sản phẩm trong ``products`` có ít nhất một ô, theo thứ tự tên."""
+        wanted = set(products)
+        return [p for p in self.products if p in wanted]
+
+    def table(self, product: str) -> pa.Table:
+        """
+        Bảng heatmap của ``product`` (cohort_str, ky, ty_le, ty_le_pct_str,
+        da_thu, chua_thu_qua_han): một dòng mỗi ô có dữ liệu.
+        """
+        return self._tables[product]
+
+    def n_kys(self, product: str) -> int:
+        """Số kỳ có dữ liệu của ``product`` (chiều cao heatmap)."""
+        return int(self.has[self.products.index(product)].any(axis=0).sum())
+
+
+@dataset("cohort_matrix", depends=("payment_tracking",), ttl=3600)
+def load_cohort_matrix() -> CohortMatrix:
+    df_ky, _, _ = load_all_payment_tracking()
+    return CohortMatrix(df_ky)
@@ -0,0 +1,181 @@
+"""
+complaint_search.py
+-------------------
+Tìm kiếm toàn văn trên khiếu nại (subject, customer_request, cause).
+
+Chỉ mục đảo ngược nằm ngay trong file mirror (schema ``complaint_search``), build bằng
+SQL khi bảng silver.classified_complaints được sync:
+
+  - ``complaint_search.terms`` : (term, id, tf, len) — sắp theo term để
+                                 zonemap của DuckDB bỏ qua các khối không chứa
+                                 term; len (số term của email) chép sẵn để tính
+                                 điểm không phải join
+  - ``complaint_search.docs``  : (id, received_date_time, len) — mọi email,
+                                 kể cả email không có chữ nào (len = 0)
+
+Tách từ không phân biệt dấu tiếng Việt: chữ thường, bỏ dấu (``strip_accents``,
+đ → d), tách theo ký tự không phải chữ/số — "Hoàn phí", "hoan phi" và
+"HOÀN PHÍ" cho cùng các term. Câu tìm kiếm được tách đúng như vậy (trong
+SQL) rồi xếp hạng bằng BM25 trên các term khớp (một term khớp là đủ).
+
+Extension ``fts`` của DuckDB không dùng được khi mirror offline và không cập
+nhật tăng dần được, nên chỉ mục do module này tự giữ: sync tăng dần của
+mirror chỉ build lại đoạn email từ cutoff (``update_index``), còn
+``ensure_index`` build lại toàn bộ nếu chỉ mục thiếu hoặc lệch số email với
+bảng nguồn (file mirror cũ, fixture offline). Khi tắt mirror (đọc thẳng
+MotherDuck) thì ``scan_sql`` quét và so khớp trực tiếp — chậm hơn nhưng cùng
+cách tách từ.
+"""
+
+import threading
+
+SOURCE = "silver.classified_complaints"
+TEXT_COLUMNS = ("subject", "customer_request", "cause")
+
+# Tham số BM25
+_K1 = 1.2
+_B = 0.75
+
+_lock = threading.Lock()
+
+
+def _normalize(expr: str) -> str:
+    """Biểu thức SQL: ``expr`` viết thường, bỏ dấu (đ → d)."""
+    return f"strip_accents(replace(lower(COALESCE({expr}, '')), 'đ', 'd'))"
+
+
+def _terms(expr: str) -> str:
+    """Biểu thức SQL: danh sách term của ``expr`` (có thể chứa phần tử rỗng)."""
+    return f"regexp_split_to_array({_normalize(expr)}, '[^a-z0-9]+')"
+
+
+_DOC_TEXT = f"concat_ws(' ', {', '.join(TEXT_COLUMNS)})"
+
+
+def _index_sql(where: str) -> tuple[str, str]:
+    """(SELECT term, SELECT doc) cho các email của SOURCE thỏa ``where``."""
+    terms = f"""
+        SELECT term, id, tf, (SUM(tf) OVER (PARTITION BY id))::INTEGER AS len
+        FROM (
+            SELECT term, id, COUNT(*)::INTEGER AS tf
+            FROM (SELECT id, UNNEST({_terms(_DOC_TEXT)}) AS term FROM {SOURCE} WHERE {where})
+            WHERE term <> ''
+            GROUP BY term, id
+        )
+        ORDER BY term
+    """
+    docs = f"""
+        SELECT id,
+               TRY_CAST(received_date_time AS TIMESTAMP)              AS received_date_time,
+               len(list_filter({_terms(_DOC_TEXT)}, t -> t <> ''))::INTEGER AS len
+        FROM {SOURCE}
+        WHERE {where}
+    """
+    return terms, docs
+
+
+def build_index(cur) -> None:
+    """Build lại toàn bộ chỉ mục từ SOURCE (trong transaction của ``cur`` nếu có)."""
+    terms, docs = _index_sql("TRUE")
+    cur.execute("CREATE SCHEMA IF NOT EXISTS complaint_search")
+    cur.execute(f"CREATE OR REPLACE TABLE complaint_search.terms AS {terms}")
+    cur.execute(f"CREATE OR REPLACE TABLE complaint_search.docs AS {docs}")
+
+
+def update_index(cur, cutoff=None) -> None:
+    """
+    Cập nhật chỉ mục sau khi mirror sync SOURCE: ``cutoff`` None = sync toàn
+    bộ → build lại; ngược lại thay các email nhận từ ``cutoff`` — đúng đoạn
+    mirror vừa xóa rồi chèn lại (các term chèn thêm nằm cuối bảng, chưa
+    sắp — lần sync toàn bộ định kỳ sắp lại).
+    """
+    with _lock:
+        if cutoff is None or not _has_index(cur):
+            build_index(cur)
+            return
+        cur.execute("""
+            DELETE FROM complaint_search.terms
+            WHERE id IN (SELECT id FROM complaint_search.docs WHERE received_date_time >= ?)
+        """, [cutoff])
+        cur.execute("DELETE FROM complaint_search.docs WHERE received_date_time >= ?", [cutoff])
+        terms, docs = _index_sql("TRY_CAST(received_date_time AS TIMESTAMP) >= ?")
+        cur.execute(f"INSERT INTO complaint_search.terms {terms}", [cutoff])
+        cur.execute(f"INSERT INTO complaint_search.docs {docs}", [cutoff])
+
+
+# Cột của các bảng chỉ mục — chỉ mục có cột khác (bản build cũ) sẽ được build lại
+_COLUMNS = {"terms": ["term", "id", "tf", "len"], "docs": ["id", "received_date_time", "len"]}
+
+
+def _has_index(cur) -> bool:
+    found = dict(cur.execute("""
+        SELECT table_name, list(column_name ORDER BY ordinal_position)
+        FROM information_schema.columns
+        WHERE table_schema = 'complaint_search'
+        GROUP BY table_name
+    """).fetchall())
+    return all(found.get(t) == cols for t, cols in _COLUMNS.items())
+
+
+def ensure_index(cur) -> None:
+    """Build chỉ mục nếu chưa có hoặc số email lệch với SOURCE."""
+    with _lock:
+        if _has_index(cur):
+            docs, rows = cur.execute(
+                f"SELECT (SELECT COUNT(*) FROM complaint_search.docs), (SELECT COUNT(*) FROM {SOURCE})"
+            ).fetchone()
+            if docs == rows:
+                return
+        cur.execute("BEGIN TRANSACTION")
+        try:
+            build_index(cur)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+
+# ── Truy vấn ─────────────────────────────────────────────────────────────────
+def ranked_sql() -> str:
+    """
+    SQL (id, score) của các email khớp câu tìm kiếm (tham số ``?`` duy nhất),
+    điểm BM25 trên chỉ mục. Email không khớp term nào không có trong kết quả.
+    """
+    return f"""
+        WITH q AS (
+            SELECT DISTINCT term FROM (SELECT UNNEST({_terms("?")}) AS term) WHERE term <> ''
+        ),
+        hits AS (
+            SELECT t.term, t.id, t.tf, t.len FROM complaint_search.terms t JOIN q USING (term)
+        ),
+        df AS (SELECT term, COUNT(*) AS df FROM hits GROUP BY term),
+        stats AS (SELECT COUNT(*) AS n, GREATEST(AVG(len), 1) AS avg_len FROM complaint_search.docs)
+        SELECT h.id,
+               SUM(
+                   ln(1 + (s.n - df.df + 0.5) / (df.df + 0.5))
+                   * h.tf * {_K1 + 1} / (h.tf + {_K1} * (1 - {_B} + {_B} * h.len / s.avg_len))
+               ) AS score
+        FROM hits h
+        JOIN df USING (term)
+        CROSS JOIN stats s
+        GROUP BY h.id
+    """
+
+
+def scan_sql() -> str:
+    """
+    Như ``ranked_sql`` nhưng quét thẳng SOURCE (không cần chỉ mục): điểm là
+    số term của câu tìm kiếm có trong email.
+    """
+    return f"""
+        WITH q AS (
+            SELECT list_distinct(list_filter({_terms("?")}, t -> t <> '')) AS terms
+        )
+        SELECT id, score
+        FROM (
+            SELECT c.id,
+                   len(list_intersect(q.terms, {_terms(_DOC_TEXT)})) AS score
+            FROM {SOURCE} c CROSS JOIN q
+        )
+        WHERE score > 0
+    """
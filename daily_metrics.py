@@ -0,0 +1,263 @@
+"""
+daily_metrics.py
+----------------
+Bảng "chi tiết theo ngày" của các trang sản phẩm.
+
+Mọi chỉ số của bảng được tính theo cột: giá trị 30 ngày trước / 5 ngày sau /
+cùng ngày tháng trước lấy bằng một lần ``reindex`` trên chuỗi theo ngày, mũi
+tên tăng/giảm bằng ``np.select``; HTML được ghép trong một lượt duy nhất.
+Không còn vòng ``iterrows()`` hay tra dict theo từng ngày.
+"""
+
+import numpy as np
+import pandas as pd
+
+_DAY_COLS = {
+    "tien":       "Tiền thực thu",
+    "cap_moi":    "Số đơn cấp mới",
+    "tai_tuc":    "Số đơn cấp tái tục",
+    "tai_tuc_dk": "Số đơn tái tục dự kiến",
+    "huy":        "Số đơn hủy webview",
+}
+
+_GREEN, _RED = "#2e7d32", "#c62828"
+_UP   = {c: f'<span style="color:{c}">▲&nbsp;</span>' for c in (_GREEN, _RED)}
+_DOWN = {c: f'<span style="color:{c}">▼&nbsp;</span>' for c in (_GREEN, _RED)}
+
+_TD  = '<td style="padding:4px 8px;text-align:right;'
+_TOT = '<td style="padding:5px 8px;text-align:right;'
+
+
+# ── Tính toán ────────────────────────────────────────────────────────────────
+def daily_totals(series: pd.DataFrame) -> pd.DataFrame:
+    """Tổng theo ngày (index "Ngày phát sinh") với cột tien/cap_moi/tai_tuc/tai_tuc_dk/huy."""
+    return (
+        series.groupby("Ngày phát sinh")[list(_DAY_COLS.values())]
+        .sum()
+        .rename(columns={v: k for k, v in _DAY_COLS.items()})
+    )
+
+
+def lag(daily: pd.DataFrame, dates, col: str, days: int) -> np.ndarray:
+    """Giá trị ``col`` tại (ngày + days) cho từng ngày trong ``dates``; ngày thiếu = 0."""
+    idx = pd.DatetimeIndex(dates) + pd.Timedelta(days=days)
+    return daily[col].reindex(idx, fill_value=0.0).to_numpy(dtype=float)
+
+
+def month_metrics(daily: pd.DataFrame, year: int, month: int, fee: float | None = None) -> pd.DataFrame | None:
+    """
+    Khung đủ mọi ngày của tháng với các cột chung của bảng chi tiết:
+    tien, cap_moi, tai_tuc, tai_tuc_dk, huy, tien_30, cap_moi_30, huy_30,
+    tt_rate, tang_truong (+ so_don, so_don_30 nếu có ``fee``).
+
+    Trả về None nếu tháng không có dòng dữ liệu nào. ``tien_dk`` và
+    ``doi_soat`` phụ thuộc từng sản phẩm nên trang tự gán sau.
+    """
+    start = pd.Timestamp(year, month, 1)
+    dates = pd.date_range(start, periods=start.days_in_month, freq="D", name="Ngày phát sinh")
+    if not daily.index.isin(dates).any():
+        return None
+
+    m = daily.reindex(dates, fill_value=0.0).astype(float).reset_index()
+    m["tien_30"]    = lag(daily, dates, "tien",    -30)
+    m["cap_moi_30"] = lag(daily, dates, "cap_moi", -30)
+    m["huy_30"]     = lag(daily, dates, "huy",     -30)
+    if fee:
+        m["so_don"]    = m["tien"] / fee
+        m["so_don_30"] = m["tien_30"] / fee
+    ttdk = m["tai_tuc_dk"].to_numpy()
+    m["tt_rate"]     = np.divide(m["tai_tuc"].to_numpy(), ttdk, out=np.zeros(len(m)), where=ttdk > 0)
+    m["tang_truong"] = m["cap_moi"] - m["huy"] - m["tai_tuc_dk"] + m["tai_tuc"]
+    return m
+
+
+def doi_soat_by_day(thu_phi: pd.DataFrame, san_pham: str, dates, fee: float | None = None) -> np.ndarray:
+    """
+    Tiền đối soát theo ngày từ silver.payment_by_day:
+    so_giao_dich × fee, hoặc tong_phi nếu không truyền fee.
+    """
+    src = thu_phi[thu_phi["san_pham"] == san_pham]
+    val = src["so_giao_dich"] * fee if fee else src["tong_phi"]
+    by_day = val.groupby(src["ngay_thu_phi"]).last()
+    return by_day.reindex(pd.DatetimeIndex(dates), fill_value=0.0).to_numpy(dtype=float)
+
+
+def prev_month_metrics(series: pd.DataFrame, year: int, month: int, prod_codes=None) -> pd.DataFrame | None:
+    """
+    Khung (ngày × PROD_CODE) của tháng với tien/cap_moi và giá trị cùng ngày
+    tháng trước (tien_pm/cap_moi_pm; ngày 31 → ngày cuối tháng trước).
+    ``series`` cần cột PROD_CODE. Trả về None nếu tháng không có dữ liệu.
+    """
+    daily = (
+        series.groupby(["Ngày phát sinh", "PROD_CODE"])[["Tiền thực thu", "Số đơn cấp mới"]]
+        .sum()
+        .rename(columns={"Tiền thực thu": "tien", "Số đơn cấp mới": "cap_moi"})
+    )
+    start = pd.Timestamp(year, month, 1)
+    dates = pd.date_range(start, periods=start.days_in_month, freq="D")
+    in_month = daily[daily.index.get_level_values(0).isin(dates)]
+    if prod_codes is not None:
+        in_month = in_month[in_month.index.get_level_values(1).isin(prod_codes)]
+    if in_month.empty:
+        return None
+
+    prods = sorted(in_month.index.get_level_values(1).unique())
+    grid = pd.MultiIndex.from_product([dates, prods], names=["Ngày phát sinh", "PROD_CODE"])
+    prev = pd.MultiIndex.from_arrays(
+        [grid.get_level_values(0) - pd.DateOffset(months=1), grid.get_level_values(1)],
+    )
+    m = daily.reindex(grid, fill_value=0.0).astype(float).reset_index()
+    pm = daily.reindex(prev, fill_value=0.0).to_numpy(dtype=float)
+    m["tien_pm"], m["cap_moi_pm"] = pm[:, 0], pm[:, 1]
+    return m
+
+
+# ── Định dạng ────────────────────────────────────────────────────────────────
+def arrows(current, ref, higher_is_good: bool = True) -> np.ndarray:
+    """
+    Mũi tên so với giá trị tham chiếu: ▲ khi lớn hơn, ▼ khi nhỏ hơn (trừ khi
+    tham chiếu = 0). Xanh = tốt, đỏ = xấu theo ``higher_is_good``.
+    """
+    cur, ref = np.asarray(current, dtype=float), np.asarray(ref, dtype=float)
+    up, down = (_UP[_GREEN], _DOWN[_RED]) if higher_is_good else (_UP[_RED], _DOWN[_GREEN])
+    return np.select([cur > ref, (cur < ref) & (ref != 0)], [up, down], default="")
+
+
+def _ints(values) -> list[str]:
+    return [f"{v:,}" for v in np.asarray(values, dtype=float).astype(np.int64).tolist()]
+
+
+def _rounded(values) -> list[str]:
+    return [f"{v:,}" for v in np.round(np.asarray(values, dtype=float)).astype(np.int64).tolist()]
+
+
+def _money(values) -> list[str]:
+    return [f"{v:,.0f}" for v in np.asarray(values, dtype=float).tolist()]
+
+
+def _table(header_html: str, cols: list[list[str]], total_cells: list[str], colgroup: str = "", fixed: bool = False) -> str:
+    """Ghép bảng HTML từ danh sách cột (mỗi cột là list các <td> đã định dạng)."""
+    rows = "".join(
+        f'<tr style="background:{"#ffffff" if i % 2 == 0 else "#f8f9fa"};">{"".join(cells)}</tr>'
+        for i, cells in enumerate(zip(*cols))
+    )
+    layout = "table-layout:fixed;" if fixed else ""
+    return (
+        f'<div style="overflow-x:auto;margin-top:4px;">'
+        f'<table style="width:100%;border-collapse:collapse;font-size:0.75rem;{layout}">'
+        f'{f"<colgroup>{colgroup}</colgroup>" if colgroup else ""}'
+        f'<thead><tr style="background:#2C4C7B;color:white;">{header_html}</tr></thead>'
+        f'<tbody>{rows}</tbody>'
+        f'<tfoot><tr style="background:#2C4C7B;color:white;font-weight:600;">{"".join(total_cells)}</tr></tfoot>'
+        f'</table></div>'
+    )
+
+
+def _cells(prefix: str, values: list[str], arrow: np.ndarray | None = None) -> list[str]:
+    if arrow is None:
+        return [f"{prefix}>{v}</td>" for v in values]
+    return [f"{prefix}>{a}{v}</td>" for a, v in zip(arrow.tolist(), values)]
+
+
+# ── Render ───────────────────────────────────────────────────────────────────
+def render_daily_table(m: pd.DataFrame, show_so_don: bool = True) -> str:
+    """
+    HTML bảng chi tiết theo ngày của một sản phẩm. ``m`` là kết quả
+    ``month_metrics`` đã gán thêm ``tien_dk`` và ``doi_soat``.
+    """
+    tien, tien_30 = m["tien"].to_numpy(), m["tien_30"].to_numpy()
+    doi_soat      = m["doi_soat"].to_numpy()
+    tang_truong   = m["tang_truong"].to_numpy()
+
+    # Tăng trưởng so với ngày trước; ngày đầu tháng tô màu theo dấu
+    arr_tt = arrows(tang_truong, np.r_[0.0, tang_truong[:-1]])
+    if len(arr_tt) and tang_truong[0] < 0:
+        arr_tt[0] = _DOWN[_RED]
+    tt_color = np.where(tang_truong >= 0, _GREEN, _RED)
+    ds_color = np.where(doi_soat != tien, _RED, "#5c4400")
+
+    cols = [[f'<td style="padding:4px 8px;font-weight:500;">{d.day}</td>' for d in m["Ngày phát sinh"]]]
+    totals = ['<td style="padding:5px 8px;">Tổng</td>']
+    headers = ["Ngày"]
+    if show_so_don:
+        cols += [
+            _cells(_TD + '"', _rounded(m["so_don"]), arrows(m["so_don"], m["so_don_30"])),
+            _cells(_TD + 'color:#888;"', _rounded(m["so_don_30"])),
+        ]
+        totals += [
+            f'{_TOT}">{int(round(m["so_don"].sum())):,}</td>',
+            f'{_TOT}opacity:0.75;">{int(round(m["so_don_30"].sum())):,}</td>',
+        ]
+        headers += ["Số đơn thu phí", "Số đơn thu phí 30NT"]
+    cols += [
+        _cells(_TD + '"', _money(tien), arrows(tien, tien_30)),
+        [f'{_TD}color:{c};">{v}</td>' for c, v in zip(ds_color.tolist(), _money(doi_soat))],
+        _cells(_TD + 'color:#888;"', _money(tien_30)),
+        _cells(_TD + 'color:#2C4C7B;"', _money(m["tien_dk"])),
+        _cells(_TD + '"', _ints(m["cap_moi"]), arrows(m["cap_moi"], m["cap_moi_30"])),
+        _cells(_TD + 'color:#888;"', _ints(m["cap_moi_30"])),
+        _cells(_TD + '"', _ints(m["huy"]), arrows(m["huy"], m["huy_30"], higher_is_good=False)),
+        [f"{_TD}\">{r:.1%}</td>" for r in m["tt_rate"].tolist()],
+        [
+            f'{_TD}font-weight:600;color:{c};">{a}{v}</td>'
+            for c, a, v in zip(tt_color.tolist(), arr_tt.tolist(), _ints(tang_truong))
+        ],
+    ]
+    tot_ttdk = m["tai_tuc_dk"].sum()
+    tot_tt_rate = m["tai_tuc"].sum() / tot_ttdk if tot_ttdk > 0 else 0.0
+    totals += [
+        f'{_TOT}">{tien.sum():,.0f}</td>',
+        f'{_TOT}">{doi_soat.sum():,.0f}</td>',
+        f'{_TOT}opacity:0.75;">{tien_30.sum():,.0f}</td>',
+        f'{_TOT}">{m["tien_dk"].sum():,.0f}</td>',
+        f'{_TOT}">{int(m["cap_moi"].sum()):,}</td>',
+        f'{_TOT}opacity:0.75;">{int(m["cap_moi_30"].sum()):,}</td>',
+        f'{_TOT}">{int(m["huy"].sum()):,}</td>',
+        f'{_TOT}">{tot_tt_rate:.1%}</td>',
+        f'{_TOT}">{int(tang_truong.sum()):,}</td>',
+    ]
+    headers += [
+        "Tiền thực thu", "Tiền đối soát", "Tiền TT 30NT", "Tiền TT dự kiến",
+        "Số đơn cấp mới", "Số đơn cấp mới 30NT", "Số đơn hủy", "Tỷ lệ TT / DK", "Số KH tăng trưởng",
+    ]
+    header_html = "".join(
+        f'<th style="padding:6px 8px;text-align:{"left" if i == 0 else "right"};'
+        f'white-space:nowrap;">{h}</th>'
+        for i, h in enumerate(headers)
+    )
+    return _table(header_html, cols, totals)
+
+
+def render_prev_month_table(m: pd.DataFrame, label_fn) -> str:
+    """HTML bảng (ngày × sản phẩm) so với cùng ngày tháng trước; ``m`` từ ``prev_month_metrics``."""
+    _HEADERS = [
+        ("Ngày",                       "left",  "14%"),
+        ("Sản phẩm",                   "left",  "22%"),
+        ("Đơn cấp mới",                "right", "16%"),
+        ("Đơn cùng ngày tháng trước",  "right", "16%"),
+        ("Tiền thực thu",              "right", "16%"),
+        ("Tiền TT tháng trước",        "right", "16%"),
+    ]
+    labels = {code: label_fn(code) for code in m["PROD_CODE"].unique()}
+    cols = [
+        [f'<td style="padding:4px 8px;font-weight:500;">{d}</td>'
+         for d in m["Ngày phát sinh"].dt.strftime("%d-%m-%Y")],
+        [f'<td style="padding:4px 8px;">{labels[p]}</td>' for p in m["PROD_CODE"]],
+        _cells(_TD + '"', _ints(m["cap_moi"]), arrows(m["cap_moi"], m["cap_moi_pm"])),
+        _cells(_TD + 'color:#888;"', _ints(m["cap_moi_pm"])),
+        _cells(_TD + '"', _money(m["tien"]), arrows(m["tien"], m["tien_pm"])),
+        _cells(_TD + 'color:#888;"', _money(m["tien_pm"])),
+    ]
+    totals = [
+        '<td style="padding:5px 8px;" colspan="2">Tổng</td>',
+        f'{_TOT}">{int(m["cap_moi"].sum()):,}</td>',
+        f'{_TOT}opacity:0.75;">{int(m["cap_moi_pm"].sum()):,}</td>',
+        f'{_TOT}">{m["tien"].sum():,.0f}</td>',
+        f'{_TOT}opacity:0.75;">{m["tien_pm"].sum():,.0f}</td>',
+    ]
+    col_defs = "".join(f'<col style="width:{w};">' for _, _, w in _HEADERS)
+    header_html = "".join(
+        f'<th style="padding:6px 8px;text-align:{align};white-space:nowrap;">{h}</th>'
+        for h, align, _ in _HEADERS
+    )
+    return _table(header_html, cols, totals, colgroup=col_defs, fixed=True)
@@ -1,11 +1,21 @@
+import logging
 import os
-import sys
-import duckdb
+import pickle
+import time
+
+import numpy as np
 import pandas as pd
-import streamlit as st
-from dotenv import load_dotenv
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+
+import complaint_search
+import instrumentation
+from cache_registry import dataset
+from local_mirror import MIRROR_TABLES, get_mirror, mirror_enabled
+from motherduck import get_pool
+from parallel_fetch import fetch_all
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 _NUMERIC_COLS = [
     "Tiền thực thu",
@@ -18,106 +28,606 @@ _NUMERIC_COLS = [
 ]
 
 
-@st.cache_data(ttl=300)
-def load_ipay_data() -> pd.DataFrame:
-    token = os.environ.get("MOTHERDUCK_TOKEN")
-    if not token:
-        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
-    con = duckdb.connect(f"md:ipay_data?motherduck_token={token}")
-    df = con.execute("""
+def _query_df(sql: str, tables: list[str], params: list | None = None) -> pd.DataFrame:
+    """
+    Chạy truy vấn trên mirror cục bộ (sau khi sync các bảng nguồn), hoặc thẳng
+    trên MotherDuck nếu mirror bị tắt. Tên bảng giống nhau ở cả hai nơi.
+    """
+    if mirror_enabled():
+        mirror = get_mirror()
+        mirror.ensure_fresh(tables)
+        return mirror.query_df(sql, params)
+    return get_pool().query_df(sql, params)
+
+
+def _query_arrow(sql: str, tables: list[str], params: list | None = None) -> pa.Table:
+    """Như ``_query_df`` nhưng lấy kết quả dạng Arrow (``fetch_arrow_table``)."""
+    if mirror_enabled():
+        mirror = get_mirror()
+        mirror.ensure_fresh(tables)
+        return mirror.query_arrow(sql, params)
+    return get_pool().query_arrow(sql, params)
+
+
+# Ngân sách bộ nhớ của bảng gold sau khi nén dtype (đo bằng ipay_footprint()).
+# Mỗi cache hit của cache_registry unpickle lại cả frame nên kích thước này
+# cũng là chi phí copy mỗi lần truy cập.
+IPAY_MEMORY_BUDGET = 16 * 1024 * 1024
+
+
+def ipay_footprint(df: pd.DataFrame) -> dict:
+    """Kích thước trong bộ nhớ + chi phí pickle/unpickle (như kho cache) của một frame."""
+    t0 = time.perf_counter()
+    blob = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+    t1 = time.perf_counter()
+    pickle.loads(blob)
+    t2 = time.perf_counter()
+    return {
+        "rows":          len(df),
+        "memory_bytes":  int(df.memory_usage(deep=True).sum()),
+        "pickle_bytes":  len(blob),
+        "pickle_ms":     (t1 - t0) * 1000,
+        "unpickle_ms":   (t2 - t1) * 1000,
+    }
+
+
+# Fingerprint theo ngày, giữ trong ``df.attrs["fingerprints"]`` dạng bytes:
+# pandas deepcopy attrs sau mỗi phép tính, bytes thì không phải chép
+_FINGERPRINT_DTYPE = np.dtype([("day", "datetime64[D]"), ("fp", np.uint64)])
+
+
+def _day_fingerprints(table: str, day: str, where: str = "", params: list | None = None) -> np.ndarray:
+    """
+    (ngày, bit_xor(hash(dòng)) các dòng của ngày) của ``table`` — ``day`` là
+    biểu thức ngày, ngày NaT = dòng không có ngày. XOR mọi ngày bằng
+    ``_table_fingerprint(table)``.
+    """
+    df = _query_df(f"""
+        SELECT {day} AS day, bit_xor(hash(t)) AS fp
+        FROM {table} t
+        {where}
+        GROUP BY day
+    """, [table], params)
+    fps = np.empty(len(df), _FINGERPRINT_DTYPE)
+    fps["day"] = pd.to_datetime(df["day"]).to_numpy(dtype="datetime64[D]")
+    fps["fp"] = df["fp"].to_numpy(dtype=np.uint64)
+    return fps
+
+
+def _table_fingerprint(table: str) -> int | None:
+    """bit_xor(hash(dòng)) cả bảng — một dòng kết quả, không group."""
+    fp = _query_df(f"SELECT bit_xor(hash(t)) AS fp FROM {table} t", [table])["fp"].iloc[0]
+    return None if pd.isna(fp) else int(fp)
+
+
+def _with_fingerprints(fingerprints, frame) -> pd.DataFrame:
+    # Lấy fingerprint TRƯỚC dữ liệu: nếu nguồn đổi giữa hai truy vấn thì lần
+    # cập nhật sau thấy lệch với fingerprint cả bảng và tải lại toàn bộ
+    fps = fingerprints()
+    df = frame()
+    df.attrs["fingerprints"] = fps.tobytes()
+    return df
+
+
+def _merge_fingerprints(blob: bytes, cutoff: pd.Timestamp, recent: np.ndarray, table: str) -> np.ndarray | None:
+    """
+    Đối soát cập nhật tăng dần: fingerprint các ngày trước ``cutoff`` (giữ từ
+    lần trước, ``blob``) XOR các ngày vừa tải (``recent``) phải bằng
+    fingerprint cả bảng — đọc sau khi đã tải đoạn mới, vì dấu nguồn không băm
+    lại mỗi lần với bảng có watermark. Lệch nghĩa là có thay đổi nằm ngoài
+    đoạn → None (tải lại toàn bộ); khớp → fingerprint mới của frame.
+    """
+    fps = np.frombuffer(blob, _FINGERPRINT_DTYPE)
+    fps = np.concatenate([fps[~(fps["day"] >= cutoff.to_datetime64())], recent])   # giữ cả ngày NaT
+    if int(np.bitwise_xor.reduce(fps["fp"])) != _table_fingerprint(table):
+        return None
+    return fps
+
+
+# Số ngày trước "Ngày phát sinh" lớn nhất được tải lại khi cập nhật tăng dần
+IPAY_LOOKBACK_DAYS = int(os.environ.get(
+    "IPAY_LOOKBACK_DAYS", MIRROR_TABLES["gold.ipay_quantity_rev_data"].lookback_days,
+))
+
+
+# Đoạn tải lại khi cập nhật tăng dần: các dòng phát sinh từ ngày ``?``
+_RECENT_IPAY = 'WHERE "Ngày phát sinh" >= ?'
+
+
+def _ipay_fingerprints(where: str = "", params: list | None = None) -> np.ndarray:
+    return _day_fingerprints("gold.ipay_quantity_rev_data", 'TRY_CAST("Ngày phát sinh" AS DATE)', where, params)
+
+
+def _ipay_frame(where: str = "", params: list | None = None) -> pd.DataFrame:
+    counters = ",\n            ".join(
+        f'COALESCE(TRY_CAST("{c}" AS DOUBLE), 0)::INTEGER AS "{c}"' for c in _NUMERIC_COLS[1:]
+    )
+    df = _query_df(f"""
         SELECT
             PROD_CODE,
-            "Năm",
+            COALESCE("Năm", YEAR("Ngày phát sinh"))::SMALLINT AS "Năm",
             "Ngày phát sinh",
-            "Tiền thực thu",
-            "Số đơn cấp mới",
-            "Số đơn cấp tái tục",
-            "Số đơn tái tục dự kiến",
-            "Số đơn có hiệu lực",
-            "Số đơn tạm ngưng",
-            "Số đơn hủy webview"
+            COALESCE(TRY_CAST("Tiền thực thu" AS DOUBLE), 0) AS "Tiền thực thu",
+            {counters}
+        FROM gold.ipay_quantity_rev_data
+        {where}
+    """, ["gold.ipay_quantity_rev_data"], params)
+    df["PROD_CODE"] = df["PROD_CODE"].astype("category")
+    return df
+
+
+def _check_ipay_budget(df: pd.DataFrame) -> pd.DataFrame:
+    mem = int(df.memory_usage(deep=True).sum())
+    if mem > IPAY_MEMORY_BUDGET:
+        logger.warning("load_ipay_data: %.1f MB vượt ngân sách %.1f MB",
+                       mem / 2**20, IPAY_MEMORY_BUDGET / 2**20)
+    return df
+
+
+def _schema(df: pd.DataFrame) -> list[tuple[str, str]]:
+    return [(c, "category" if isinstance(t, pd.CategoricalDtype) else str(t)) for c, t in df.dtypes.items()]
+
+
+@dataset("ipay_data", sources=("gold.ipay_quantity_rev_data",), ttl=300)
+def load_ipay_data() -> pd.DataFrame:
+    """
+    Bảng gold ở dạng nén: PROD_CODE categorical, "Năm" int16, các cột số đơn
+    int32, "Tiền thực thu" float64 (giá trị ô NULL/không hợp lệ → 0).
+    """
+    return _check_ipay_budget(_with_fingerprints(_ipay_fingerprints, _ipay_frame))
+
+
+@load_ipay_data.incremental
+def _update_ipay_data(prev: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Cập nhật tăng dần khi bảng gold đổi: chỉ tải các dòng từ (ngày lớn nhất −
+    IPAY_LOOKBACK_DAYS) rồi thay cả đoạn đó trong frame cũ — upsert theo
+    (PROD_CODE, "Ngày phát sinh"), kể cả dòng đã bị xóa trong đoạn. Trả về
+    None (→ tải lại toàn bộ) nếu schema đổi hoặc fingerprint theo ngày không
+    khớp nguồn (``_merge_fingerprints``), tức là có thay đổi nằm ngoài đoạn.
+    """
+    blob = prev.attrs.get("fingerprints")
+    latest = prev["Ngày phát sinh"].max()
+    if blob is None or pd.isna(latest):
+        return None
+    cutoff = (latest - pd.Timedelta(days=IPAY_LOOKBACK_DAYS)).normalize()
+    params = [cutoff.to_pydatetime()]
+    recent_fps = _ipay_fingerprints(_RECENT_IPAY, params)
+    recent = _ipay_frame(_RECENT_IPAY, params)
+    if _schema(recent) != _schema(prev):
+        return None
+    fps = _merge_fingerprints(blob, cutoff, recent_fps, "gold.ipay_quantity_rev_data")
+    if fps is None:
+        return None
+    kept = prev[~(prev["Ngày phát sinh"] >= cutoff)]      # giữ cả dòng không có ngày
+    df = pd.concat([kept.astype({"PROD_CODE": str}), recent.astype({"PROD_CODE": str})], ignore_index=True)
+    df["PROD_CODE"] = df["PROD_CODE"].astype("category")
+    df.attrs["fingerprints"] = fps.tobytes()
+    return _check_ipay_budget(df)
+
+
+@dataset("product_series", sources=("gold.ipay_quantity_rev_data",), ttl=300)
+def load_product_series(
+    prod_codes: tuple[str, ...],
+    years: tuple[int, ...] = (),
+    grain: str = "day",
+    exclude: bool = False,
+    by_product: bool = False,
+) -> pd.DataFrame:
+    """
+    Chuỗi đã tổng hợp sẵn của một (nhóm) sản phẩm, tính trong DuckDB.
+
+    Lọc PROD_CODE / "Năm" được đẩy xuống SQL nên chỉ các dòng của sản phẩm
+    được quét và trả về — không kéo cả bảng gold về pandas.
+
+      - prod_codes : mã sản phẩm cần lấy (exclude=True → lấy mọi mã KHÁC các mã này)
+      - years      : tập "Năm"; rỗng = mọi năm
+      - grain      : "day" → cột "Ngày phát sinh"; "month" → cột "Tháng" (ngày đầu tháng)
+                     kèm "Số ngày" = số ngày có dữ liệu trong tháng
+      - by_product : giữ PROD_CODE trong khóa group
+
+    Columns: [PROD_CODE], "Năm", "Ngày phát sinh" | "Tháng" [, "Số ngày"], + _NUMERIC_COLS (tổng)
+    """
+    if grain not in ("day", "month"):
+        raise ValueError(f"grain không hợp lệ: {grain!r}")
+
+    date_expr = '"Ngày phát sinh"' if grain == "day" else "DATE_TRUNC('month', \"Ngày phát sinh\")"
+    date_col  = "Ngày phát sinh" if grain == "day" else "Tháng"
+    keys = (["PROD_CODE"] if by_product else []) + ['"Năm"', f'{date_expr} AS "{date_col}"']
+    group_by = (["PROD_CODE"] if by_product else []) + ['"Năm"', date_expr]
+    sums = ",\n            ".join(
+        f'COALESCE(SUM(TRY_CAST("{c}" AS DOUBLE)), 0) AS "{c}"' for c in _NUMERIC_COLS
+    )
+    extra = ',\n            COUNT(DISTINCT "Ngày phát sinh") AS "Số ngày"' if grain == "month" else ""
+
+    where, params = [], []
+    if prod_codes:
+        placeholders = ", ".join("?" * len(prod_codes))
+        # exclude: dòng PROD_CODE NULL vẫn thuộc nhóm "khác" (NOT IN với NULL cho NULL)
+        where.append(
+            f"(PROD_CODE IS NULL OR PROD_CODE NOT IN ({placeholders}))" if exclude
+            else f"PROD_CODE IN ({placeholders})"
+        )
+        params += list(prod_codes)
+    if years:
+        where.append(f'"Năm" IN ({", ".join("?" * len(years))})')
+        params += [int(y) for y in years]
+
+    df = _query_df(f"""
+        SELECT
+            {", ".join(keys)},
+            {sums}{extra}
         FROM gold.ipay_quantity_rev_data
-    """).df()
-    con.close()
-    for col in _NUMERIC_COLS:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY {", ".join(group_by)}
+        ORDER BY {", ".join(group_by)}
+    """, ["gold.ipay_quantity_rev_data"], params)
+    df[date_col] = pd.to_datetime(df[date_col])
     return df
 
 
-@st.cache_data(ttl=300)
+# Số ngày (theo ngày nhận) trước received_date_time lớn nhất được tải lại khi
+# cập nhật tăng dần bảng khiếu nại
+COMPLAINTS_LOOKBACK_DAYS = int(os.environ.get(
+    "IPAY_COMPLAINTS_LOOKBACK_DAYS", MIRROR_TABLES["silver.classified_complaints"].lookback_days,
+))
+
+# Đoạn tải lại khi cập nhật tăng dần: các email nhận từ ngày ``?``
+_RECENT_COMPLAINTS = "WHERE TRY_CAST(received_date_time AS DATE) >= ?"
+
+def _complaint_fingerprints(where: str = "", params: list | None = None) -> np.ndarray:
+    """Fingerprint theo ngày nhận của bảng khiếu nại (ngày NaT = email không có ngày)."""
+    return _day_fingerprints(
+        "silver.classified_complaints", "TRY_CAST(received_date_time AS DATE)", where, params,
+    )
+
+
+def _update_complaint_frame(prev: pd.DataFrame, frame) -> pd.DataFrame | None:
+    """
+    Cập nhật tăng dần chung của ``complaints`` / ``complaint_facts``: chỉ tải
+    các email nhận từ (ngày nhận lớn nhất − COMPLAINTS_LOOKBACK_DAYS) rồi thay
+    cả đoạn đó trong frame cũ (kể cả email đã bị xóa trong đoạn).
+
+    Đối soát: frame giữ fingerprint theo ngày nhận (``_merge_fingerprints``)
+    — lệch nghĩa là có thay đổi nằm ngoài đoạn (phân loại lại muộn, xóa email
+    cũ) → trả về None để tải lại toàn bộ.
+    """
+    blob = prev.attrs.get("fingerprints")
+    latest = prev["received_date_time"].max()
+    if blob is None or pd.isna(latest):
+        return None
+    cutoff = latest.normalize() - pd.Timedelta(days=COMPLAINTS_LOOKBACK_DAYS)
+    params = [cutoff.date()]
+    recent_fps = _complaint_fingerprints(_RECENT_COMPLAINTS, params)
+    recent = frame(_RECENT_COMPLAINTS, params)
+    if _schema(recent) != _schema(prev):
+        return None
+    fps = _merge_fingerprints(blob, cutoff, recent_fps, "silver.classified_complaints")
+    if fps is None:
+        return None
+    received = prev["received_date_time"]
+    categories = [c for c, t in prev.dtypes.items() if isinstance(t, pd.CategoricalDtype)]
+    # Giữ thứ tự như lần tải toàn bộ: email có ngày trước đoạn, đoạn mới, email không có ngày
+    parts = [prev[received < cutoff], recent, prev[received.isna()]]
+    df = pd.concat([p.drop(columns=categories) for p in parts], ignore_index=True)
+    for c in categories:
+        # Gộp mã categorical thay vì đổi qua chuỗi; bỏ nhãn không còn dùng như một lần tải mới
+        df[c] = union_categoricals([p[c] for p in parts], sort_categories=True).remove_unused_categories()
+    df = df[prev.columns]
+    df.attrs["fingerprints"] = fps.tobytes()
+    return df
+
+
+def _complaints_frame(where: str = "", params: list | None = None) -> pd.DataFrame:
+    return _query_df(f"""
+        SELECT id,
+               TRY_CAST(received_date_time AS TIMESTAMP) AS received_date_time,
+               products, complaint_types, priority, sender
+        FROM silver.classified_complaints
+        {where}
+    """, ["silver.classified_complaints"], params)
+
+
+@dataset("complaints", sources=("silver.classified_complaints",), ttl=300, warm=[])
 def load_complaints_data() -> pd.DataFrame:
-    token = os.environ.get("MOTHERDUCK_TOKEN")
-    if not token:
-        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
-    con = duckdb.connect(f"md:ipay_data?motherduck_token={token}")
-    df = con.execute("SELECT * FROM silver.classified_complaints").df()
-    con.close()
-    df["received_date_time"] = pd.to_datetime(df["received_date_time"], errors="coerce")
+    """
+    Bảng khiếu nại dạng hẹp (một dòng mỗi email) — không gồm các cột văn bản
+    dài subject / customer_request / cause: bảng chi tiết lấy chúng theo từng
+    trang (``fetch_complaint_page``). Cập nhật tăng dần theo ngày nhận
+    (``_update_complaint_frame``). Trang khiếu nại chỉ dùng
+    ``load_complaint_daily`` nên dataset này không được làm nóng.
+
+    Columns: id, received_date_time, products, complaint_types, priority, sender
+    """
+    return _with_fingerprints(_complaint_fingerprints, _complaints_frame)
+
+
+@load_complaints_data.incremental
+def _update_complaints_data(prev: pd.DataFrame) -> pd.DataFrame | None:
+    return _update_complaint_frame(prev, _complaints_frame)
+
+
+_COMPLAINT_KEYS = ["products", "complaint_types", "Sản phẩm - Loại khiếu nại", "priority", "sender"]
+
+
+def _complaint_pairs_sql(source: str, columns: str) -> str:
+    """
+    SQL tách mỗi email của ``source`` (bảng hoặc CTE có cột products /
+    complaint_types — danh sách phân tách bằng ";") thành một dòng cho mỗi cặp
+    (sản phẩm × loại khiếu nại): ``unnest(string_split(...))``, bỏ phần tử
+    rỗng; ``pos`` = thứ tự cặp trong email (từ 1). ``columns``: các cột giữ lại.
+    """
+    return f"""
+        WITH by_product AS (
+            SELECT {columns}, complaint_types,
+                   UNNEST(string_split(COALESCE(products, ''), ';'))              AS product,
+                   UNNEST(range(len(string_split(COALESCE(products, ''), ';')))) AS product_pos
+            FROM {source}
+        ),
+        pairs AS (
+            SELECT {columns}, product_pos,
+                   trim(product, ' \t\r\n')                                                 AS products,
+                   trim(UNNEST(string_split(COALESCE(complaint_types, ''), ';')), ' \t\r\n') AS complaint_types,
+                   UNNEST(range(len(string_split(COALESCE(complaint_types, ''), ';'))))      AS type_pos
+            FROM by_product
+        )
+        SELECT *, row_number() OVER (PARTITION BY id ORDER BY product_pos, type_pos) AS pos
+        FROM pairs
+        WHERE products <> '' AND complaint_types <> ''
+    """
+
+
+def _complaint_facts_frame(where: str = "", params: list | None = None) -> pd.DataFrame:
+    source = f"(SELECT * FROM silver.classified_complaints {where})"
+    df = _query_df(f"""
+        SELECT id,
+               TRY_CAST(received_date_time AS TIMESTAMP)           AS received_date_time,
+               TRY_CAST(received_date_time AS DATE)                AS "Ngày",
+               products,
+               complaint_types,
+               products || ' - ' || complaint_types                AS "Sản phẩm - Loại khiếu nại",
+               priority,
+               sender
+        FROM ({_complaint_pairs_sql(source, "id, received_date_time, priority, sender")})
+        ORDER BY received_date_time, id, pos
+    """, ["silver.classified_complaints"], params)
+    df["Ngày"] = pd.to_datetime(df["Ngày"])
+    return df.astype({c: "category" for c in _COMPLAINT_KEYS})
+
+
+@dataset("complaint_facts", sources=("silver.classified_complaints",), ttl=300)
+def load_complaint_facts() -> pd.DataFrame:
+    """
+    Khiếu nại ở dạng dài: một dòng cho mỗi cặp (sản phẩm × loại khiếu nại)
+    của mỗi email, tách trong DuckDB (``_complaint_pairs_sql``). Khi nguồn
+    đổi chỉ tách lại các email trong đoạn lookback rồi ghép vào frame đã
+    cache (``_update_complaint_frame``).
+
+    Columns: id, received_date_time, "Ngày", products, complaint_types,
+             "Sản phẩm - Loại khiếu nại", priority, sender (5 cột cuối categorical)
+    """
+    return _with_fingerprints(_complaint_fingerprints, _complaint_facts_frame)
+
+
+@load_complaint_facts.incremental
+def _update_complaint_facts(prev: pd.DataFrame) -> pd.DataFrame | None:
+    return _update_complaint_frame(prev, _complaint_facts_frame)
+
+
+@dataset("complaint_daily", depends=("complaint_facts",), ttl=300)
+def load_complaint_daily() -> pd.DataFrame:
+    """
+    Số khiếu nại (cặp sản phẩm × loại) theo ngày, tổng hợp sẵn từ
+    ``load_complaint_facts`` — mọi biểu đồ của trang khiếu nại là một lát cắt
+    của bảng nhỏ này. Giữ cả nhóm có priority / sender trống.
+
+    Columns: "Ngày", products, complaint_types, "Sản phẩm - Loại khiếu nại",
+             priority, sender, "Số KN", "Nhận lần cuối" (received_date_time lớn nhất của nhóm)
+    """
+    facts = load_complaint_facts()
+    return (
+        facts.groupby(["Ngày", *_COMPLAINT_KEYS], observed=True, dropna=False)
+        .agg(**{"Số KN": ("id", "size"), "Nhận lần cuối": ("received_date_time", "max")})
+        .reset_index()
+    )
+
+
+# Một email có ít nhất một cặp (sản phẩm × loại khiếu nại) không rỗng
+_HAS_PAIR = (
+    "regexp_matches(COALESCE(products, ''), '[^;\\s]') "
+    "AND regexp_matches(COALESCE(complaint_types, ''), '[^;\\s]')"
+)
+
+
+@instrumentation.instrumented("loader", "complaint_page")
+def fetch_complaint_page(
+    start_date,
+    end_date,
+    senders: tuple[str, ...] = (),
+    priorities: tuple[str, ...] = (),
+    cursor: tuple | None = None,
+    backward: bool = False,
+    size: int = 15,
+) -> pd.DataFrame:
+    """
+    Một trang của bảng chi tiết khiếu nại (mỗi dòng một cặp sản phẩm × loại),
+    mới nhất trước — cùng thời điểm nhận thì theo id, rồi thứ tự cặp (như bảng
+    facts sắp ổn định theo received_date_time giảm dần). Lọc và phân trang
+    keyset theo (received_date_time, id, pos) đều nằm trong SQL; các cột văn
+    bản dài chỉ được lấy cho các email của trang. Không qua cache_registry —
+    mỗi lần lật trang là một truy vấn nhỏ.
+
+      - start_date / end_date : khoảng ngày nhận (tính cả hai đầu)
+      - senders / priorities  : rỗng = tất cả
+      - cursor   : khóa (received_date_time, id, pos) của dòng mốc; None = từ
+                   đầu danh sách (backward=True: từ cuối)
+      - backward : lấy ``size`` dòng ngay TRƯỚC mốc thay vì ngay sau
+
+    Mỗi email cho ít nhất một cặp nên ``size + 1`` email kể từ mốc (gồm cả
+    email của mốc) luôn đủ một trang.
+
+    Columns: id, received_date_time, pos, "Sản phẩm - Loại khiếu nại", priority,
+             subject, customer_request, cause
+    """
+    where, params = ["TRY_CAST(received_date_time AS DATE) BETWEEN ? AND ?", _HAS_PAIR], [start_date, end_date]
+    if senders:
+        where.append(f"sender IN ({', '.join('?' * len(senders))})")
+        params += list(senders)
+    if priorities:
+        where.append(f"priority IN ({', '.join('?' * len(priorities))})")
+        params += list(priorities)
+
+    # Đi ngược = đảo cả ba chiều sắp xếp rồi lật kết quả
+    ts_order, id_order = ("ASC", "DESC") if backward else ("DESC", "ASC")
+    ts_op, id_op = (">", "<") if backward else ("<", ">")
+    pair_where, pair_params = "", []
+    if cursor is not None:
+        ts, cid, pos = cursor
+        where.append(f"(received_date_time {ts_op} ? OR (received_date_time = ? AND id {id_op}= ?))")
+        params += [ts, ts, cid]
+        pair_where = f"WHERE NOT (received_date_time = ? AND id = ? AND pos {'>=' if backward else '<='} ?)"
+        pair_params = [ts, cid, int(pos)]
+
+    df = _query_df(f"""
+        WITH emails AS (
+            SELECT id, received_date_time, products, complaint_types, priority, subject, customer_request, cause
+            FROM (
+                SELECT * REPLACE (TRY_CAST(received_date_time AS TIMESTAMP) AS received_date_time)
+                FROM silver.classified_complaints
+            )
+            WHERE {" AND ".join(where)}
+            ORDER BY received_date_time {ts_order}, id {id_order}
+            LIMIT ?
+        )
+        SELECT id, received_date_time, pos,
+               products || ' - ' || complaint_types AS "Sản phẩm - Loại khiếu nại",
+               priority, subject, customer_request, cause
+        FROM ({_complaint_pairs_sql("emails", "id, received_date_time, priority, subject, customer_request, cause")})
+        {pair_where}
+        ORDER BY received_date_time {ts_order}, id {id_order}, pos {id_order}
+        LIMIT ?
+    """, ["silver.classified_complaints"], params + [size + 1] + pair_params + [size])
+    if backward:
+        df = df.iloc[::-1].reset_index(drop=True)
+    df["received_date_time"] = pd.to_datetime(df["received_date_time"])
+    return df
+
+
+SEARCH_LIMIT = 200   # số email tối đa trả về cho một câu tìm kiếm
+
+
+@instrumentation.instrumented("loader", "complaint_search")
+def search_complaints(
+    query: str,
+    start_date,
+    end_date,
+    senders: tuple[str, ...] = (),
+    priorities: tuple[str, ...] = (),
+    limit: int = SEARCH_LIMIT,
+) -> pd.DataFrame:
+    """
+    Tìm khiếu nại theo nội dung (subject / customer_request / cause), không
+    phân biệt dấu, kết hợp cùng bộ lọc như ``fetch_complaint_page``. Trả về
+    các cặp sản phẩm × loại của tối đa ``limit`` email khớp nhất, email có
+    điểm cao trước (complaint_search: BM25 trên chỉ mục trong mirror; khi tắt
+    mirror thì quét thẳng bảng nguồn).
+
+    Columns: như ``fetch_complaint_page`` + score
+    """
+    if mirror_enabled():
+        mirror = get_mirror()
+        mirror.ensure_fresh([complaint_search.SOURCE])
+        with mirror.pool.cursor() as cur:
+            complaint_search.ensure_index(cur)
+        matches = complaint_search.ranked_sql()
+    else:
+        matches = complaint_search.scan_sql()
+
+    where, params = ["TRY_CAST(c.received_date_time AS DATE) BETWEEN ? AND ?", _HAS_PAIR], [start_date, end_date]
+    if senders:
+        where.append(f"c.sender IN ({', '.join('?' * len(senders))})")
+        params += list(senders)
+    if priorities:
+        where.append(f"c.priority IN ({', '.join('?' * len(priorities))})")
+        params += list(priorities)
+
+    df = _query_df(f"""
+        WITH matches AS ({matches}),
+        emails AS (
+            SELECT c.id, TRY_CAST(c.received_date_time AS TIMESTAMP) AS received_date_time,
+                   c.products, c.complaint_types, c.priority, c.subject, c.customer_request, c.cause, m.score
+            FROM {complaint_search.SOURCE} c
+            JOIN matches m USING (id)
+            WHERE {" AND ".join(where)}
+            ORDER BY m.score DESC, received_date_time DESC, c.id DESC
+            LIMIT ?
+        )
+        SELECT id, received_date_time, pos,
+               products || ' - ' || complaint_types AS "Sản phẩm - Loại khiếu nại",
+               priority, subject, customer_request, cause, score
+        FROM ({_complaint_pairs_sql("emails", "id, received_date_time, priority, subject, customer_request, cause, score")})
+        ORDER BY score DESC, received_date_time DESC, id DESC, pos
+    """, [complaint_search.SOURCE], [query] + params + [limit])
+    df["received_date_time"] = pd.to_datetime(df["received_date_time"])
     return df
 
 
-@st.cache_data(ttl=3600)
-def load_all_payment_tracking() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+@dataset("payment_tracking", sources=(
+    "silver.payment_tracking_by_ky",
+    "silver.payment_tracking_by_payment_month",
+    "silver.payment_tracking_by_payment_date",
+), ttl=3600)
+def load_all_payment_tracking() -> tuple[pd.DataFrame, pd.DataFrame, pa.Table]:
     """
-    Load cả 3 bảng payment tracking trong 1 kết nối MotherDuck duy nhất.
+    Load cả 3 bảng payment tracking.
 
-    Returns: (df_ky, df_month, df_date)
+    Returns: (df_ky, df_month, tbl_date)
       - df_ky   : silver.payment_tracking_by_ky
       - df_month: silver.payment_tracking_by_payment_month
-      - df_date : silver.payment_tracking_by_payment_date
-    """
-    token = os.environ.get("MOTHERDUCK_TOKEN")
-    if not token:
-        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
-
-    con = duckdb.connect(f"md:ipay_data?motherduck_token={token}")
-    try:
-        df_ky = con.execute("SELECT * FROM silver.payment_tracking_by_ky").df()
+      - tbl_date: silver.payment_tracking_by_payment_date — giữ ở dạng bảng
+                  Arrow (bảng lớn nhất; trang chỉ chuyển sang pandas phần
+                  tháng đang xem)
 
-        df_month = con.execute("""
+    Ba truy vấn độc lập nên chạy song song, mỗi truy vấn một cursor.
+    """
+    res = fetch_all({
+        "payment_tracking_by_ky": lambda: _query_df(
+            "SELECT * FROM silver.payment_tracking_by_ky", ["silver.payment_tracking_by_ky"],
+        ),
+        "payment_tracking_by_payment_month": lambda: _query_df("""
             SELECT san_pham, thang_tra_ky_k, ky, so_gcn,
                    da_tra_ky_tiep, chua_tra_ky_tiep, ty_le_giu_chan_pct
             FROM silver.payment_tracking_by_payment_month
-        """).df()
-
-        df_date = con.execute("""
-            SELECT san_pham, ngay_tra_ky_k, ky, so_gcn,
+        """, ["silver.payment_tracking_by_payment_month"]),
+        "payment_tracking_by_payment_date": lambda: _query_arrow("""
+            SELECT san_pham, ngay_tra_ky_k::TIMESTAMP AS ngay_tra_ky_k, ky, so_gcn,
                    da_tra_ky_tiep, chua_tra_ky_tiep, ty_le_giu_chan_pct, is_mature
             FROM silver.payment_tracking_by_payment_date
-        """).df()
-    finally:
-        con.close()
+        """, ["silver.payment_tracking_by_payment_date"]),
+    })
+    df_ky, df_month, tbl_date = res.values()
 
     df_ky["cohort_month"]       = pd.to_datetime(df_ky["cohort_month"])
     df_month["thang_tra_ky_k"]  = pd.to_datetime(df_month["thang_tra_ky_k"])
-    df_date["ngay_tra_ky_k"]    = pd.to_datetime(df_date["ngay_tra_ky_k"])
-    return df_ky, df_month, df_date
+    return df_ky, df_month, tbl_date
 
 
-@st.cache_data(ttl=3600)
+@dataset("retention_by_ky_thu", sources=("silver.payment_retention_by_ky_thu",), ttl=3600)
 def load_payment_retention_by_ky_thu() -> pd.DataFrame:
     """
-    Load silver.payment_retention_by_ky_thu từ MotherDuck.
+    Load silver.payment_retention_by_ky_thu.
 
     Bảng retention chính xác: với mỗi (san_pham, ky), chỉ tính GCN mà kỳ k+1
     đã đến hạn (dựa theo ngay_hieu_luc thực tế, không dùng proxy 60 ngày).
 
     Columns: san_pham, ky, so_gcn, da_tra_k1, chua_tra_k1, retention_pct
     """
-    token = os.environ.get("MOTHERDUCK_TOKEN")
-    if not token:
-        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
-
-    con = duckdb.connect(f"md:ipay_data?motherduck_token={token}")
-    try:
-        df = con.execute("SELECT * FROM silver.payment_retention_by_ky_thu").df()
-    finally:
-        con.close()
-    return df
+    return _query_df(
+        "SELECT * FROM silver.payment_retention_by_ky_thu", ["silver.payment_retention_by_ky_thu"],
+    )
 
 
-@st.cache_data(ttl=3600)
+@dataset("portfolio_health", sources=("bronze.payment_data", "gold.ipay_quantity_rev_data"), ttl=3600)
 def load_portfolio_health() -> pd.DataFrame:
     """
     Q2 — Sức khỏe danh mục: distinct GCN đã trả phí / GCN có hiệu lực theo tháng.
@@ -126,94 +636,78 @@ def load_portfolio_health() -> pd.DataFrame:
     Nguồn: bronze.payment_data (numerator) + gold.ipay_quantity_rev_data (denominator).
     Lưu ý: hieu_luc của Cyber Risk bị đóng băng trong API từ 2026-01 trở đi.
     """
-    token = os.environ.get("MOTHERDUCK_TOKEN")
-    if not token:
-        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
-
-    con = duckdb.connect(f"md:ipay_data?motherduck_token={token}")
-    try:
-        df = con.execute("""
-            WITH normalized_payments AS (
-                SELECT
-                    CASE "Sản phẩm"
-                        WHEN 'iSafe'                   THEN 'I-Safe'
-                        WHEN 'isafe'                   THEN 'I-Safe'
-                        WHEN 'I-Safe'                  THEN 'I-Safe'
-                        WHEN 'ISafe'                   THEN 'I-Safe'
-                        WHEN 'homesaving'              THEN 'HomeSaving'
-                        WHEN 'HomeSaving'              THEN 'HomeSaving'
-                        WHEN 'cyberisk'                THEN 'Cyber Risk'
-                        WHEN 'Cyber Individual - iPay' THEN 'Cyber Risk'
-                        WHEN 'Cyber Risk'              THEN 'Cyber Risk'
-                        WHEN 'TAPCARE'                 THEN 'TapCare'
-                        WHEN 'phonecare'               THEN 'TapCare'
-                        WHEN 'TapCare'                 THEN 'TapCare'
-                        ELSE "Sản phẩm"
-                    END AS san_pham,
-                    "Số hợp đồng VBI"                               AS so_hd,
-                    DATE_TRUNC('month', "Ngày thu phí")             AS thang
-                FROM bronze.payment_data
-                WHERE "Sản phẩm" IN (
-                    'Cyber Risk','cyberisk','Cyber Individual - iPay',
-                    'I-Safe','iSafe','isafe','ISafe',
-                    'HomeSaving','homesaving',
-                    'TapCare','TAPCARE','phonecare'
-                )
-                  AND "Ngày thu phí" IS NOT NULL
-            ),
-            gcn_per_month AS (
-                SELECT san_pham, thang,
-                       COUNT(DISTINCT so_hd) AS distinct_gcn
-                FROM normalized_payments
-                GROUP BY san_pham, thang
-            ),
-            hieu_luc_per_month AS (
-                SELECT
-                    CASE PROD_CODE
-                        WHEN 'ISAFE_CYBER'    THEN 'I-Safe'
-                        WHEN 'MIX_01'         THEN 'Cyber Risk'
-                        WHEN 'TAPCARE'        THEN 'TapCare'
-                        WHEN 'VTB_HOMESAVING' THEN 'HomeSaving'
-                    END AS san_pham,
-                    DATE_TRUNC('month', "Ngày phát sinh") AS thang,
-                    MAX("Số đơn có hiệu lực")             AS hieu_luc
-                FROM gold.ipay_quantity_rev_data
-                WHERE PROD_CODE IN (
-                    'ISAFE_CYBER','MIX_01','TAPCARE','VTB_HOMESAVING'
-                )
-                GROUP BY PROD_CODE, DATE_TRUNC('month', "Ngày phát sinh")
+    df = _query_df("""
+        WITH normalized_payments AS (
+            SELECT
+                CASE "Sản phẩm"
+                    WHEN 'iSafe'                   THEN 'I-Safe'
+                    WHEN 'isafe'                   THEN 'I-Safe'
+                    WHEN 'I-Safe'                  THEN 'I-Safe'
+                    WHEN 'ISafe'                   THEN 'I-Safe'
+                    WHEN 'homesaving'              THEN 'HomeSaving'
+                    WHEN 'HomeSaving'              THEN 'HomeSaving'
+                    WHEN 'cyberisk'                THEN 'Cyber Risk'
+                    WHEN 'Cyber Individual - iPay' THEN 'Cyber Risk'
+                    WHEN 'Cyber Risk'              THEN 'Cyber Risk'
+                    WHEN 'TAPCARE'                 THEN 'TapCare'
+                    WHEN 'phonecare'               THEN 'TapCare'
+                    WHEN 'TapCare'                 THEN 'TapCare'
+                    ELSE "Sản phẩm"
+                END AS san_pham,
+                "Số hợp đồng VBI"                               AS so_hd,
+                DATE_TRUNC('month', "Ngày thu phí")             AS thang
+            FROM bronze.payment_data
+            WHERE "Sản phẩm" IN (
+                'Cyber Risk','cyberisk','Cyber Individual - iPay',
+                'I-Safe','iSafe','isafe','ISafe',
+                'HomeSaving','homesaving',
+                'TapCare','TAPCARE','phonecare'
             )
-            SELECT g.san_pham, g.thang,
-                   g.distinct_gcn,
-                   h.hieu_luc
-            FROM gcn_per_month g
-            LEFT JOIN hieu_luc_per_month h
-                   ON h.san_pham = g.san_pham AND h.thang = g.thang
-            ORDER BY g.san_pham, g.thang
-        """).df()
-    finally:
-        con.close()
-
+              AND "Ngày thu phí" IS NOT NULL
+        ),
+        gcn_per_month AS (
+            SELECT san_pham, thang,
+                   COUNT(DISTINCT so_hd) AS distinct_gcn
+            FROM normalized_payments
+            GROUP BY san_pham, thang
+        ),
+        hieu_luc_per_month AS (
+            SELECT
+                CASE PROD_CODE
+                    WHEN 'ISAFE_CYBER'    THEN 'I-Safe'
+                    WHEN 'MIX_01'         THEN 'Cyber Risk'
+                    WHEN 'TAPCARE'        THEN 'TapCare'
+                    WHEN 'VTB_HOMESAVING' THEN 'HomeSaving'
+                END AS san_pham,
+                DATE_TRUNC('month', "Ngày phát sinh") AS thang,
+                MAX("Số đơn có hiệu lực")             AS hieu_luc
+            FROM gold.ipay_quantity_rev_data
+            WHERE PROD_CODE IN (
+                'ISAFE_CYBER','MIX_01','TAPCARE','VTB_HOMESAVING'
+            )
+            GROUP BY PROD_CODE, DATE_TRUNC('month', "Ngày phát sinh")
+        )
+        SELECT g.san_pham, g.thang,
+               g.distinct_gcn,
+               h.hieu_luc
+        FROM gcn_per_month g
+        LEFT JOIN hieu_luc_per_month h
+               ON h.san_pham = g.san_pham AND h.thang = g.thang
+        ORDER BY g.san_pham, g.thang
+    """, ["bronze.payment_data", "gold.ipay_quantity_rev_data"])
     df["thang"] = pd.to_datetime(df["thang"])
     return df
 
 
-@st.cache_data(ttl=3600)
+@dataset("thu_phi_by_day", sources=("silver.payment_by_day",), ttl=3600)
 def load_thu_phi_by_day() -> pd.DataFrame:
     """
-    Load silver.payment_by_day từ MotherDuck.
+    Load silver.payment_by_day.
 
     Columns: san_pham, ngay_thu_phi, so_giao_dich, tong_phi
     Được build hàng ngày bởi flow outlook-payment-daily (Task 5).
     """
-    token = os.environ.get("MOTHERDUCK_TOKEN")
-    if not token:
-        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
-    con = duckdb.connect(f"md:ipay_data?motherduck_token={token}")
-    try:
-        df = con.execute("SELECT * FROM silver.payment_by_day").df()
-    finally:
-        con.close()
+    df = _query_df("SELECT * FROM silver.payment_by_day", ["silver.payment_by_day"])
     df["ngay_thu_phi"] = pd.to_datetime(df["ngay_thu_phi"])
     df["so_giao_dich"] = pd.to_numeric(df["so_giao_dich"], errors="coerce").fillna(0).astype(int)
     df["tong_phi"]     = pd.to_numeric(df["tong_phi"],     errors="coerce").fillna(0.0)
@@ -0,0 +1,220 @@
+"""
+instrumentation.py
+------------------
+Đo thời gian trên đường nóng của dashboard, gom theo cửa sổ trượt để xem
+percentile trong trang "Chẩn đoán" (chỉ admin).
+
+Mỗi lần đo là một mẫu ``(kind, name)``:
+
+  - ``page``    : một lượt render trang (app.py bọc bằng ``page()``)
+  - ``section`` : một phần trong trang, "tên trang · tên phần" (``mark()``)
+  - ``loader``  : một lần chạy loader thật — kèm số dòng, số byte
+  - ``cache``   : một lượt gọi dataset của cache_registry — outcome là
+                  hits / stale / revalidated / joined / loads / updates
+  - ``task``    : một task của parallel_fetch
+
+``span`` (context manager) và ``instrumented`` (decorator) ghi mẫu cho đoạn
+code bất kỳ. IPAY_METRICS_LOG=<file> → mỗi mẫu được ghi thêm một dòng JSON
+vào file đó; ``export_jsonl`` xuất các mẫu đang giữ.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 500   # số mẫu gần nhất giữ lại cho mỗi (kind, name)
+
+# Ngưỡng thời gian render trang (giây, p95) — trang chẩn đoán đánh dấu trang vượt ngưỡng
+SLO_SECONDS = float(os.environ.get("IPAY_SLO_SECONDS", 3.0))
+
+# Outcome của kind "cache" được tính là trúng cache (không gọi loader)
+CACHE_HITS = ("hits", "stale", "revalidated", "joined")
+
+
+@dataclass
+class Sample:
+    kind: str
+    name: str
+    seconds: float
+    at: float                    # epoch
+    rows: int | None = None
+    bytes: int | None = None
+    outcome: str | None = None
+    ok: bool = True
+
+
+_samples: dict[tuple[str, str], deque] = {}
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def record(kind: str, name: str, seconds: float, *, rows: int | None = None, bytes: int | None = None,
+           outcome: str | None = None, ok: bool = True) -> None:
+    sample = Sample(kind, name, seconds, time.time(), rows, bytes, outcome, ok)
+    with _lock:
+        q = _samples.get((kind, name))
+        if q is None:
+            q = _samples[(kind, name)] = deque(maxlen=WINDOW)
+        q.append(sample)
+    path = os.environ.get("IPAY_METRICS_LOG")
+    if path:
+        try:
+            with _log_lock, open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(sample), ensure_ascii=False) + "\n")
+        except OSError:
+            logger.warning("Không ghi được IPAY_METRICS_LOG=%s", path, exc_info=True)
+
+
+# ── Đo ───────────────────────────────────────────────────────────────────────
+def size_of(value: Any) -> tuple[int | None, int | None]:
+    """(số dòng, số byte trong bộ nhớ) của kết quả loader; tuple/list cộng dồn, kiểu khác → None."""
+    if isinstance(value, pd.DataFrame):
+        return len(value), int(value.memory_usage(index=True).sum())
+    if isinstance(value, pa.Table):
+        return value.num_rows, value.nbytes
+    if isinstance(value, (tuple, list)):
+        sizes = [size_of(v) for v in value]
+        if sizes and all(r is not None for r, _ in sizes):
+            return sum(r for r, _ in sizes), sum(b for _, b in sizes)
+    return None, None
+
+
+class Span:
+    """Mẫu đang đo: gán ``rows`` / ``bytes`` / ``outcome`` trước khi khối ``with`` kết thúc."""
+
+    def __init__(self, kind: str, name: str):
+        self.kind, self.name = kind, name
+        self.rows: int | None = None
+        self.bytes: int | None = None
+        self.outcome: str | None = None
+
+
+@contextmanager
+def span(kind: str, name: str):
+    s = Span(kind, name)
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield s
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record(kind, name, time.perf_counter() - t0, rows=s.rows, bytes=s.bytes, outcome=s.outcome, ok=ok)
+
+
+def instrumented(kind: str = "loader", name: str | None = None, outcome: str | None = None):
+    """Decorator: mỗi lần gọi ghi một mẫu, số dòng/byte lấy từ kết quả (``size_of``)."""
+    def decorate(fn: Callable) -> Callable:
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(kind, label) as s:
+                value = fn(*args, **kwargs)
+                s.rows, s.bytes = size_of(value)
+                s.outcome = outcome
+            return value
+
+        return wrapper
+    return decorate
+
+
+# ── Trang và các phần trong trang ────────────────────────────────────────────
+_page = threading.local()   # lượt render đang chạy trong thread script: [trang, phần, bắt đầu phần]
+
+
+@contextmanager
+def page(name: str):
+    """Đo một lượt render trang; ``mark()`` bên trong chia nó thành các phần."""
+    t0 = time.perf_counter()
+    _page.state = [name, "(đầu trang)", t0]
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False      # st.rerun()/st.stop() (BaseException) không tính là lỗi
+        raise
+    finally:
+        _close_section(time.perf_counter(), ok)
+        _page.state = None
+        record("page", name, time.perf_counter() - t0, ok=ok)
+
+
+def mark(section: str) -> None:
+    """Kết thúc phần hiện tại của trang đang render và bắt đầu phần ``section``; ngoài ``page()`` thì bỏ qua."""
+    state = getattr(_page, "state", None)
+    if state is None:
+        return
+    now = time.perf_counter()
+    _close_section(now)
+    state[1], state[2] = section, now
+
+
+def _close_section(now: float, ok: bool = True) -> None:
+    page_name, section, started = _page.state
+    record("section", f"{page_name} · {section}", now - started, ok=ok)
+
+
+# ── Tổng hợp / xuất ──────────────────────────────────────────────────────────
+def samples(kind: str | None = None) -> list[Sample]:
+    with _lock:
+        queues = [q for (k, _), q in _samples.items() if kind is None or k == kind]
+        out = [s for q in queues for s in q]
+    return sorted(out, key=lambda s: s.at)
+
+
+def summary(kind: str) -> pd.DataFrame:
+    """
+    Một dòng mỗi tên trong ``kind``: số mẫu, lỗi, p50/p90/p95/p99/max (ms),
+    số dòng / MB lần cuối, và % trúng cache (kind "cache"). Sắp theo p95 giảm dần.
+    """
+    with _lock:
+        groups = {n: list(q) for (k, n), q in _samples.items() if k == kind}
+    rows = []
+    for name, group in groups.items():
+        ms = np.array([s.seconds for s in group]) * 1000
+        p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+        last = group[-1]
+        row = {
+            "name": name, "count": len(group), "errors": sum(not s.ok for s in group),
+            "p50_ms": p50, "p90_ms": p90, "p95_ms": p95, "p99_ms": p99, "max_ms": ms.max(),
+            "last_rows": last.rows, "last_mb": None if last.bytes is None else last.bytes / 2**20,
+        }
+        if kind == "cache":
+            row["hit_pct"] = 100 * sum(s.outcome in CACHE_HITS for s in group) / len(group)
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).sort_values("p95_ms", ascending=False, ignore_index=True)
+
+
+def slo_breaches(slo: float = SLO_SECONDS) -> list[str]:
+    """Các trang có p95 thời gian render vượt ``slo`` giây."""
+    df = summary("page")
+    if df.empty:
+        return []
+    return df.loc[df["p95_ms"] > slo * 1000, "name"].tolist()
+
+
+def export_jsonl(kind: str | None = None) -> str:
+    """Các mẫu đang giữ (theo thời gian), mỗi mẫu một dòng JSON."""
+    return "".join(json.dumps(asdict(s), ensure_ascii=False) + "\n" for s in samples(kind))
+
+
+def clear() -> None:
+    with _lock:
+        _samples.clear()
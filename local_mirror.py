@@ -0,0 +1,266 @@
+"""
+local_mirror.py
+---------------
+Bản sao cục bộ (file DuckDB) của các bảng gold/silver/bronze trên MotherDuck.
+
+Loader trong data_loader đọc từ file này thay vì gọi MotherDuck trên đường
+request. Mỗi lần sync chỉ kéo các dòng mới hơn watermark của bảng (lùi lại
+một khoảng ``lookback`` vì các ngày gần nhất còn được cập nhật), rồi thay thế
+đoạn đó trong mirror. Bảng không có watermark ổn định (bảng tracking được
+build lại toàn bộ mỗi ngày) thì copy nguyên bảng. Bảng có ``on_sync`` cập nhật
+dữ liệu dẫn xuất (chỉ mục tìm kiếm khiếu nại — complaint_search) trong cùng
+transaction với lần sync.
+
+Khi MotherDuck chậm hoặc không kết nối được, mirror vẫn phục vụ dữ liệu cũ và
+``mirror_status()`` cho biết dữ liệu đang stale.
+
+Biến môi trường:
+  - IPAY_USE_MIRROR   : "0" để tắt mirror, đọc thẳng MotherDuck (mặc định "1")
+  - IPAY_MIRROR_PATH  : đường dẫn file mirror (mặc định data/ipay_mirror.duckdb)
+  - IPAY_OFFLINE      : "1" để không sync, chỉ đọc file có sẵn (fixture, benchmark)
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import complaint_search
+from motherduck import MotherDuckPool, get_pool
+
+_DEFAULT_PATH = Path(__file__).parent / "data" / "ipay_mirror.duckdb"
+
+FULL_RESYNC_SECONDS = 24 * 3600   # định kỳ copy lại toàn bộ để bắt các dòng bị xóa phía nguồn
+_MIN_SYNC_INTERVAL   = 30          # giây — ensure_fresh bỏ qua bảng vừa sync gần đây
+_MAX_SYNC_BACKOFF    = 600         # giây — sync lỗi liên tiếp thì chờ gấp đôi mỗi lần, tối đa chừng này
+
+
+@dataclass(frozen=True)
+class MirrorTable:
+    name: str                     # "schema.table" — giống hệt tên trên MotherDuck
+    watermark: str | None = None  # cột thời gian để sync tăng dần; None = copy toàn bộ
+    lookback_days: int = 0        # số ngày trước watermark được kéo lại mỗi lần sync
+    on_sync: Callable | None = None   # (cursor, cutoff | None) — cập nhật dữ liệu dẫn xuất trong cùng transaction
+
+    @property
+    def watermark_expr(self) -> str:
+        """Watermark dạng TIMESTAMP — cột có thể là VARCHAR (so sánh / MAX theo thời gian, không theo chuỗi)."""
+        return f"TRY_CAST({self.watermark} AS TIMESTAMP)"
+
+
+MIRROR_TABLES: dict[str, MirrorTable] = {t.name: t for t in [
+    MirrorTable("gold.ipay_quantity_rev_data",            '"Ngày phát sinh"',   lookback_days=7),
+    MirrorTable("silver.classified_complaints",           "received_date_time", lookback_days=2,
+                on_sync=complaint_search.update_index),
+    MirrorTable("silver.payment_by_day",                  "ngay_thu_phi",       lookback_days=7),
+    MirrorTable("bronze.payment_data",                    '"Ngày thu phí"',     lookback_days=7),
+    MirrorTable("silver.payment_tracking_by_ky"),
+    MirrorTable("silver.payment_tracking_by_payment_month"),
+    MirrorTable("silver.payment_tracking_by_payment_date"),
+    MirrorTable("silver.payment_retention_by_ky_thu"),
+]}
+
+
+def mirror_enabled() -> bool:
+    return os.environ.get("IPAY_USE_MIRROR", "1") != "0"
+
+
+def _offline() -> bool:
+    return os.environ.get("IPAY_OFFLINE", "0") == "1"
+
+
+def mirror_path() -> Path:
+    return Path(os.environ.get("IPAY_MIRROR_PATH") or _DEFAULT_PATH)
+
+
+class LocalMirror:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.pool = MotherDuckPool(str(path))
+        self._locks = {name: threading.Lock() for name in MIRROR_TABLES}
+        self._status: dict[str, dict] = {}
+        self._last_sync: dict[str, float] = {}   # monotonic lần thử sync gần nhất (kể cả lỗi), theo bảng
+        self._failures: dict[str, int] = {}      # số lần sync lỗi liên tiếp, theo bảng
+        self._full_synced: dict[str, float] = {}  # monotonic lần copy toàn bộ gần nhất, theo bảng
+        with self.pool.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS _sync_state (
+                    table_name   VARCHAR PRIMARY KEY,
+                    synced_at    TIMESTAMP,
+                    full_sync_at TIMESTAMP,
+                    rows_pulled  BIGINT
+                )
+            """)
+
+    # ── Helpers ──────────────────────────────────────────────────────────────
+    def _has_table(self, cur, name: str) -> bool:
+        schema, table = name.split(".")
+        return cur.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_schema = ? AND table_name = ?",
+            [schema, table],
+        ).fetchone() is not None
+
+    def _columns(self, cur, name: str) -> list[str]:
+        schema, table = name.split(".")
+        return [r[0] for r in cur.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+            [schema, table],
+        ).fetchall()]
+
+    def _state(self, cur, name: str) -> tuple | None:
+        return cur.execute(
+            "SELECT synced_at, full_sync_at FROM _sync_state WHERE table_name = ?", [name],
+        ).fetchone()
+
+    # ── Sync ─────────────────────────────────────────────────────────────────
+    def _pull(self, spec: MirrorTable, cutoff: pd.Timestamp | None):
+        with get_pool().cursor() as remote:
+            if cutoff is None:
+                return remote.execute(f"SELECT * FROM {spec.name}").fetch_arrow_table()
+            return remote.execute(
+                f"SELECT * FROM {spec.name} WHERE {spec.watermark_expr} >= ?", [cutoff.to_pydatetime()],
+            ).fetch_arrow_table()
+
+    def sync(self, name: str, full: bool = False) -> int:
+        """Đồng bộ một bảng từ MotherDuck; trả về số dòng đã kéo về."""
+        spec = MIRROR_TABLES[name]
+        with self._locks[name], self.pool.cursor() as cur:
+            t0 = time.perf_counter()
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {name.split('.')[0]}")
+
+            state = self._state(cur, name)
+            full = (
+                full
+                or spec.watermark is None
+                or not self._has_table(cur, name)
+                or state is None
+                or state[1] is None
+                or (pd.Timestamp.now() - pd.Timestamp(state[1])).total_seconds() > FULL_RESYNC_SECONDS
+            )
+            cutoff = None
+            if not full:
+                wm = cur.execute(f"SELECT MAX({spec.watermark_expr}) FROM {name}").fetchone()[0]
+                if wm is None:
+                    full = True
+                else:
+                    cutoff = pd.Timestamp(wm) - pd.Timedelta(days=spec.lookback_days)
+
+            incoming = self._pull(spec, cutoff)
+            if cutoff is not None and incoming.column_names != self._columns(cur, name):
+                # Schema phía nguồn đã đổi → copy lại toàn bộ
+                full, cutoff = True, None
+                incoming = self._pull(spec, None)
+
+            now = pd.Timestamp.now().to_pydatetime()
+            cur.register("_incoming", incoming)
+            try:
+                cur.execute("BEGIN TRANSACTION")
+                if full:
+                    cur.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM _incoming")
+                else:
+                    cur.execute(f"DELETE FROM {name} WHERE {spec.watermark_expr} >= ?", [cutoff.to_pydatetime()])
+                    cur.execute(f"INSERT INTO {name} SELECT * FROM _incoming")
+                if spec.on_sync is not None:
+                    spec.on_sync(cur, None if full else cutoff.to_pydatetime())
+                cur.execute("""
+                    INSERT INTO _sync_state VALUES (?, ?, ?, ?)
+                    ON CONFLICT (table_name) DO UPDATE SET
+                        synced_at    = excluded.synced_at,
+                        full_sync_at = COALESCE(excluded.full_sync_at, _sync_state.full_sync_at),
+                        rows_pulled  = excluded.rows_pulled
+                """, [name, now, now if full else None, incoming.num_rows])
+                cur.execute("COMMIT")
+            except Exception:       # kể cả lỗi từ on_sync — cursor theo thread được dùng lại
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.unregister("_incoming")
+
+            self._last_sync[name] = time.monotonic()
+            if full:
+                self._full_synced[name] = self._last_sync[name]
+            self._failures.pop(name, None)
+            self._status[name] = {
+                "synced_at": now, "rows": incoming.num_rows, "full": full,
+                "seconds": time.perf_counter() - t0, "error": None,
+            }
+            return incoming.num_rows
+
+    def _sync_interval(self, name: str) -> float:
+        failures = self._failures.get(name, 0)
+        return min(_MIN_SYNC_INTERVAL * 2 ** failures, _MAX_SYNC_BACKOFF)
+
+    def ensure_fresh(self, tables: list[str]) -> None:
+        """
+        Sync các bảng cần cho một loader. Lỗi mạng/xác thực không làm loader
+        thất bại nếu mirror đã có dữ liệu — bảng đó chỉ bị đánh dấu stale, và
+        lần thử sau lùi dần (``_sync_interval``) để khi MotherDuck không kết
+        nối được, đường request không phải thử kết nối lại mỗi lần gọi.
+        """
+        if _offline():
+            return
+        for name in tables:
+            if time.monotonic() - self._last_sync.get(name, float("-inf")) < self._sync_interval(name):
+                continue
+            try:
+                self.sync(name)
+            except Exception as e:
+                prev = self._status.get(name, {})
+                self._status[name] = {**prev, "error": f"{type(e).__name__}: {e}"}
+                with self.pool.cursor() as cur:
+                    if not self._has_table(cur, name):
+                        raise           # chưa có gì để phục vụ → lần gọi sau thử lại ngay
+                self._last_sync[name] = time.monotonic()
+                self._failures[name] = self._failures.get(name, 0) + 1
+
+    def full_synced_at(self, name: str) -> float | None:
+        """Monotonic của lần copy toàn bộ gần nhất của ``name`` trong process này."""
+        return self._full_synced.get(name)
+
+    def stale_tables(self) -> list[str]:
+        """Các bảng mà lần sync gần nhất bị lỗi — chỉ đọc trạng thái trong bộ nhớ, không truy vấn."""
+        return [name for name, s in list(self._status.items()) if s.get("error")]
+
+    def status(self) -> dict[str, dict]:
+        """Trạng thái sync theo bảng: synced_at, rows, full, seconds, error."""
+        with self.pool.cursor() as cur:
+            persisted = {
+                r[0]: {"synced_at": r[1], "rows": r[2]}
+                for r in cur.execute("SELECT table_name, synced_at, rows_pulled FROM _sync_state").fetchall()
+            }
+        return {name: {**persisted.get(name, {}), **self._status.get(name, {})} for name in MIRROR_TABLES}
+
+    def query_df(self, sql: str, params: list | None = None) -> pd.DataFrame:
+        return self.pool.query_df(sql, params)
+
+    def query_arrow(self, sql: str, params: list | None = None) -> pa.Table:
+        return self.pool.query_arrow(sql, params)
+
+
+@st.cache_resource(show_spinner=False)
+def get_mirror() -> LocalMirror:
+    return LocalMirror(mirror_path())
+
+
+def mirror_status() -> dict[str, dict]:
+    if not mirror_enabled():
+        return {}
+    return get_mirror().status()
+
+
+def stale_tables() -> list[str]:
+    """
+    Các bảng mà lần sync gần nhất bị lỗi — đang phục vụ dữ liệu cũ. Gọi mỗi
+    lượt chạy lại của app nên chỉ đọc ``LocalMirror.stale_tables()``.
+    """
+    if not mirror_enabled():
+        return []
+    return get_mirror().stale_tables()
@@ -0,0 +1,196 @@
+"""
+metric_cube.py
+--------------
+Khối chỉ số theo ngày (PROD_CODE × ngày) dùng chung cho trang tổng quan và
+các trang sản phẩm.
+
+Khối được build một lần mỗi lần dữ liệu nguồn đổi (cache_registry) từ chuỗi đã
+tổng hợp trong DuckDB: mảng giá trị dày đặc theo ngày liên tục, cộng dồn theo
+từng năm và chỉ số "ngày có dữ liệu gần nhất". Nhờ đó các KPI kiểu "lũy kế đến
+ngày X", mốc cùng kỳ năm trước hay giá trị một ngày đều là tra cứu O(1) theo
+vị trí ngày thay vì lọc + sum cả bảng.
+
+Ngoài các PROD_CODE còn có hai khóa nhóm: ``ALL`` (mọi sản phẩm) và
+``OTHER`` ("Sản phẩm khác" = các mã ngoài NAMED_PRODUCTS, kể cả dòng không có
+PROD_CODE). Năm của một dòng là năm của "Ngày phát sinh".
+"""
+
+import numpy as np
+import pandas as pd
+
+from cache_registry import dataset
+from data_loader import load_product_series
+from ui_helpers import NAMED_PRODUCTS
+
+METRIC_COLS = [
+    "Tiền thực thu",
+    "Số đơn cấp mới",
+    "Số đơn cấp tái tục",
+    "Số đơn tái tục dự kiến",
+    "Số đơn có hiệu lực",
+    "Số đơn tạm ngưng",
+    "Số đơn hủy webview",
+]
+
+ALL   = "__all__"
+OTHER = "Sản phẩm khác"
+
+
+class MetricCube:
+    def __init__(self, series: pd.DataFrame):
+        series = series.dropna(subset=["Ngày phát sinh"])
+        self.codes = sorted(series["PROD_CODE"].dropna().unique().tolist())
+        self.keys  = self.codes + [OTHER, ALL]
+        self._key_idx = {k: i for i, k in enumerate(self.keys)}
+
+        if series.empty:
+            self.dates = pd.DatetimeIndex([], name="Ngày phát sinh")
+        else:
+            self.dates = pd.date_range(series["Ngày phát sinh"].min(), series["Ngày phát sinh"].max(),
+                                       freq="D", name="Ngày phát sinh")
+        n_keys, n_days, n_cols = len(self.keys), len(self.dates), len(METRIC_COLS)
+
+        values = np.zeros((n_keys, n_days, n_cols))
+        has    = np.zeros((n_keys, n_days), dtype=bool)
+        if n_days:
+            n = len(self.codes)
+            # Dòng PROD_CODE NULL ghi thẳng vào OTHER (không thuộc mã nào) → vẫn tính vào OTHER và ALL
+            ki = pd.Index(self.keys).get_indexer(series["PROD_CODE"])
+            ki[series["PROD_CODE"].isna().to_numpy()] = n
+            di = (series["Ngày phát sinh"] - self.dates[0]).dt.days.to_numpy()
+            np.add.at(values, (ki, di), series[METRIC_COLS].to_numpy(dtype=float))
+            has[ki, di] = True
+
+            other = np.array([c not in NAMED_PRODUCTS for c in self.codes], dtype=bool)
+            values[n + 1] = values[:n + 1].sum(axis=0)
+            has[n + 1]    = has[:n + 1].any(axis=0)
+            values[n]    += values[:n][other].sum(axis=0)
+            has[n]       |= has[:n][other].any(axis=0)
+
+        # Cộng dồn reset đầu mỗi năm: ycum[k, d] = tổng từ 01/01 năm của d đến d
+        years = self.dates.year.to_numpy()
+        cum = values.cumsum(axis=1)
+        year_start = np.searchsorted(years, years, side="left")
+        base = np.where((year_start > 0)[None, :, None], cum[:, np.maximum(year_start - 1, 0)], 0.0)
+        self._values = values
+        self._ycum   = cum - base
+        self._has    = has
+        # Vị trí ngày có dữ liệu gần nhất ≤ d (−1 nếu chưa có)
+        self._last   = np.maximum.accumulate(np.where(has, np.arange(n_days), -1), axis=1) if n_days else \
+            np.zeros((n_keys, 0), dtype=int)
+        self._years  = years
+
+    # ── Vị trí ───────────────────────────────────────────────────────────────
+    def _pos(self, date) -> int | None:
+        """Chỉ số của ``date`` trong trục ngày, hoặc None nếu nằm ngoài khoảng."""
+        if not len(self.dates):
+            return None
+        p = (pd.Timestamp(date) - self.dates[0]).days
+        return p if 0 <= p < len(self.dates) else None
+
+    def _row(self, key: str) -> int | None:
+        return self._key_idx.get(key)
+
+    def _series(self, arr: np.ndarray | None) -> pd.Series:
+        return pd.Series(np.zeros(len(METRIC_COLS)) if arr is None else arr, index=METRIC_COLS)
+
+    # ── Tra cứu ──────────────────────────────────────────────────────────────
+    def years(self, key: str = ALL) -> list[int]:
+        """Các năm có dữ liệu của ``key`` (giảm dần)."""
+        k = self._row(key)
+        if k is None:
+            return []
+        return sorted(np.unique(self._years[self._has[k]]).tolist(), reverse=True)
+
+    def data_dates(self, key: str = ALL, years=()) -> pd.DatetimeIndex:
+        """Các ngày có dữ liệu của ``key`` trong ``years`` (rỗng = mọi năm), tăng dần."""
+        k = self._row(key)
+        if k is None:
+            return pd.DatetimeIndex([])
+        mask = self._has[k] if not years else self._has[k] & np.isin(self._years, list(years))
+        return self.dates[mask]
+
+    def day(self, key: str, date) -> pd.Series:
+        """Giá trị các cột của ``key`` trong ngày ``date``."""
+        k, p = self._row(key), self._pos(date)
+        return self._series(None if k is None or p is None else self._values[k, p])
+
+    def ytd(self, key: str, year: int, upto=None) -> pd.Series:
+        """Tổng của ``key`` trong năm ``year`` tính đến hết ngày ``upto`` (None = cả năm)."""
+        k = self._row(key)
+        if k is None or not len(self.dates):
+            return self._series(None)
+        end = pd.Timestamp(year, 12, 31)
+        if upto is not None:
+            end = min(end, pd.Timestamp(upto))
+        end = min(end, self.dates[-1])
+        if end < max(pd.Timestamp(year, 1, 1), self.dates[0]):
+            return self._series(None)
+        return self._series(self._ycum[k, self._pos(end)])
+
+    def upto(self, key: str, date=None, years=()) -> pd.Series:
+        """Tổng của ``key`` trên các năm ``years`` (rỗng = mọi năm) tính đến hết ``date``."""
+        total = np.zeros(len(METRIC_COLS))
+        for y in (years or self.years(key)):
+            total += self.ytd(key, int(y), date).to_numpy()
+        return self._series(total)
+
+    def last_data_date(self, key: str, date) -> pd.Timestamp | None:
+        """Ngày có dữ liệu gần nhất ≤ ``date`` của ``key``."""
+        k = self._row(key)
+        if k is None or not len(self.dates) or pd.Timestamp(date) < self.dates[0]:
+            return None
+        p = self._pos(min(pd.Timestamp(date), self.dates[-1]))
+        last = self._last[k, p]
+        return self.dates[last] if last >= 0 else None
+
+    def day_frame(self, date, keys=None) -> pd.DataFrame:
+        """
+        Bảng (khóa × cột) của ngày ``date``, chỉ gồm các khóa có dữ liệu ngày đó.
+        Mặc định là các PROD_CODE (không gồm khóa nhóm).
+        """
+        keys = self.codes if keys is None else keys
+        p = self._pos(date)
+        rows = [k for k in keys if k in self._key_idx and p is not None and self._has[self._key_idx[k], p]]
+        data = [self._values[self._key_idx[k], p] for k in rows]
+        return pd.DataFrame(data, index=pd.Index(rows, name="PROD_CODE"), columns=METRIC_COLS)
+
+
+@dataset("metric_cube", depends=("product_series",), ttl=300)
+def load_metric_cube() -> MetricCube:
+    return MetricCube(load_product_series((), by_product=True))
+
+
+def scorecard(cube: MetricCube, key: str, years=()) -> dict | None:
+    """
+    Các đại lượng scorecard chung của một khóa cho tập năm ``years``: ngày báo
+    cáo (báo cáo chậm 1 ngày → ngày có dữ liệu áp chót), lũy kế, giá trị ngày,
+    lũy kế đến ngày trước đó và lũy kế cùng kỳ năm trước. None nếu < 2 ngày.
+    """
+    dates = cube.data_dates(key, years)
+    if len(dates) < 2:
+        return None
+    last_date = dates[-2]
+    prev_date = dates[-3] if len(dates) >= 3 else dates[0]
+
+    prev_year = int(last_date.year) - 1
+    try:
+        yoy_cutoff = last_date.replace(year=prev_year)
+    except ValueError:                    # 29/02
+        yoy_cutoff = last_date.replace(year=prev_year, day=28)
+    yoy_last = cube.last_data_date(key, yoy_cutoff)
+    if yoy_last is not None and yoy_last.year != prev_year:
+        yoy_last = None
+
+    return {
+        "last_date":  last_date,
+        "prev_date":  prev_date,
+        "prev_year":  prev_year,
+        "total":      cube.upto(key, None, years),
+        "last":       cube.day(key, last_date),
+        "prev":       cube.day(key, prev_date),
+        "cum_last":   cube.upto(key, last_date, years),
+        "cum_prev":   cube.upto(key, prev_date, years),
+        "yoy":        cube.ytd(key, prev_year, yoy_cutoff),
+        "yoy_last":   cube.day(key, yoy_last) if yoy_last is not None else None,
+    }
@@ -0,0 +1,149 @@
+"""
+motherduck.py
+-------------
+Kết nối MotherDuck dùng chung cho cả process Streamlit.
+
+Mỗi lần duckdb.connect("md:...") phải trả phí handshake + xác thực. Module này
+giữ một kết nối gốc "ấm" (st.cache_resource) và cấp cho mỗi thread một cursor
+riêng (cursor DuckDB dùng chung database instance nên không handshake lại).
+Kết nối được health-check định kỳ và tự kết nối lại khi lỗi; thời gian
+connect/query được ghi lại để theo dõi.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_HEALTH_CHECK_INTERVAL = 60   # giây — cursor nhàn rỗi lâu hơn sẽ được ping lại
+
+
+def motherduck_dsn() -> str:
+    token = os.environ.get("MOTHERDUCK_TOKEN")
+    if not token:
+        raise EnvironmentError("MOTHERDUCK_TOKEN chưa được đặt trong biến môi trường.")
+    return f"md:ipay_data?motherduck_token={token}"
+
+
+class MotherDuckPool:
+    """
+    Một kết nối gốc + cursor theo thread.
+
+    DuckDB không cho dùng chung một connection giữa các thread, nhưng
+    ``con.cursor()`` tạo connection con trỏ tới cùng database instance — rẻ và
+    an toàn theo thread. Vì vậy "pool" ở đây là một root connection cộng với
+    cursor cache theo thread; mở thêm root connection tới cùng DSN không tiết
+    kiệm được gì vì DuckDB dùng lại instance đã có.
+    """
+
+    def __init__(self, dsn: str):
+        self._dsn = dsn
+        self._lock = threading.Lock()
+        self._root: duckdb.DuckDBPyConnection | None = None
+        self._generation = 0
+        self._local = threading.local()
+        self._stats = {
+            "connect_count":   0,
+            "connect_seconds": 0.0,
+            "query_count":     0,
+            "query_seconds":   0.0,
+            "reconnect_count": 0,
+            "last_error":      None,
+        }
+
+    # ── Root connection ───────────────────────────────────────────────────────
+    def _ensure_root(self, stale_generation: int | None = None) -> tuple[duckdb.DuckDBPyConnection, int]:
+        """Trả về (root, generation); bỏ root cũ nếu caller báo generation đó đã hỏng."""
+        with self._lock:
+            if self._root is not None and stale_generation == self._generation:
+                self._stats["reconnect_count"] += 1
+                try:
+                    self._root.close()
+                except duckdb.Error:
+                    pass
+                self._root = None
+            if self._root is None:
+                t0 = time.perf_counter()
+                self._root = duckdb.connect(self._dsn)
+                self._generation += 1
+                self._stats["connect_count"] += 1
+                self._stats["connect_seconds"] += time.perf_counter() - t0
+            return self._root, self._generation
+
+    def _thread_cursor(self) -> duckdb.DuckDBPyConnection:
+        local = self._local
+        root, generation = self._ensure_root()
+        cur = getattr(local, "cursor", None)
+        if cur is None or local.generation != generation:
+            cur = root.cursor()
+            local.cursor, local.generation, local.checked_at = cur, generation, time.monotonic()
+            return cur
+        if time.monotonic() - local.checked_at > _HEALTH_CHECK_INTERVAL:
+            try:
+                cur.execute("SELECT 1").fetchone()
+            except duckdb.Error as e:
+                self._record_error(e)
+                root, generation = self._ensure_root(generation)
+                cur = root.cursor()
+                local.cursor, local.generation = cur, generation
+            local.checked_at = time.monotonic()
+        return cur
+
+    def _record_error(self, e: Exception) -> None:
+        with self._lock:
+            self._stats["last_error"] = f"{type(e).__name__}: {e}"
+
+    # ── Public API ────────────────────────────────────────────────────────────
+    @contextmanager
+    def cursor(self):
+        """Cursor của thread hiện tại; lỗi kết nối sẽ khiến lần gọi sau kết nối lại."""
+        cur = self._thread_cursor()
+        try:
+            yield cur
+        except duckdb.ConnectionException as e:
+            self._record_error(e)
+            self._ensure_root(self._local.generation)
+            raise
+        finally:
+            self._local.checked_at = time.monotonic()
+
+    def _fetch(self, sql: str, params: list | None, fetch: Callable):
+        for attempt in (1, 2):
+            t0 = time.perf_counter()
+            try:
+                with self.cursor() as cur:
+                    result = fetch(cur.execute(sql, params))
+            except duckdb.ConnectionException:
+                if attempt == 2:
+                    raise
+                continue
+            with self._lock:
+                self._stats["query_count"] += 1
+                self._stats["query_seconds"] += time.perf_counter() - t0
+            return result
+
+    def query_df(self, sql: str, params: list | None = None) -> pd.DataFrame:
+        """Chạy một câu SELECT và trả về DataFrame, có ghi thời gian."""
+        return self._fetch(sql, params, lambda res: res.df())
+
+    def query_arrow(self, sql: str, params: list | None = None) -> pa.Table:
+        """Như ``query_df`` nhưng trả về bảng Arrow (không qua pandas)."""
+        return self._fetch(sql, params, lambda res: res.fetch_arrow_table())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool() -> MotherDuckPool:
+    return MotherDuckPool(motherduck_dsn())
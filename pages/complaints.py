@@ -4,25 +4,31 @@ import pandas as pd
 import altair as alt
 from datetime import date, timedelta
 
-from data_loader import load_complaints_data
+from data_loader import (
+    SEARCH_LIMIT, fetch_complaint_page, load_complaint_daily, search_complaints,
+)
+from instrumentation import mark
+from ui_helpers import data_as_of_caption, refresh_button, refresh_error
 
 _PRODUCT_ORDER = ["Tapcare", "i-Safe", "Cyber Risk", "HomeSaving", "Sản phẩm khác"]
 _BAR_COLOR = "#456882"
 
-def _expand(df: pd.DataFrame) -> pd.DataFrame:
-    """Replicate Power BI M transform: cross-expand products × complaint_types per email."""
-    df = df.copy()
-    df["products"] = df["products"].fillna("").str.split(";")
-    df = df.explode("products")
-    df["complaint_types"] = df["complaint_types"].fillna("").str.split(";")
-    df = df.explode("complaint_types")
-    df["products"] = df["products"].str.strip()
-    df["complaint_types"] = df["complaint_types"].str.strip()
-    df = df[(df["products"] != "") & (df["complaint_types"] != "")]
-    df["Sản phẩm - Loại khiếu nại"] = df["products"] + " - " + df["complaint_types"]
+def _filter(df: pd.DataFrame, start_date, end_date, senders, priorities) -> pd.DataFrame:
+    """Lọc bảng số khiếu nại theo ngày (complaint_daily) theo khoảng "Ngày" và đơn vị tiếp nhận / mức độ ưu tiên."""
+    df = df[df["Ngày"].between(pd.Timestamp(start_date), pd.Timestamp(end_date))]
+    if senders:
+        df = df[df["sender"].isin(senders)]
+    if priorities:
+        df = df[df["priority"].isin(priorities)]
     return df
 
 
+def _count(daily: pd.DataFrame, by, name: str = "count") -> pd.DataFrame:
+    """Tổng "Số KN" theo ``by`` (các nhóm có mặt), khóa trả về dạng chuỗi."""
+    out = daily.groupby(by, observed=True)["Số KN"].sum().reset_index(name=name)
+    return out.astype({c: str for c in ([by] if isinstance(by, str) else by)})
+
+
 def _bar_with_label(data, x_field, y_field, height=220, x_sort=None, label_format=","):
     max_val = data[y_field].max() if not data.empty else 1
     bar = (
@@ -49,6 +55,34 @@ def _bar_with_label(data, x_field, y_field, height=220, x_sort=None, label_forma
     return bar + label
 
 
+def _goto_page(page: int, anchor: tuple) -> None:
+    """``anchor`` = (cursor, backward) của ``fetch_complaint_page`` để lấy trang ``page``."""
+    st.session_state["kn_page"] = page
+    st.session_state["kn_anchor"] = anchor
+
+
+def _row_key(row) -> tuple:
+    """Khóa keyset (received_date_time, id, pos) của một dòng trong trang."""
+    return row["received_date_time"].to_pydatetime(), row["id"], int(row["pos"])
+
+
+def _keyset_page(filters: tuple, page: int, anchor: tuple, total_rows: int, page_size: int) -> tuple[int, pd.DataFrame]:
+    """
+    Trang ``page`` của bảng chi tiết, lấy theo ``anchor`` = (cursor, backward)
+    mà nút lật trang đã đặt (``_goto_page``). Trả về (trang thực sự hiển thị, các dòng).
+    """
+    total_pages = max(1, -(-total_rows // page_size))
+    cursor, backward = anchor
+    if page > total_pages:          # dữ liệu ít đi sau khi làm mới → trang cuối
+        page, cursor, backward = total_pages, None, True
+    # Trang cuối lấy ngược từ cuối danh sách: chỉ gồm phần dư
+    size = total_rows - (total_pages - 1) * page_size if backward and cursor is None else page_size
+    rows = fetch_complaint_page(*filters, cursor=cursor, backward=backward, size=size)
+    if rows.empty and cursor is not None:    # không còn dòng nào sau mốc → về trang đầu
+        page, rows = 1, fetch_complaint_page(*filters, size=page_size)
+    return page, rows
+
+
 def _safe(val):
     return html.escape(str(val)) if pd.notna(val) and str(val).strip() else ""
 
@@ -73,26 +107,22 @@ def render_complaints_page():
             "BÁO CÁO KHIẾU NẠI BẢO HIỂM VBI QUA KÊNH IPAY</h1>",
             unsafe_allow_html=True,
         )
+        data_as_of_caption(("complaint_daily",))
     with col_refresh:
-        if st.button(
-            "⟳ Làm mới",
-            width="stretch",
-            help="Xóa cache và tải lại dữ liệu mới nhất từ MotherDuck",
-        ):
-            load_complaints_data.clear()
-            st.rerun()
+        refresh_button()
+    refresh_error()
 
     try:
-        raw_df = load_complaints_data()
+        daily = load_complaint_daily()
     except Exception as e:
         st.error(f"Không thể tải dữ liệu: {e}")
         return
 
-    if raw_df.empty:
+    if daily.empty:
         st.warning("Không có dữ liệu khiếu nại.")
         return
 
-    last_updated = raw_df["received_date_time"].max()
+    last_updated = daily["Nhận lần cuối"].max()
     if pd.notna(last_updated):
         st.markdown(
             f'<p style="font-size:0.75rem;color:#666;margin:0 0 0.8rem;">'
@@ -101,8 +131,9 @@ def render_complaints_page():
         )
 
     # ── Date range filter ────────────────────────────────────────────────────
-    min_date = raw_df["received_date_time"].min().date()
-    max_date = raw_df["received_date_time"].max().date()
+    mark("Bộ lọc")
+    min_date = daily["Ngày"].min().date()
+    max_date = daily["Ngày"].max().date()
 
     col_d1, col_d2, _ = st.columns([1, 1, 5])
     with col_d1:
@@ -117,12 +148,12 @@ def render_complaints_page():
         )
 
     # ── Sender + Priority filters ─────────────────────────────────────────────
-    has_sender_col = "sender" in raw_df.columns
-    has_priority_col = "priority" in raw_df.columns
+    has_sender_col = "sender" in daily.columns
+    has_priority_col = "priority" in daily.columns
 
     col_f1, col_f2, _ = st.columns([1, 1, 5])
     with col_f1:
-        all_senders = sorted(raw_df["sender"].dropna().unique().tolist()) if has_sender_col else []
+        all_senders = sorted(daily["sender"].cat.categories.tolist()) if has_sender_col else []
         sel_senders = st.multiselect(
             "Đơn vị tiếp nhận",
             options=all_senders,
@@ -131,7 +162,7 @@ def render_complaints_page():
             key="kn_sender",
         )
     with col_f2:
-        all_priorities = sorted(raw_df["priority"].dropna().unique().tolist()) if has_priority_col else []
+        all_priorities = sorted(daily["priority"].cat.categories.tolist()) if has_priority_col else []
         sel_priorities = st.multiselect(
             "Mức độ ưu tiên",
             options=all_priorities,
@@ -140,30 +171,21 @@ def render_complaints_page():
             key="kn_priority",
         )
 
-    mask = (raw_df["received_date_time"].dt.date >= start_date) & (
-        raw_df["received_date_time"].dt.date <= end_date
-    )
-    filtered = raw_df[mask]
-    if sel_senders:
-        filtered = filtered[filtered["sender"].isin(sel_senders)]
-    if sel_priorities:
-        filtered = filtered[filtered["priority"].isin(sel_priorities)]
-    df = _expand(filtered)
+    sel = _filter(daily, start_date, end_date, sel_senders, sel_priorities)
 
     # ── KPI cards ────────────────────────────────────────────────────────────
-    total_kn = len(df)
+    mark("KPI")
+    total_kn = int(sel["Số KN"].sum())
 
     # "Cao" priority count — match any value containing "cao" (case-insensitive)
     if has_priority_col:
-        kn_cao = df["priority"].str.lower().str.contains("cao", na=False).sum()
+        cao = [p for p in daily["priority"].cat.categories if "cao" in p.lower()]
+        kn_cao = int(sel.loc[sel["priority"].isin(cao), "Số KN"].sum())
     else:
         kn_cao = 0
 
-    all_df = _expand(raw_df)
-    all_days = max(
-        (raw_df["received_date_time"].max().date() - raw_df["received_date_time"].min().date()).days, 1
-    )
-    alltime_avg = len(all_df) / all_days
+    all_days = max((max_date - min_date).days, 1)
+    alltime_avg = daily["Số KN"].sum() / all_days
 
     yesterday = date.today() - timedelta(days=1)
 
@@ -185,8 +207,9 @@ def render_complaints_page():
     c3.markdown(_kpi("Số khiếu nại trung bình một ngày", f"{alltime_avg:.2f}"), unsafe_allow_html=True)
 
     # ── Expander: chi tiết hôm qua ────────────────────────────────────────────
+    mark("Chi tiết hôm qua")
     st.markdown('<div style="margin-top:12px;"></div>', unsafe_allow_html=True)
-    df_yesterday = _expand(raw_df[raw_df["received_date_time"].dt.date == yesterday])
+    df_yesterday = daily[daily["Ngày"] == pd.Timestamp(yesterday)]
     with st.expander(f"↕ Chi tiết theo Sản phẩm - Loại khiếu nại — ngày {yesterday.strftime('%d/%m/%Y')}"):
         if has_priority_col and not df_yesterday.empty:
             _PRIORITY_ORDER = ["Cao", "Trung bình", "Thấp"]
@@ -194,9 +217,7 @@ def render_complaints_page():
             priority_vals_y = [p for p in _PRIORITY_ORDER if p in _all_pris] + \
                               sorted(p for p in _all_pris if p not in _PRIORITY_ORDER)
             pivot_y = (
-                df_yesterday.groupby(["Sản phẩm - Loại khiếu nại", "priority"])
-                .size()
-                .reset_index(name="count")
+                _count(df_yesterday, ["Sản phẩm - Loại khiếu nại", "priority"])
                 .pivot(index="Sản phẩm - Loại khiếu nại", columns="priority", values="count")
                 .fillna(0)
                 .astype(int)
@@ -229,6 +250,7 @@ def render_complaints_page():
     st.markdown("<div style='height:20px'></div>", unsafe_allow_html=True)
 
     # ── Row 1: 4 bar charts ──────────────────────────────────────────────────
+    mark("Biểu đồ theo loại")
     num_days = max((end_date - start_date).days, 1)
     r1c0, r1c1, r1c2, r1c3 = st.columns(4)
 
@@ -238,8 +260,8 @@ def render_complaints_page():
             "Số khiếu nại theo mức độ ưu tiên</p>",
             unsafe_allow_html=True,
         )
-        if has_priority_col and not df.empty:
-            pri_count = df.groupby("priority").size().reset_index(name="count").sort_values("count", ascending=False)
+        if has_priority_col and not sel.empty:
+            pri_count = _count(sel, "priority").sort_values("count", ascending=False)
             st.altair_chart(_bar_with_label(pri_count, "priority", "count", height=220), width="stretch")
         else:
             st.info("Không có dữ liệu mức độ ưu tiên.")
@@ -250,7 +272,7 @@ def render_complaints_page():
             "Số khiếu nại trung bình/ngày theo sản phẩm</p>",
             unsafe_allow_html=True,
         )
-        prod_avg = df.groupby("products").size().reset_index(name="count")
+        prod_avg = _count(sel, "products")
         prod_avg["avg"] = prod_avg["count"] / num_days
         prod_avg["products"] = pd.Categorical(prod_avg["products"], categories=_PRODUCT_ORDER, ordered=True)
         prod_avg = prod_avg.dropna(subset=["products"]).sort_values("products")
@@ -275,7 +297,7 @@ def render_complaints_page():
             '<p style="font-weight:600;font-size:0.85rem;margin-bottom:4px;">'
             "Số khiếu nại theo sản phẩm</p>", unsafe_allow_html=True,
         )
-        prod_count = df.groupby("products").size().reset_index(name="count").sort_values("count", ascending=False)
+        prod_count = _count(sel, "products").sort_values("count", ascending=False)
         st.altair_chart(_bar_with_label(prod_count, "products", "count", height=220), width="stretch")
 
     with r1c3:
@@ -283,10 +305,11 @@ def render_complaints_page():
             '<p style="font-weight:600;font-size:0.85rem;margin-bottom:4px;">'
             "Số khiếu nại theo loại khiếu nại</p>", unsafe_allow_html=True,
         )
-        type_count = df.groupby("complaint_types").size().reset_index(name="count").sort_values("count", ascending=False)
+        type_count = _count(sel, "complaint_types").sort_values("count", ascending=False)
         st.altair_chart(_bar_with_label(type_count, "complaint_types", "count", height=220), width="stretch")
 
     # ── Row 2: horizontal bar + line chart (monthly, last 12 months) ─────────
+    mark("Biểu đồ theo tháng")
     r2c1, r2c2 = st.columns(2)
 
     with r2c1:
@@ -295,7 +318,7 @@ def render_complaints_page():
             "Số khiếu nại theo Sản phẩm - Loại khiếu nại</p>", unsafe_allow_html=True,
         )
         pair_count = (
-            df.groupby("Sản phẩm - Loại khiếu nại").size().reset_index(name="count")
+            _count(sel, "Sản phẩm - Loại khiếu nại")
             .nlargest(10, "count").sort_values("count", ascending=False)
         )
         h_bar = (
@@ -318,11 +341,10 @@ def render_complaints_page():
             '<p style="font-weight:600;font-size:0.85rem;margin-bottom:4px;">'
             "Số khiếu nại theo thời gian (12 tháng gần nhất)</p>", unsafe_allow_html=True,
         )
-        _latest = df["received_date_time"].max() if not df.empty else pd.Timestamp.now()
-        _cutoff = (_latest - pd.DateOffset(months=11)).replace(day=1)
-        df_time = df[df["received_date_time"] >= _cutoff].copy()
-        df_time["Tháng"] = df_time["received_date_time"].dt.to_period("M").astype(str)
-        monthly = df_time.groupby("Tháng").size().reset_index(name="Số KN")
+        _latest = sel["Ngày"].max() if not sel.empty else pd.Timestamp.now()
+        _cutoff = (_latest - pd.DateOffset(months=11)).replace(day=1).normalize()
+        df_time = sel[sel["Ngày"] >= _cutoff]
+        monthly = _count(df_time.assign(Tháng=df_time["Ngày"].dt.to_period("M").astype(str)), "Tháng", "Số KN")
 
         line = (
             alt.Chart(monthly)
@@ -342,46 +364,64 @@ def render_complaints_page():
 
 
     # ── Detail table with hover tooltip ──────────────────────────────────────
+    mark("Bảng chi tiết")
     st.markdown(
         '<p style="font-weight:600;font-size:0.85rem;margin-top:16px;margin-bottom:4px;">'
         "Chi tiết khiếu nại</p>",
         unsafe_allow_html=True,
     )
 
-    df_detail = df.copy()
-
-    has_request = "customer_request" in df_detail.columns
-    has_cause = "cause" in df_detail.columns
-
-    detail_src_cols = ["received_date_time", "Sản phẩm - Loại khiếu nại"]
-    if has_priority_col:
-        detail_src_cols.append("priority")
-    detail_src_cols.append("subject")
-    if has_request:
-        detail_src_cols.append("customer_request")
-    if has_cause:
-        detail_src_cols.append("cause")
-
-    detail = df_detail[detail_src_cols].sort_values("received_date_time", ascending=False).copy()
-    detail["received_date_time"] = detail["received_date_time"].dt.strftime("%d/%m/%Y %I:%M:%S %p")
+    search = st.text_input(
+        "Tìm kiếm khiếu nại",
+        key="kn_search",
+        placeholder="Tìm trong tiêu đề, yêu cầu KH, nguyên nhân (gõ có dấu hoặc không dấu)",
+        label_visibility="collapsed",
+    ).strip()
+    filters = (start_date, end_date, tuple(sel_senders), tuple(sel_priorities))
 
     # ── Pagination ────────────────────────────────────────────────────────────
     PAGE_SIZE = 15
-    total_rows = len(detail)
+    if search:
+        try:
+            results = search_complaints(search, *filters)
+        except Exception as e:
+            st.error(f"Không thể tìm kiếm: {e}")
+            return
+        n_emails = results["id"].nunique()
+        if n_emails == 0:
+            st.caption("Không có khiếu nại nào khớp nội dung tìm kiếm.")
+        else:
+            st.caption(
+                f"{n_emails:,} email khớp, xếp theo mức độ liên quan"
+                + (f" — hiển thị {SEARCH_LIMIT} email khớp nhất" if n_emails >= SEARCH_LIMIT else "")
+            )
+        total_rows = len(results)
+    else:
+        total_rows = total_kn
     total_pages = max(1, -(-total_rows // PAGE_SIZE))  # ceiling division
 
-    # Reset page when filters or date range change
-    _filter_key = (str(start_date), str(end_date), str(sorted(sel_senders)), str(sorted(sel_priorities)))
+    # Reset page when filters, date range or search change
+    _filter_key = (str(start_date), str(end_date), str(sorted(sel_senders)), str(sorted(sel_priorities)), search)
     if st.session_state.get("_kn_filter_key") != _filter_key:
         st.session_state["_kn_filter_key"] = _filter_key
-        st.session_state["kn_page"] = 1
+        _goto_page(1, (None, False))
 
     current_page = st.session_state.get("kn_page", 1)
-    current_page = max(1, min(current_page, total_pages))
+    if search:
+        # Kết quả tìm kiếm (tối đa SEARCH_LIMIT email) đã có đủ: phân trang theo vị trí
+        current_page = min(current_page, total_pages)
+        detail_page = results.iloc[(current_page - 1) * PAGE_SIZE:current_page * PAGE_SIZE]
+    else:
+        # Keyset trong SQL: mỗi lần lật trang là một truy vấn nhỏ
+        anchor = st.session_state.get("kn_anchor", (None, False))
+        try:
+            current_page, detail_page = _keyset_page(filters, current_page, anchor, total_rows, PAGE_SIZE)
+        except Exception as e:
+            st.error(f"Không thể tải dữ liệu: {e}")
+            return
 
-    page_start = (current_page - 1) * PAGE_SIZE
-    page_end = page_start + PAGE_SIZE
-    detail_page = detail.iloc[page_start:page_end]
+    first_key = _row_key(detail_page.iloc[0]) if not detail_page.empty else None
+    last_key = _row_key(detail_page.iloc[-1]) if not detail_page.empty else None
 
     _DT_TH = "background:#456882;color:#fff;padding:8px 10px;text-align:left;font-weight:600;white-space:nowrap;"
     _DT_TD = "padding:7px 10px;border-bottom:1px solid #f0f0f0;vertical-align:top;max-width:400px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;"
@@ -394,20 +434,18 @@ def render_complaints_page():
     )
 
     rows_html = []
-    for _, row in detail_page.iterrows():
+    for row in detail_page.to_dict("records"):
         tooltip_parts = []
-        if has_request:
-            v = _title_attr(row.get("customer_request", ""))
-            if v:
-                tooltip_parts.append(f"Yêu cầu KH: {v}")
-        if has_cause:
-            v = _title_attr(row.get("cause", ""))
-            if v:
-                tooltip_parts.append(f"Nguyên nhân tổn thất: {v}")
+        v = _title_attr(row["customer_request"])
+        if v:
+            tooltip_parts.append(f"Yêu cầu KH: {v}")
+        v = _title_attr(row["cause"])
+        if v:
+            tooltip_parts.append(f"Nguyên nhân tổn thất: {v}")
         title_attr = " | ".join(tooltip_parts)
 
         cells = (
-            f'<td style="{_DT_TD}">{_safe(row["received_date_time"])}</td>'
+            f'<td style="{_DT_TD}">{_safe(row["received_date_time"].strftime("%d/%m/%Y %I:%M:%S %p"))}</td>'
             f'<td style="{_DT_TD}">{_safe(row["Sản phẩm - Loại khiếu nại"])}</td>'
             + (f'<td style="{_DT_TD}">{_safe(row["priority"])}</td>' if has_priority_col else "")
             + f'<td style="{_DT_TD}">{_safe(row["subject"])}</td>'
@@ -426,13 +464,11 @@ def render_complaints_page():
     # ── Pagination controls ───────────────────────────────────────────────────
     pc_first, pc_prev, pc_mid, pc_next, pc_last = st.columns([1, 1, 3, 1, 1])
     with pc_first:
-        if st.button("⏮ Đầu", disabled=current_page <= 1, key="kn_first", width="stretch"):
-            st.session_state["kn_page"] = 1
-            st.rerun()
+        st.button("⏮ Đầu", disabled=current_page <= 1, key="kn_first", width="stretch",
+                  on_click=_goto_page, args=(1, (None, False)))
     with pc_prev:
-        if st.button("← Trước", disabled=current_page <= 1, key="kn_prev", width="stretch"):
-            st.session_state["kn_page"] = current_page - 1
-            st.rerun()
+        st.button("← Trước", disabled=current_page <= 1, key="kn_prev", width="stretch",
+                  on_click=_goto_page, args=(current_page - 1, (first_key, True)))
     with pc_mid:
         st.markdown(
             f'<p style="text-align:center;font-size:0.8rem;color:#666;margin:6px 0 0;">'
@@ -440,10 +476,8 @@ def render_complaints_page():
             unsafe_allow_html=True,
         )
     with pc_next:
-        if st.button("Tiếp →", disabled=current_page >= total_pages, key="kn_next", width="stretch"):
-            st.session_state["kn_page"] = current_page + 1
-            st.rerun()
+        st.button("Tiếp →", disabled=current_page >= total_pages, key="kn_next", width="stretch",
+                  on_click=_goto_page, args=(current_page + 1, (last_key, False)))
     with pc_last:
-        if st.button("Cuối ⏭", disabled=current_page >= total_pages, key="kn_last", width="stretch"):
-            st.session_state["kn_page"] = total_pages
-            st.rerun()
+        st.button("Cuối ⏭", disabled=current_page >= total_pages, key="kn_last", width="stretch",
+                  on_click=_goto_page, args=(total_pages, (None, True)))
@@ -0,0 +1,73 @@
+"""
+Trang "Chẩn đoán" (chỉ admin): thời gian render trang / từng phần, loader,
+cache và task song song theo percentile trên cửa sổ trượt (instrumentation),
+cùng trạng thái làm nóng của cache_registry.
+"""
+
+import pandas as pd
+import streamlit as st
+
+import instrumentation
+from cache_registry import registry_stats, warmup_stats
+
+_MS = st.column_config.NumberColumn(format="%.0f")
+
+
+def _table(kind: str, title: str, **extra_columns) -> None:
+    st.markdown(f"##### {title}")
+    df = instrumentation.summary(kind)
+    if df.empty:
+        st.caption("Chưa có số liệu.")
+        return
+    st.dataframe(
+        df,
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "name": st.column_config.TextColumn("Tên"),
+            "count": st.column_config.NumberColumn("Số mẫu"),
+            "errors": st.column_config.NumberColumn("Lỗi"),
+            **{c: _MS for c in ("p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms")},
+            "last_rows": st.column_config.NumberColumn("Dòng (lần cuối)", format="%d"),
+            "last_mb": st.column_config.NumberColumn("MB (lần cuối)", format="%.2f"),
+            **extra_columns,
+        },
+    )
+
+
+def render_diagnostics_page():
+    st.markdown(
+        '<h1 style="font-size:1.4rem;font-weight:700;margin-bottom:0.5rem;">CHẨN ĐOÁN HIỆU NĂNG</h1>',
+        unsafe_allow_html=True,
+    )
+    slo = instrumentation.SLO_SECONDS
+    st.caption(
+        f"Percentile trên {instrumentation.WINDOW} mẫu gần nhất của mỗi tên, tính từ khi process khởi động. "
+        f"SLO: p95 thời gian render trang ≤ {slo:g} giây (IPAY_SLO_SECONDS)."
+    )
+    breaches = instrumentation.slo_breaches(slo)
+    if breaches:
+        st.error("Vượt SLO: " + ", ".join(breaches))
+
+    col_export, col_clear, _ = st.columns([2, 2, 6])
+    with col_export:
+        st.download_button(
+            "⬇ Xuất JSONL",
+            data=instrumentation.export_jsonl(),
+            file_name=f"ipay_metrics_{pd.Timestamp.now():%Y%m%d_%H%M%S}.jsonl",
+            mime="application/jsonl",
+            width="stretch",
+        )
+    with col_clear:
+        st.button("Xóa số liệu", width="stretch", on_click=instrumentation.clear)
+
+    _table("page", "Render trang")
+    _table("section", "Các phần trong trang")
+    _table("loader", "Loader (lần tải thật)")
+    _table("cache", "Lượt gọi dataset", hit_pct=st.column_config.NumberColumn("Trúng cache", format="%.0f%%"))
+    _table("task", "Task song song (parallel_fetch)")
+
+    st.markdown("##### Kho dữ liệu")
+    stats = pd.DataFrame.from_dict(registry_stats(), orient="index")
+    warm = pd.DataFrame.from_dict(warmup_stats(), orient="index").add_prefix("warm_")
+    st.dataframe(stats.join(warm), width="stretch")
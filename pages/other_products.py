@@ -2,13 +2,67 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 
-from data_loader import load_ipay_data
+from data_loader import load_product_series
+from daily_metrics import prev_month_metrics, render_prev_month_table
+from instrumentation import mark
+from metric_cube import OTHER, load_metric_cube, scorecard
 from ui_helpers import (
     render_action_buttons, fmt_currency, kpi_card, yoy_caption,
     NAMED_PRODUCTS, PRODUCT_DISPLAY_NAMES,
 )
 
 
+# ── Helpers ───────────────────────────────────────────────────────────────────
+def _prod_label(code: str) -> str:
+    return PRODUCT_DISPLAY_NAMES.get(code, code)
+
+
+def _fmt_vnd(v: float) -> str:
+    if v >= 1_000_000_000:
+        return f"{v / 1_000_000_000:.2f} tỷ"
+    return f"{v / 1_000_000:.2f} triệu"
+
+
+def _chart_title(text: str) -> None:
+    st.markdown(
+        f'<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);'
+        f'margin:0 0 0.28rem 0;line-height:1.3;">{text}</p>',
+        unsafe_allow_html=True,
+    )
+
+
+@st.fragment
+def _detail_table(prod_full_df: pd.DataFrame, all_years: list[int], all_prod_labels: list[str]) -> None:
+    """Bảng chi tiết theo ngày: fragment — đổi Tháng/Năm/Sản phẩm chỉ chạy lại bảng, không chạy lại cả trang."""
+    _now = pd.Timestamp.now()
+    tbl_cols = st.columns([1, 1, 3])
+    with tbl_cols[0]:
+        tbl_month = st.selectbox(
+            "Tháng", options=list(range(1, 13)),
+            index=_now.month - 1, key="other_tbl_month",
+        )
+    with tbl_cols[1]:
+        tbl_year = st.selectbox(
+            "Năm", options=all_years, index=0, key="other_tbl_year",
+        )
+    with tbl_cols[2]:
+        _default_prod = ["Bảo hiểm sức khỏe"] if "Bảo hiểm sức khỏe" in all_prod_labels else []
+        tbl_prods = st.multiselect(
+            "Sản phẩm", options=all_prod_labels, default=_default_prod,
+            placeholder="Tất cả sản phẩm", key="other_tbl_prods",
+        )
+
+    _prod_filter = None
+    if tbl_prods:
+        _prod_filter = [c for c in prod_full_df["PROD_CODE"].dropna().unique() if _prod_label(c) in tbl_prods]
+    m = prev_month_metrics(prod_full_df, tbl_year, tbl_month, _prod_filter)
+
+    if m is None:
+        st.info("Không có dữ liệu cho tháng/năm đã chọn.")
+    else:
+        st.markdown(render_prev_month_table(m, _prod_label), unsafe_allow_html=True)
+
+
 def render_other_products_page():
     st.markdown(
         '<style>section[data-testid="stMain"]{zoom:1;}</style>',
@@ -19,18 +73,17 @@ def render_other_products_page():
         'BÁO CÁO SẢN PHẨM KHÁC</h1>',
         unsafe_allow_html=True,
     )
-    render_action_buttons()
+    render_action_buttons(("product_series", "metric_cube"))
 
     try:
-        full_df = load_ipay_data()
+        # "Other" products only, aggregated per (PROD_CODE, day) in DuckDB
+        prod_full_df = load_product_series(tuple(sorted(NAMED_PRODUCTS)), exclude=True, by_product=True)
     except Exception as e:
         st.error(f"Không thể tải dữ liệu: {e}")
         return
 
-    # Filter to "other" products only
-    prod_full_df = full_df[~full_df["PROD_CODE"].isin(NAMED_PRODUCTS)].copy()
-
     # ── Year filter ────────────────────────────────────────────────────────────
+    mark("Bộ lọc")
     all_years = sorted(prod_full_df["Năm"].dropna().unique().astype(int).tolist(), reverse=True)
     default_years = [2026] if 2026 in all_years else (all_years[:1] if all_years else [])
     selected_years = st.multiselect(
@@ -45,43 +98,28 @@ def render_other_products_page():
         st.warning("Không có dữ liệu cho các năm đã chọn.")
         return
 
-    # ── Sorted dates ──────────────────────────────────────────────────────────
-    sorted_dates = sorted(df["Ngày phát sinh"].unique())
-    if len(sorted_dates) < 2:
+    # ── KPI aggregates (tra từ khối chỉ số đã cache) ─────────────────────────
+    mark("KPI")
+    sc = scorecard(load_metric_cube(), OTHER, tuple(selected_years))
+    if sc is None:
         st.warning("Không đủ dữ liệu để hiển thị. Vui lòng chọn thêm năm.")
         return
+    prev_date, prev_year = sc["prev_date"], sc["prev_year"]
 
-    last_date = sorted_dates[-2]
-    prev_date = sorted_dates[-3] if len(sorted_dates) >= 3 else sorted_dates[0]
-
-    last_df = df[df["Ngày phát sinh"] == last_date]
-    prev_df = df[df["Ngày phát sinh"] == prev_date]
-
-    # ── KPI aggregates ────────────────────────────────────────────────────────
-    tong_tien    = df["Tiền thực thu"].sum()
-    tong_cap_moi = int(df["Số đơn cấp mới"].sum())
+    tong_tien    = sc["total"]["Tiền thực thu"]
+    tong_cap_moi = int(sc["total"]["Số đơn cấp mới"])
 
     # ── Deltas vs previous day ────────────────────────────────────────────────
-    delta_tien    = last_df["Tiền thực thu"].sum()
-    delta_cap_moi = int(last_df["Số đơn cấp mới"].sum())
+    delta_tien    = sc["last"]["Tiền thực thu"]
+    delta_cap_moi = int(sc["last"]["Số đơn cấp mới"])
 
     # ── YoY ───────────────────────────────────────────────────────────────────
-    current_year = int(last_date.year)
-    prev_year    = current_year - 1
-    try:
-        yoy_cutoff = last_date.replace(year=prev_year)
-    except ValueError:
-        yoy_cutoff = last_date.replace(year=prev_year, day=28)
-
-    yoy_df = prod_full_df[
-        (prod_full_df["Năm"] == prev_year) &
-        (prod_full_df["Ngày phát sinh"] <= yoy_cutoff)
-    ]
-    yoy_tien    = yoy_df["Tiền thực thu"].sum()
-    yoy_cap_moi = int(yoy_df["Số đơn cấp mới"].sum())
+    yoy_tien    = sc["yoy"]["Tiền thực thu"]
+    yoy_cap_moi = int(sc["yoy"]["Số đơn cấp mới"])
 
     # ── Scorecards ────────────────────────────────────────────────────────────
-    _prev_str = pd.Timestamp(prev_date).strftime("%d-%m-%Y")
+    mark("Scorecard")
+    _prev_str = prev_date.strftime("%d-%m-%Y")
     st.markdown(
         f'<p style="font-size:0.78rem;color:#888;margin-bottom:4px">'
         f'↕ Mũi tên xanh/đỏ: so với ngày trước đó ({_prev_str})</p>',
@@ -111,29 +149,12 @@ def render_other_products_page():
             yoy_html=yoy_caption(tong_cap_moi, yoy_cap_moi, lambda v: f"{int(v):,}", prev_year),
         ), unsafe_allow_html=True)
 
-    # ── Helpers ───────────────────────────────────────────────────────────────
-    _display_names = PRODUCT_DISPLAY_NAMES
-
-    def _prod_label(code: str) -> str:
-        return _display_names.get(code, code)
-
-    def _fmt_vnd(v: float) -> str:
-        if v >= 1_000_000_000:
-            return f"{v / 1_000_000_000:.2f} tỷ"
-        return f"{v / 1_000_000:.2f} triệu"
-
-    def _chart_title(text: str) -> None:
-        st.markdown(
-            f'<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);'
-            f'margin:0 0 0.28rem 0;line-height:1.3;">{text}</p>',
-            unsafe_allow_html=True,
-        )
-
     # ── Rolling 12-month cutoff (dùng chung cho tất cả chart theo tháng) ──────
     _latest_date = prod_full_df["Ngày phát sinh"].max()
     _cutoff_dt = (_latest_date - pd.DateOffset(months=11)).replace(day=1)
 
     # ── Row 1: Revenue by product | Revenue by month ──────────────────────────
+    mark("Doanh thu")
     st.markdown('<div style="margin-top:24px;"></div>', unsafe_allow_html=True)
     col_rev, col_trend = st.columns(2)
 
@@ -249,6 +270,7 @@ def render_other_products_page():
         st.altair_chart((m_bars + m_labels).properties(height=280), width='stretch')
 
     # ── Row 2: Average daily line charts ──────────────────────────────────────
+    mark("Trung bình ngày")
     st.markdown('<div style="margin-top:8px;"></div>', unsafe_allow_html=True)
     col_avg_rev, col_avg_new = st.columns(2)
 
@@ -340,6 +362,7 @@ def render_other_products_page():
         st.altair_chart((line_new + text_new).properties(height=240), width="stretch")
 
     # ── Row 3: New orders by product | New orders by month ────────────────────
+    mark("Cấp mới")
     st.markdown('<div style="margin-top:8px;"></div>', unsafe_allow_html=True)
     col_new_prod, col_new_month = st.columns(2)
 
@@ -443,144 +466,10 @@ def render_other_products_page():
         st.altair_chart((nm_bars + nm_labels).properties(height=280), width='stretch')
 
     # ── Detail table ──────────────────────────────────────────────────────────
-    import calendar as _cal
-
+    mark("Bảng chi tiết")
     st.markdown('<div style="margin-top:28px;"></div>', unsafe_allow_html=True)
     _chart_title("Bảng chi tiết theo ngày")
 
-    _now = pd.Timestamp.now()
-    tbl_cols = st.columns([1, 1, 3])
-    with tbl_cols[0]:
-        tbl_month = st.selectbox(
-            "Tháng", options=list(range(1, 13)),
-            index=_now.month - 1, key="other_tbl_month",
-        )
-    with tbl_cols[1]:
-        tbl_year = st.selectbox(
-            "Năm", options=all_years, index=0, key="other_tbl_year",
-        )
-    with tbl_cols[2]:
-        _default_prod = ["Bảo hiểm sức khỏe"] if "Bảo hiểm sức khỏe" in all_prod_labels else []
-        tbl_prods = st.multiselect(
-            "Sản phẩm", options=all_prod_labels, default=_default_prod,
-            placeholder="Tất cả sản phẩm", key="other_tbl_prods",
-        )
-
-    # Build prev-month lookup keyed by (date, prod_code)
-    daily_all = (
-        prod_full_df.groupby(["Ngày phát sinh", "PROD_CODE"], as_index=False)
-        .agg(tien=("Tiền thực thu", "sum"), cap_moi=("Số đơn cấp mới", "sum"))
-    )
-    _lkmap = daily_all.set_index(["Ngày phát sinh", "PROD_CODE"])[["tien", "cap_moi"]].to_dict(orient="index")
-
-    def _prev_month_date(d):
-        y, m, day = d.year, d.month, d.day
-        if m == 1:
-            y, m = y - 1, 12
-        else:
-            m -= 1
-        return d.replace(year=y, month=m, day=min(day, _cal.monthrange(y, m)[1]))
-
-    def _lk(d, prod, field):
-        prev = _prev_month_date(d)
-        return float(_lkmap.get((prev, prod), {}).get(field, 0.0))
-
-    def _arrow(cur, ref, higher_is_good=True):
-        if ref == 0:
-            return f'<span style="color:{"#2e7d32" if higher_is_good else "#c62828"}">▲&nbsp;</span>' if cur > 0 else ""
-        if cur > ref:
-            return f'<span style="color:{"#2e7d32" if higher_is_good else "#c62828"}">▲&nbsp;</span>'
-        if cur < ref:
-            return f'<span style="color:{"#c62828" if higher_is_good else "#2e7d32"}">▼&nbsp;</span>'
-        return ""
-
-    # Filter to selected month/year/products
-    day_df = (
-        prod_full_df[
-            (prod_full_df["Ngày phát sinh"].dt.month == tbl_month) &
-            (prod_full_df["Năm"] == tbl_year)
-        ]
-        .groupby(["Ngày phát sinh", "PROD_CODE"], as_index=False)
-        .agg(tien=("Tiền thực thu", "sum"), cap_moi=("Số đơn cấp mới", "sum"))
-    )
-    if tbl_prods:
-        day_df = day_df[day_df["PROD_CODE"].map(_prod_label).isin(tbl_prods)]
-
-    if day_df.empty:
-        st.info("Không có dữ liệu cho tháng/năm đã chọn.")
-    else:
-        # Expand to all days in month for each product present
-        prods_in_data = day_df["PROD_CODE"].unique().tolist()
-        _month_start = pd.Timestamp(tbl_year, tbl_month, 1)
-        _full_dates = pd.date_range(_month_start, periods=_month_start.days_in_month, freq="D")
-        full_grid = pd.DataFrame(
-            [(d, p) for d in _full_dates for p in prods_in_data],
-            columns=["Ngày phát sinh", "PROD_CODE"],
-        )
-        day_df = full_grid.merge(day_df, on=["Ngày phát sinh", "PROD_CODE"], how="left").fillna(0.0)
-        day_df = day_df.sort_values(["Ngày phát sinh", "PROD_CODE"]).reset_index(drop=True)
-
-        tot_cap_moi = tot_cap_moi_pm = tot_tien = tot_tien_pm = 0.0
-        html_rows = []
-        for i, r in day_df.iterrows():
-            d        = r["Ngày phát sinh"]
-            prod     = r["PROD_CODE"]
-            cap_moi  = r["cap_moi"]
-            tien     = r["tien"]
-            cap_moi_pm = _lk(d, prod, "cap_moi")
-            tien_pm    = _lk(d, prod, "tien")
-
-            tot_cap_moi    += cap_moi
-            tot_cap_moi_pm += cap_moi_pm
-            tot_tien       += tien
-            tot_tien_pm    += tien_pm
-
-            bg = "#ffffff" if i % 2 == 0 else "#f8f9fa"
-            html_rows.append(
-                f'<tr style="background:{bg};">'
-                f'<td style="padding:4px 8px;font-weight:500;">{d.strftime("%d-%m-%Y")}</td>'
-                f'<td style="padding:4px 8px;">{_prod_label(prod)}</td>'
-                f'<td style="padding:4px 8px;text-align:right;">'
-                f'{_arrow(cap_moi, cap_moi_pm)}{int(cap_moi):,}</td>'
-                f'<td style="padding:4px 8px;text-align:right;color:#888;">{int(cap_moi_pm):,}</td>'
-                f'<td style="padding:4px 8px;text-align:right;">'
-                f'{_arrow(tien, tien_pm)}{tien:,.0f}</td>'
-                f'<td style="padding:4px 8px;text-align:right;color:#888;">{tien_pm:,.0f}</td>'
-                f'</tr>'
-            )
-
-        total_row = (
-            f'<tr style="background:#2C4C7B;color:white;font-weight:600;">'
-            f'<td style="padding:5px 8px;" colspan="2">Tổng</td>'
-            f'<td style="padding:5px 8px;text-align:right;">{int(tot_cap_moi):,}</td>'
-            f'<td style="padding:5px 8px;text-align:right;opacity:0.75;">{int(tot_cap_moi_pm):,}</td>'
-            f'<td style="padding:5px 8px;text-align:right;">{tot_tien:,.0f}</td>'
-            f'<td style="padding:5px 8px;text-align:right;opacity:0.75;">{tot_tien_pm:,.0f}</td>'
-            f'</tr>'
-        )
-
-        _HEADERS = [
-            ("Ngày",                       "left",  "14%"),
-            ("Sản phẩm",                   "left",  "22%"),
-            ("Đơn cấp mới",                "right", "16%"),
-            ("Đơn cùng ngày tháng trước",  "right", "16%"),
-            ("Tiền thực thu",              "right", "16%"),
-            ("Tiền TT tháng trước",        "right", "16%"),
-        ]
-        col_defs = "".join(f'<col style="width:{w};">' for _, _, w in _HEADERS)
-        header_html = "".join(
-            f'<th style="padding:6px 8px;text-align:{align};white-space:nowrap;">{h}</th>'
-            for h, align, _ in _HEADERS
-        )
-        st.markdown(
-            f'<div style="overflow-x:auto;margin-top:4px;">'
-            f'<table style="width:100%;border-collapse:collapse;font-size:0.75rem;table-layout:fixed;">'
-            f'<colgroup>{col_defs}</colgroup>'
-            f'<thead><tr style="background:#2C4C7B;color:white;">{header_html}</tr></thead>'
-            f'<tbody>{"".join(html_rows)}</tbody>'
-            f'<tfoot>{total_row}</tfoot>'
-            f'</table></div>',
-            unsafe_allow_html=True,
-        )
+    _detail_table(prod_full_df, all_years, all_prod_labels)
 
     st.markdown('<div style="margin-bottom:32px;"></div>', unsafe_allow_html=True)
@@ -3,8 +3,10 @@ import pandas as pd
 import altair as alt
 
 from data_loader import load_ipay_data
+from instrumentation import mark
+from metric_cube import ALL, load_metric_cube, scorecard
 from ui_helpers import (
-    render_action_buttons, fmt_currency, kpi_card, yoy_caption,
+    render_action_buttons, fmt_currency, kpi_card, yoy_caption, group_products,
     NAMED_PRODUCTS, PRODUCT_DISPLAY_NAMES,
 )
 
@@ -18,6 +20,342 @@ def _chart_title(text: str) -> None:
     )
 
 
+# ── Biểu đồ có bộ lọc riêng ──────────────────────────────────────────────────
+# Mỗi biểu đồ kèm bộ lọc là một fragment: đổi bộ lọc chỉ chạy lại fragment đó
+# (không tính lại KPI / gửi lại các biểu đồ khác). Đầu vào chung là bảng tổng
+# theo (nhóm sản phẩm, năm, tháng) tính một lần ở lượt chạy đầy đủ; lượt chạy
+# của fragment dùng lại đúng bảng đó.
+_DISPLAY_NAMES = PRODUCT_DISPLAY_NAMES
+_SUM_COLS = ["Tiền thực thu", "Số đơn cấp mới", "Số đơn cấp tái tục", "Số đơn hủy webview"]
+_CAP_COLORS = ["#6A415E", "#B07A9E"]
+_HUY_COLORS = ["#d71149", "#FF6B8A"]
+_LOAI_RAW_MAP = {"Số đơn cấp mới": "Cấp mới", "Số đơn hủy webview": "Hủy"}
+
+
+def _build_nhom_scale(years: list) -> tuple:
+    domain = [f"Cấp mới {y}" for y in years] + [f"Hủy {y}" for y in years]
+    rng    = [_CAP_COLORS[i % 2] for i in range(len(years))] + \
+             [_HUY_COLORS[i % 2] for i in range(len(years))]
+    return domain, rng
+
+
+def _month_product_totals(df: pd.DataFrame) -> pd.DataFrame:
+    """Tổng các cột ``_SUM_COLS`` theo (PROD_CODE đã gộp nhóm, Năm, Tháng) — giữ cả khóa NULL."""
+    return (
+        df.assign(PROD_CODE=group_products(df["PROD_CODE"]), Tháng=df["Ngày phát sinh"].dt.month)
+        .groupby(["PROD_CODE", "Năm", "Tháng"], as_index=False, dropna=False)[_SUM_COLS]
+        .sum()
+    )
+
+
+@st.fragment
+def _revenue_by_product(totals: pd.DataFrame) -> None:
+    _chart_title("Tiền thực thu theo sản phẩm")
+    selected_months = st.multiselect(
+        "Lọc tháng",
+        options=list(range(1, 13)),
+        default=[],
+        placeholder="Tất cả tháng",
+        key="rev_prod_months",
+    )
+    df_prod = totals[totals["Tháng"].isin(selected_months)] if selected_months else totals
+    chart_df = (
+        df_prod
+        .groupby(["PROD_CODE", "Năm"], as_index=False)["Tiền thực thu"]
+        .sum()
+        .assign(Năm=lambda x: x["Năm"].astype(str))
+    )
+    chart_df["label"] = chart_df["Tiền thực thu"].apply(fmt_currency)
+    chart_df["PROD_CODE"] = chart_df["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c))
+    prod_order = (
+        chart_df.groupby("PROD_CODE")["Tiền thực thu"]
+        .sum()
+        .sort_values(ascending=False)
+        .index.tolist()
+    )
+    bars = (
+        alt.Chart(chart_df)
+        .mark_bar()
+        .encode(
+            x=alt.X("PROD_CODE:N", title=None, sort=prod_order, axis=alt.Axis(labelAngle=0, labelLimit=0)),
+            y=alt.Y("Tiền thực thu:Q", title=None, axis=None),
+            color=alt.Color("Năm:N", title="Năm", legend=None, scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
+            xOffset=alt.XOffset("Năm:N"),
+            tooltip=[
+                alt.Tooltip("PROD_CODE:N", title="Sản phẩm"),
+                alt.Tooltip("Năm:N", title="Năm"),
+                alt.Tooltip("label:N", title="Tiền thực thu"),
+            ],
+        )
+    )
+    labels = (
+        alt.Chart(chart_df)
+        .mark_text(dy=-6, fontSize=12, fontWeight="normal")
+        .encode(
+            x=alt.X("PROD_CODE:N", sort=prod_order),
+            y=alt.Y("Tiền thực thu:Q"),
+            color=alt.Color("Năm:N", scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
+            xOffset=alt.XOffset("Năm:N"),
+            text=alt.Text("label:N"),
+        )
+    )
+    st.altair_chart((bars + labels).properties(height=280), width='stretch')
+
+
+@st.fragment
+def _revenue_by_month(totals: pd.DataFrame) -> None:
+    _chart_title("Tiền thực thu theo tháng")
+    prod_options = [_DISPLAY_NAMES.get(p, p) for p in sorted(NAMED_PRODUCTS)] + ["Sản phẩm khác"]
+    selected_trend_prods = st.multiselect(
+        "Lọc sản phẩm",
+        options=prod_options,
+        default=[],
+        placeholder="Tất cả sản phẩm",
+        key="rev_month_prods",
+    )
+    if selected_trend_prods:
+        df_trend = totals[totals["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c)).isin(selected_trend_prods)]
+    else:
+        df_trend = totals
+    monthly_df = (
+        df_trend.assign(Năm=df_trend["Năm"].astype(str))
+        .groupby(["Năm", "Tháng"], as_index=False)["Tiền thực thu"]
+        .sum()
+    )
+    year_list = monthly_df["Năm"].unique().tolist()
+    full_grid = pd.DataFrame(
+        [(y, m) for y in year_list for m in range(1, 13)],
+        columns=["Năm", "Tháng"],
+    )
+    monthly_df = full_grid.merge(monthly_df, on=["Năm", "Tháng"], how="left").fillna(0)
+    monthly_df["label"] = monthly_df["Tiền thực thu"].apply(fmt_currency)
+    m_bars = (
+        alt.Chart(monthly_df)
+        .mark_bar()
+        .encode(
+            x=alt.X("Tháng:O", title=None, axis=alt.Axis(labelAngle=0)),
+            y=alt.Y("Tiền thực thu:Q", title=None, axis=None),
+            color=alt.Color("Năm:N", title=None, legend=None, scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
+            xOffset=alt.XOffset("Năm:N"),
+            tooltip=[
+                alt.Tooltip("Tháng:O", title="Tháng"),
+                alt.Tooltip("Năm:N", title="Năm"),
+                alt.Tooltip("label:N", title="Tiền thực thu"),
+            ],
+        )
+    )
+    m_labels = (
+        alt.Chart(monthly_df[monthly_df["Tiền thực thu"] > 0])
+        .mark_text(dy=-6, fontSize=12, fontWeight="normal")
+        .encode(
+            x=alt.X("Tháng:O"),
+            y=alt.Y("Tiền thực thu:Q"),
+            color=alt.Color("Năm:N", scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
+            xOffset=alt.XOffset("Năm:N"),
+            text=alt.Text("label:N"),
+        )
+    )
+    st.altair_chart((m_bars + m_labels).properties(height=280), width='stretch')
+
+
+@st.fragment
+def _cancel_rate_by_product(totals: pd.DataFrame) -> None:
+    _chart_title("Tỷ lệ hủy chủ động theo sản phẩm")
+    selected_months_huy = st.multiselect(
+        "Lọc tháng",
+        options=list(range(1, 13)),
+        default=[],
+        placeholder="Tất cả tháng",
+        key="huy_prod_months",
+    )
+    df_huy = totals[totals["Tháng"].isin(selected_months_huy)] if selected_months_huy else totals
+    huy_prod_df = (
+        df_huy
+        .groupby("PROD_CODE", as_index=False)
+        .agg(
+            huy=("Số đơn hủy webview", "sum"),
+            cap=("Số đơn cấp mới", "sum"),
+            tai_tuc=("Số đơn cấp tái tục", "sum"),
+        )
+    )
+    huy_prod_df["Tỷ lệ hủy"] = huy_prod_df["huy"] / (huy_prod_df["cap"] + huy_prod_df["tai_tuc"]).replace(0, float("nan"))
+    huy_prod_df = huy_prod_df[huy_prod_df["PROD_CODE"] != "Sản phẩm khác"]
+    huy_prod_df["PROD_CODE"] = huy_prod_df["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c))
+    huy_prod_df = huy_prod_df.sort_values("Tỷ lệ hủy", ascending=False)
+    huy_prod_df["label"] = huy_prod_df["Tỷ lệ hủy"].apply(lambda v: f"{v:.2%}")
+    huy_order = huy_prod_df["PROD_CODE"].tolist()
+    huy_bars = (
+        alt.Chart(huy_prod_df)
+        .mark_bar(color="#d71149")
+        .encode(
+            x=alt.X("PROD_CODE:N", sort=huy_order, title=None, axis=alt.Axis(labelAngle=0, labelLimit=0)),
+            y=alt.Y("Tỷ lệ hủy:Q", title=None, axis=None),
+            tooltip=[
+                alt.Tooltip("PROD_CODE:N", title="Sản phẩm"),
+                alt.Tooltip("label:N", title="Tỷ lệ hủy"),
+            ],
+        )
+    )
+    huy_labels = (
+        alt.Chart(huy_prod_df)
+        .mark_text(dy=-8, fontSize=12, fontWeight="normal", color="#d71149")
+        .encode(
+            x=alt.X("PROD_CODE:N", sort=huy_order),
+            y=alt.Y("Tỷ lệ hủy:Q"),
+            text=alt.Text("label:N"),
+        )
+    )
+    st.altair_chart(
+        (huy_bars + huy_labels).properties(height=266),
+        width='stretch',
+    )
+
+
+@st.fragment
+def _new_cancel_by_product(totals: pd.DataFrame) -> None:
+    _chart_title("Số đơn cấp mới và số đơn hủy theo sản phẩm")
+    selected_months_new = st.multiselect(
+        "Lọc tháng",
+        options=list(range(1, 13)),
+        default=[],
+        placeholder="Tất cả tháng",
+        key="new_prod_months",
+    )
+    df_new_prod = totals[totals["Tháng"].isin(selected_months_new)] if selected_months_new else totals
+    new_prod_agg = (
+        df_new_prod
+        .groupby(["PROD_CODE", "Năm"], as_index=False)[["Số đơn cấp mới", "Số đơn hủy webview"]]
+        .sum()
+        .assign(Năm=lambda x: x["Năm"].astype(str))
+    )
+    new_prod_agg["PROD_CODE"] = new_prod_agg["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c))
+    new_prod_order = (
+        new_prod_agg.groupby("PROD_CODE")["Số đơn cấp mới"]
+        .sum()
+        .sort_values(ascending=False)
+        .index.tolist()
+    )
+    years_np = sorted(new_prod_agg["Năm"].unique().tolist())
+    nhom_domain_np, nhom_range_np = _build_nhom_scale(years_np)
+    np_melted = (
+        new_prod_agg
+        .melt(
+            id_vars=["PROD_CODE", "Năm"],
+            value_vars=["Số đơn cấp mới", "Số đơn hủy webview"],
+            var_name="Loại_raw", value_name="Số đơn",
+        )
+        .assign(Loại=lambda x: x["Loại_raw"].map(_LOAI_RAW_MAP))
+    )
+    np_melted["Nhóm"]  = np_melted["Loại"] + " " + np_melted["Năm"]
+    np_melted["label"] = np_melted["Số đơn"].apply(lambda v: f"{int(v):,}")
+    _np_color = alt.Color(
+        "Nhóm:N",
+        legend=None,
+        scale=alt.Scale(domain=nhom_domain_np, range=nhom_range_np),
+    )
+    np_bars = (
+        alt.Chart(np_melted)
+        .mark_bar()
+        .encode(
+            x=alt.X("PROD_CODE:N", title=None, sort=new_prod_order, axis=alt.Axis(labelAngle=0, labelFontSize=11, labelLimit=0)),
+            y=alt.Y("Số đơn:Q", title=None, axis=None),
+            xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_np),
+            color=_np_color,
+            tooltip=[
+                alt.Tooltip("PROD_CODE:N", title="Sản phẩm"),
+                alt.Tooltip("Loại:N", title="Loại"),
+                alt.Tooltip("Năm:N", title="Năm"),
+                alt.Tooltip("Số đơn:Q", title="Số đơn", format=",.0f"),
+            ],
+        )
+    )
+    np_labels = (
+        alt.Chart(np_melted[np_melted["Số đơn"] > 0])
+        .mark_text(dy=-6, fontSize=11, fontWeight="normal")
+        .encode(
+            x=alt.X("PROD_CODE:N", sort=new_prod_order),
+            y=alt.Y("Số đơn:Q"),
+            xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_np),
+            color=alt.Color("Nhóm:N", scale=alt.Scale(domain=nhom_domain_np, range=nhom_range_np)),
+            text=alt.Text("label:N"),
+        )
+    )
+    st.altair_chart((np_bars + np_labels).properties(height=266), width='stretch')
+
+
+@st.fragment
+def _new_cancel_by_month(totals: pd.DataFrame) -> None:
+    _chart_title("Số đơn cấp mới và số đơn hủy theo tháng")
+    selected_new_prods = st.multiselect(
+        "Lọc sản phẩm",
+        options=[_DISPLAY_NAMES.get(p, p) for p in sorted(NAMED_PRODUCTS)] + ["Sản phẩm khác"],
+        default=[],
+        placeholder="Tất cả sản phẩm",
+        key="new_month_prods",
+    )
+    if selected_new_prods:
+        df_new_month = totals[totals["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c)).isin(selected_new_prods)]
+    else:
+        df_new_month = totals
+    new_monthly_agg = (
+        df_new_month.assign(Năm=df_new_month["Năm"].astype(str))
+        .groupby(["Năm", "Tháng"], as_index=False)[["Số đơn cấp mới", "Số đơn hủy webview"]]
+        .sum()
+    )
+    year_list_new = new_monthly_agg["Năm"].unique().tolist()
+    full_grid_new = pd.DataFrame(
+        [(y, m) for y in year_list_new for m in range(1, 13)],
+        columns=["Năm", "Tháng"],
+    )
+    new_monthly_agg = full_grid_new.merge(new_monthly_agg, on=["Năm", "Tháng"], how="left").fillna(0)
+    years_nm = sorted(new_monthly_agg["Năm"].unique().tolist())
+    nhom_domain_nm, nhom_range_nm = _build_nhom_scale(years_nm)
+    nm_melted = (
+        new_monthly_agg
+        .melt(
+            id_vars=["Năm", "Tháng"],
+            value_vars=["Số đơn cấp mới", "Số đơn hủy webview"],
+            var_name="Loại_raw", value_name="Số đơn",
+        )
+        .assign(Loại=lambda x: x["Loại_raw"].map(_LOAI_RAW_MAP))
+    )
+    nm_melted["Nhóm"] = nm_melted["Loại"] + " " + nm_melted["Năm"]
+    _nm_color = alt.Color(
+        "Nhóm:N",
+        legend=None,
+        scale=alt.Scale(domain=nhom_domain_nm, range=nhom_range_nm),
+    )
+    nm_bars = (
+        alt.Chart(nm_melted)
+        .mark_bar()
+        .encode(
+            x=alt.X("Tháng:O", title=None, axis=alt.Axis(labelAngle=0)),
+            y=alt.Y("Số đơn:Q", title=None, axis=None),
+            xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_nm),
+            color=_nm_color,
+            tooltip=[
+                alt.Tooltip("Tháng:O", title="Tháng"),
+                alt.Tooltip("Loại:N", title="Loại"),
+                alt.Tooltip("Năm:N", title="Năm"),
+                alt.Tooltip("Số đơn:Q", title="Số đơn", format=",.0f"),
+            ],
+        )
+    )
+    nm_melted["label"] = nm_melted["Số đơn"].apply(lambda v: f"{int(v):,}" if v > 0 else "")
+    nm_labels = (
+        alt.Chart(nm_melted[nm_melted["Số đơn"] > 0])
+        .mark_text(dy=-6, fontSize=11, fontWeight="normal")
+        .encode(
+            x=alt.X("Tháng:O"),
+            y=alt.Y("Số đơn:Q"),
+            xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_nm),
+            color=alt.Color("Nhóm:N", scale=alt.Scale(domain=nhom_domain_nm, range=nhom_range_nm)),
+            text=alt.Text("label:N"),
+        )
+    )
+    st.altair_chart((nm_bars + nm_labels).properties(height=266), width='stretch')
+
+
 def render_overview_page():
     st.markdown(
         '<style>section[data-testid="stMain"]{zoom:1;}</style>',
@@ -28,15 +366,17 @@ def render_overview_page():
         'BÁO CÁO TỔNG QUAN BẢO HIỂM VBI QUA KÊNH IPAY</h1>',
         unsafe_allow_html=True,
     )
-    render_action_buttons()
+    render_action_buttons(("ipay_data", "metric_cube"))
 
     try:
         full_df = load_ipay_data()
     except Exception as e:
         st.error(f"Không thể tải dữ liệu: {e}")
         return
+    full_df.attrs.clear()   # fingerprint của cập nhật tăng dần — Streamlit không serialize được bytes
 
     # ── Filters ──────────────────────────────────────────────────────────────
+    mark("Bộ lọc")
     all_years = sorted(full_df["Năm"].dropna().unique().astype(int).tolist(), reverse=True)
     selected_years = st.multiselect(
         "Năm",
@@ -46,91 +386,56 @@ def render_overview_page():
     )
     df = full_df[full_df["Năm"].isin(selected_years)] if selected_years else full_df
 
-    # ── Compute KPIs ─────────────────────────────────────────────────────────
-    tong_tien = df["Tiền thực thu"].sum()
-    tong_cap_moi = int(df["Số đơn cấp mới"].sum())
-    tong_tai_tuc = int(df["Số đơn cấp tái tục"].sum())
-
-    sorted_dates = sorted(df["Ngày phát sinh"].unique())
-    last_date = sorted_dates[-2]
-    prev_date = sorted_dates[-3] if len(sorted_dates) >= 2 else None
+    # ── Compute KPIs (tra từ khối chỉ số đã cache) ───────────────────────────
+    mark("KPI")
+    cube = load_metric_cube()
+    sc = scorecard(cube, ALL, tuple(selected_years))
+    if sc is None:
+        st.warning("Không đủ dữ liệu để hiển thị. Vui lòng chọn thêm năm.")
+        return
+    last_date, prev_date, prev_year = sc["last_date"], sc["prev_date"], sc["prev_year"]
+    total, last, cum_last, cum_prev = sc["total"], sc["last"], sc["cum_last"], sc["cum_prev"]
 
-    last_df = df[df["Ngày phát sinh"] == last_date]
-    prev_df = df[df["Ngày phát sinh"] == prev_date] if prev_date is not None else None
+    tong_tien    = total["Tiền thực thu"]
+    tong_cap_moi = int(total["Số đơn cấp mới"])
+    tong_tai_tuc = int(total["Số đơn cấp tái tục"])
 
-    kh_hien_huu = int(last_df["Số đơn có hiệu lực"].sum())
+    kh_hien_huu = int(last["Số đơn có hiệu lực"])
 
-    tong_huy = df["Số đơn hủy webview"].sum()
+    tong_huy = total["Số đơn hủy webview"]
     tong_cap_tai_tuc = tong_cap_moi + tong_tai_tuc
     ty_le_huy = tong_huy / tong_cap_tai_tuc if tong_cap_tai_tuc > 0 else 0
 
     # ── YoY comparison (cùng kỳ năm trước) ───────────────────────────────────
-    current_year = int(last_date.year)
-    prev_year    = current_year - 1
-    try:
-        yoy_cutoff = last_date.replace(year=prev_year)
-    except ValueError:                          # leap-day guard
-        yoy_cutoff = last_date.replace(year=prev_year, day=28)
-
-    yoy_df = full_df[
-        (full_df["Năm"] == prev_year) &
-        (full_df["Ngày phát sinh"] <= yoy_cutoff)
-    ]
-    yoy_tien    = yoy_df["Tiền thực thu"].sum()
-    yoy_cap_moi = int(yoy_df["Số đơn cấp mới"].sum())
-    # ── Shared alias ─────────────────────────────────────────────────────────
-    _DISPLAY_NAMES = PRODUCT_DISPLAY_NAMES
+    yoy_tien    = sc["yoy"]["Tiền thực thu"]
+    yoy_cap_moi = int(sc["yoy"]["Số đơn cấp mới"])
 
     # ── Deltas — giá trị tuyệt đối của last_date (báo cáo chậm 1 ngày) ───────
-    delta_tien    = last_df["Tiền thực thu"].sum()
-    delta_cap_moi = int(last_df["Số đơn cấp mới"].sum())
-    delta_tai_tuc = int(last_df["Số đơn cấp tái tục"].sum())
+    delta_tien    = last["Tiền thực thu"]
+    delta_cap_moi = int(last["Số đơn cấp mới"])
 
     # Stock metric: delta = change in Số đơn có hiệu lực vs prev day
-    kh_prev      = int(prev_df["Số đơn có hiệu lực"].sum()) if prev_df is not None else kh_hien_huu
-    delta_kh     = kh_hien_huu - kh_prev
+    delta_kh     = kh_hien_huu - int(sc["prev"]["Số đơn có hiệu lực"])
 
     # Rate metric: delta = cumulative rate up to last_date vs cumulative rate up to prev_date
-    tong_tai_tuc_dk = df["Số đơn tái tục dự kiến"].sum()
+    tong_tai_tuc_dk = total["Số đơn tái tục dự kiến"]
     ty_le_tai_tuc = tong_tai_tuc / tong_tai_tuc_dk if tong_tai_tuc_dk > 0 else 0.0
 
-    if prev_date is not None:
-        cum_last    = df[df["Ngày phát sinh"] <= last_date]
-        cum_prev    = df[df["Ngày phát sinh"] <= prev_date]
-        last_denom  = cum_last["Số đơn cấp mới"].sum() + cum_last["Số đơn cấp tái tục"].sum()
-        last_ty_le  = cum_last["Số đơn hủy webview"].sum() / last_denom if last_denom > 0 else 0
-        prev_denom  = cum_prev["Số đơn cấp mới"].sum() + cum_prev["Số đơn cấp tái tục"].sum()
-        prev_ty_le  = cum_prev["Số đơn hủy webview"].sum() / prev_denom if prev_denom > 0 else 0
-        delta_ty_le = last_ty_le - prev_ty_le
-
-        last_ttdk   = cum_last["Số đơn tái tục dự kiến"].sum()
-        last_tt_rate  = cum_last["Số đơn cấp tái tục"].sum() / last_ttdk if last_ttdk > 0 else 0.0
-        prev_ttdk   = cum_prev["Số đơn tái tục dự kiến"].sum()
-        prev_tt_rate  = cum_prev["Số đơn cấp tái tục"].sum() / prev_ttdk if prev_ttdk > 0 else 0.0
-        delta_tai_tuc_rate = last_tt_rate - prev_tt_rate
-    else:
-        delta_ty_le = 0.0
-        delta_tai_tuc_rate = 0.0
-
-    # ── Product breakdown for scorecard tooltips ──────────────────────────────
-    def _grp(s: pd.Series) -> pd.Series:
-        return s.where(s.isin(NAMED_PRODUCTS), other="Sản phẩm khác")
-
-    last_grp     = last_df.assign(PROD_CODE=lambda x: _grp(x["PROD_CODE"]))
-    tien_by_prod = last_grp.groupby("PROD_CODE")["Tiền thực thu"].sum().sort_values(ascending=False)
-    cap_by_prod  = last_grp.groupby("PROD_CODE")["Số đơn cấp mới"].sum().sort_values(ascending=False)
-    tai_by_prod  = last_grp.groupby("PROD_CODE")["Số đơn cấp tái tục"].sum().sort_values(ascending=False)
-    huy_by_prod  = last_grp.groupby("PROD_CODE")["Số đơn hủy webview"].sum().sort_values(ascending=False)
-
-    last_kh_prod = last_grp.groupby("PROD_CODE")["Số đơn có hiệu lực"].sum()
-    if prev_df is not None:
-        prev_kh_prod  = prev_df.assign(PROD_CODE=lambda x: _grp(x["PROD_CODE"])).groupby("PROD_CODE")["Số đơn có hiệu lực"].sum()
-        kh_delta_prod = last_kh_prod.subtract(prev_kh_prod, fill_value=0).sort_values(ascending=False)
-    else:
-        kh_delta_prod = last_kh_prod.sort_values(ascending=False)
+    last_denom  = cum_last["Số đơn cấp mới"] + cum_last["Số đơn cấp tái tục"]
+    last_ty_le  = cum_last["Số đơn hủy webview"] / last_denom if last_denom > 0 else 0
+    prev_denom  = cum_prev["Số đơn cấp mới"] + cum_prev["Số đơn cấp tái tục"]
+    prev_ty_le  = cum_prev["Số đơn hủy webview"] / prev_denom if prev_denom > 0 else 0
+    delta_ty_le = last_ty_le - prev_ty_le
+
+    last_ttdk   = cum_last["Số đơn tái tục dự kiến"]
+    last_tt_rate  = cum_last["Số đơn cấp tái tục"] / last_ttdk if last_ttdk > 0 else 0.0
+    prev_ttdk   = cum_prev["Số đơn tái tục dự kiến"]
+    prev_tt_rate  = cum_prev["Số đơn cấp tái tục"] / prev_ttdk if prev_ttdk > 0 else 0.0
+    delta_tai_tuc_rate = last_tt_rate - prev_tt_rate
 
     # ── Scorecards ───────────────────────────────────────────────────────────
-    _prev_str = pd.Timestamp(prev_date).strftime("%d-%m-%Y") if prev_date is not None else "N/A"
+    mark("Scorecard")
+    _prev_str = prev_date.strftime("%d-%m-%Y")
     st.markdown(
         f'<p style="font-size:0.78rem;color:#888;margin-bottom:4px">'
         f'↕ Mũi tên xanh/đỏ: so với ngày trước đó ({_prev_str})</p>',
@@ -194,27 +499,19 @@ def render_overview_page():
         ), unsafe_allow_html=True)
 
     # ── Expander: delta chi tiết theo sản phẩm ───────────────────────────────
+    mark("Chi tiết theo sản phẩm")
     st.markdown('<div style="margin-top:20px;"></div>', unsafe_allow_html=True)
     _exp_date = pd.Timestamp(last_date).strftime("%d/%m/%Y")
     with st.expander(f"↕ Chi tiết thay đổi theo sản phẩm — ngày {_exp_date}"):
         # Raw per-product series (không gộp "Sản phẩm khác")
-        _agg = last_df.groupby("PROD_CODE").agg({
-            "Tiền thực thu":      "sum",
-            "Số đơn cấp mới":     "sum",
-            "Số đơn cấp tái tục": "sum",
-            "Số đơn hủy webview": "sum",
-            "Số đơn có hiệu lực": "sum",
-        })
+        _agg = cube.day_frame(last_date)
         _raw_tien    = _agg["Tiền thực thu"]
         _raw_cap     = _agg["Số đơn cấp mới"]
         _raw_tai     = _agg["Số đơn cấp tái tục"]
         _raw_huy     = _agg["Số đơn hủy webview"]
         _raw_kh_last = _agg["Số đơn có hiệu lực"]
-        if prev_df is not None:
-            _raw_kh_prev = prev_df.groupby("PROD_CODE")["Số đơn có hiệu lực"].sum()
-            _raw_kh_delta = _raw_kh_last.subtract(_raw_kh_prev, fill_value=0)
-        else:
-            _raw_kh_delta = _raw_kh_last
+        _raw_kh_prev = cube.day_frame(prev_date)["Số đơn có hiệu lực"]
+        _raw_kh_delta = _raw_kh_last.subtract(_raw_kh_prev, fill_value=0)
 
         _BAN_KEM = [
             "ISAFE_CYBER", "MIX_01", "TAPCARE", "VTB_HOMESAVING",
@@ -266,20 +563,11 @@ def render_overview_page():
         st.markdown("**Sản phẩm bán lẻ**")
         _show_table(_build_rows(_BAN_LE))
 
-    # ── Shared helpers ────────────────────────────────────────────────────────
-    def _group_prod(series: pd.Series) -> pd.Series:
-        return series.where(series.isin(NAMED_PRODUCTS), other="Sản phẩm khác")
-
     # ── KH hiện hữu — pie chart mỗi sản phẩm ────────────────────────────────
+    mark("KH hiện hữu")
     kh_prod_df = (
-        df[df["Ngày phát sinh"] == last_date]
-        .assign(PROD_CODE=lambda x: _group_prod(x["PROD_CODE"]))
-        .groupby("PROD_CODE", as_index=False)[["Số đơn có hiệu lực", "Số đơn tạm ngưng"]]
-        .sum()
-    )
-    kh_prod_df = (
-        kh_prod_df[kh_prod_df["PROD_CODE"].isin(NAMED_PRODUCTS)]
-        .copy()
+        cube.day_frame(last_date, keys=sorted(NAMED_PRODUCTS))[["Số đơn có hiệu lực", "Số đơn tạm ngưng"]]
+        .reset_index()
     )
     kh_prod_df["total"] = kh_prod_df["Số đơn có hiệu lực"] + kh_prod_df["Số đơn tạm ngưng"]
     kh_prod_df = kh_prod_df.sort_values("total", ascending=False).reset_index(drop=True)
@@ -344,345 +632,23 @@ def render_overview_page():
     st.markdown('<div style="margin-bottom:32px;"></div>', unsafe_allow_html=True)
 
     # ── Row 1: revenue by product | revenue by month ─────────────────────────
+    mark("Doanh thu")
+    totals = _month_product_totals(df)
     col_rev, col_trend = st.columns(2)
-
-    # ── Chart 1: Tiền thực thu theo sản phẩm ─────────────────────────────────
     with col_rev:
-        _chart_title("Tiền thực thu theo sản phẩm")
-        selected_months = st.multiselect(
-            "Lọc tháng",
-            options=list(range(1, 13)),
-            default=[],
-            placeholder="Tất cả tháng",
-            key="rev_prod_months",
-        )
-        df_prod = (
-            df[df["Ngày phát sinh"].dt.month.isin(selected_months)]
-            if selected_months else df
-        )
-        chart_df = (
-            df_prod.assign(
-                PROD_CODE=lambda x: x["PROD_CODE"].where(
-                    x["PROD_CODE"].isin(NAMED_PRODUCTS), other="Sản phẩm khác"
-                )
-            )
-            .groupby(["PROD_CODE", "Năm"], as_index=False)["Tiền thực thu"]
-            .sum()
-            .assign(Năm=lambda x: x["Năm"].astype(str))
-        )
-        chart_df["label"] = chart_df["Tiền thực thu"].apply(fmt_currency)
-        chart_df["PROD_CODE"] = chart_df["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c))
-        prod_order = (
-            chart_df.groupby("PROD_CODE")["Tiền thực thu"]
-            .sum()
-            .sort_values(ascending=False)
-            .index.tolist()
-        )
-        bars = (
-            alt.Chart(chart_df)
-            .mark_bar()
-            .encode(
-                x=alt.X("PROD_CODE:N", title=None, sort=prod_order, axis=alt.Axis(labelAngle=0, labelLimit=0)),
-                y=alt.Y("Tiền thực thu:Q", title=None, axis=None),
-                color=alt.Color("Năm:N", title="Năm", legend=None, scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
-                xOffset=alt.XOffset("Năm:N"),
-                tooltip=[
-                    alt.Tooltip("PROD_CODE:N", title="Sản phẩm"),
-                    alt.Tooltip("Năm:N", title="Năm"),
-                    alt.Tooltip("label:N", title="Tiền thực thu"),
-                ],
-            )
-        )
-        labels = (
-            alt.Chart(chart_df)
-            .mark_text(dy=-6, fontSize=12, fontWeight="normal")
-            .encode(
-                x=alt.X("PROD_CODE:N", sort=prod_order),
-                y=alt.Y("Tiền thực thu:Q"),
-                color=alt.Color("Năm:N", scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
-                xOffset=alt.XOffset("Năm:N"),
-                text=alt.Text("label:N"),
-            )
-        )
-        st.altair_chart((bars + labels).properties(height=280), width='stretch')
-
-    # ── Chart 2: Tiền thực thu theo tháng (bar) ───────────────────────────────
+        _revenue_by_product(totals)
     with col_trend:
-        _chart_title("Tiền thực thu theo tháng")
-        prod_options = [_DISPLAY_NAMES.get(p, p) for p in sorted(NAMED_PRODUCTS)] + ["Sản phẩm khác"]
-        selected_trend_prods = st.multiselect(
-            "Lọc sản phẩm",
-            options=prod_options,
-            default=[],
-            placeholder="Tất cả sản phẩm",
-            key="rev_month_prods",
-        )
-        if selected_trend_prods:
-            mask = _group_prod(df["PROD_CODE"]).map(lambda c: _DISPLAY_NAMES.get(c, c)).isin(selected_trend_prods)
-            df_trend = df[mask]
-        else:
-            df_trend = df
-        monthly_df = (
-            df_trend.assign(
-                Tháng=df_trend["Ngày phát sinh"].dt.month,
-                Năm=df_trend["Năm"].astype(str),
-            )
-            .groupby(["Năm", "Tháng"], as_index=False)["Tiền thực thu"]
-            .sum()
-        )
-        year_list = monthly_df["Năm"].unique().tolist()
-        full_grid = pd.DataFrame(
-            [(y, m) for y in year_list for m in range(1, 13)],
-            columns=["Năm", "Tháng"],
-        )
-        monthly_df = full_grid.merge(monthly_df, on=["Năm", "Tháng"], how="left").fillna(0)
-        monthly_df["label"] = monthly_df["Tiền thực thu"].apply(fmt_currency)
-        m_bars = (
-            alt.Chart(monthly_df)
-            .mark_bar()
-            .encode(
-                x=alt.X("Tháng:O", title=None, axis=alt.Axis(labelAngle=0)),
-                y=alt.Y("Tiền thực thu:Q", title=None, axis=None),
-                color=alt.Color("Năm:N", title=None, legend=None, scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
-                xOffset=alt.XOffset("Năm:N"),
-                tooltip=[
-                    alt.Tooltip("Tháng:O", title="Tháng"),
-                    alt.Tooltip("Năm:N", title="Năm"),
-                    alt.Tooltip("label:N", title="Tiền thực thu"),
-                ],
-            )
-        )
-        m_labels = (
-            alt.Chart(monthly_df[monthly_df["Tiền thực thu"] > 0])
-            .mark_text(dy=-6, fontSize=12, fontWeight="normal")
-            .encode(
-                x=alt.X("Tháng:O"),
-                y=alt.Y("Tiền thực thu:Q"),
-                color=alt.Color("Năm:N", scale=alt.Scale(range=["#2C4C7B", "#6B9ED4"])),
-                xOffset=alt.XOffset("Năm:N"),
-                text=alt.Text("label:N"),
-            )
-        )
-        st.altair_chart((m_bars + m_labels).properties(height=280), width='stretch')
-
-    # ── Row 2: Tỷ lệ hủy | Cấp mới + hủy theo sản phẩm | Cấp mới + hủy theo tháng ──
-    _CAP_COLORS = ["#6A415E", "#B07A9E"]
-    _HUY_COLORS = ["#d71149", "#FF6B8A"]
-    _LOAI_RAW_MAP = {"Số đơn cấp mới": "Cấp mới", "Số đơn hủy webview": "Hủy"}
-
-    def _build_nhom_scale(years: list) -> tuple:
-        domain = [f"Cấp mới {y}" for y in years] + [f"Hủy {y}" for y in years]
-        rng    = [_CAP_COLORS[i % 2] for i in range(len(years))] + \
-                 [_HUY_COLORS[i % 2] for i in range(len(years))]
-        return domain, rng
+        _revenue_by_month(totals)
 
+    # ── Row 2: Tỷ lệ hủy | Cấp mới + hủy theo sản phẩm ──────────────────────────
+    mark("Tỷ lệ hủy + cấp mới")
     col_huy, col_new_prod = st.columns(2)
-
-    # ── Chart: Tỷ lệ hủy chủ động theo sản phẩm ─────────────────────────────
     with col_huy:
-        _chart_title("Tỷ lệ hủy chủ động theo sản phẩm")
-        selected_months_huy = st.multiselect(
-            "Lọc tháng",
-            options=list(range(1, 13)),
-            default=[],
-            placeholder="Tất cả tháng",
-            key="huy_prod_months",
-        )
-        df_huy = (
-            df[df["Ngày phát sinh"].dt.month.isin(selected_months_huy)]
-            if selected_months_huy else df
-        )
-        huy_prod_df = (
-            df_huy.assign(PROD_CODE=lambda x: _group_prod(x["PROD_CODE"]))
-            .groupby("PROD_CODE", as_index=False)
-            .agg(
-                huy=("Số đơn hủy webview", "sum"),
-                cap=("Số đơn cấp mới", "sum"),
-                tai_tuc=("Số đơn cấp tái tục", "sum"),
-            )
-        )
-        huy_prod_df["Tỷ lệ hủy"] = huy_prod_df["huy"] / (huy_prod_df["cap"] + huy_prod_df["tai_tuc"]).replace(0, float("nan"))
-        huy_prod_df = huy_prod_df[huy_prod_df["PROD_CODE"] != "Sản phẩm khác"]
-        huy_prod_df["PROD_CODE"] = huy_prod_df["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c))
-        huy_prod_df = huy_prod_df.sort_values("Tỷ lệ hủy", ascending=False)
-        huy_prod_df["label"] = huy_prod_df["Tỷ lệ hủy"].apply(lambda v: f"{v:.2%}")
-        huy_order = huy_prod_df["PROD_CODE"].tolist()
-        huy_bars = (
-            alt.Chart(huy_prod_df)
-            .mark_bar(color="#d71149")
-            .encode(
-                x=alt.X("PROD_CODE:N", sort=huy_order, title=None, axis=alt.Axis(labelAngle=0, labelLimit=0)),
-                y=alt.Y("Tỷ lệ hủy:Q", title=None, axis=None),
-                tooltip=[
-                    alt.Tooltip("PROD_CODE:N", title="Sản phẩm"),
-                    alt.Tooltip("label:N", title="Tỷ lệ hủy"),
-                ],
-            )
-        )
-        huy_labels = (
-            alt.Chart(huy_prod_df)
-            .mark_text(dy=-8, fontSize=12, fontWeight="normal", color="#d71149")
-            .encode(
-                x=alt.X("PROD_CODE:N", sort=huy_order),
-                y=alt.Y("Tỷ lệ hủy:Q"),
-                text=alt.Text("label:N"),
-            )
-        )
-        st.altair_chart(
-            (huy_bars + huy_labels).properties(height=266),
-            width='stretch',
-        )
-
-    # ── Chart: Số đơn cấp mới và số đơn hủy theo sản phẩm ───────────────────
+        _cancel_rate_by_product(totals)
     with col_new_prod:
-        _chart_title("Số đơn cấp mới và số đơn hủy theo sản phẩm")
-        selected_months_new = st.multiselect(
-            "Lọc tháng",
-            options=list(range(1, 13)),
-            default=[],
-            placeholder="Tất cả tháng",
-            key="new_prod_months",
-        )
-        df_new_prod = (
-            df[df["Ngày phát sinh"].dt.month.isin(selected_months_new)]
-            if selected_months_new else df
-        )
-        new_prod_agg = (
-            df_new_prod.assign(
-                PROD_CODE=lambda x: x["PROD_CODE"].where(
-                    x["PROD_CODE"].isin(NAMED_PRODUCTS), other="Sản phẩm khác"
-                )
-            )
-            .groupby(["PROD_CODE", "Năm"], as_index=False)[["Số đơn cấp mới", "Số đơn hủy webview"]]
-            .sum()
-            .assign(Năm=lambda x: x["Năm"].astype(str))
-        )
-        new_prod_agg["PROD_CODE"] = new_prod_agg["PROD_CODE"].map(lambda c: _DISPLAY_NAMES.get(c, c))
-        new_prod_order = (
-            new_prod_agg.groupby("PROD_CODE")["Số đơn cấp mới"]
-            .sum()
-            .sort_values(ascending=False)
-            .index.tolist()
-        )
-        years_np = sorted(new_prod_agg["Năm"].unique().tolist())
-        nhom_domain_np, nhom_range_np = _build_nhom_scale(years_np)
-        np_melted = (
-            new_prod_agg
-            .melt(
-                id_vars=["PROD_CODE", "Năm"],
-                value_vars=["Số đơn cấp mới", "Số đơn hủy webview"],
-                var_name="Loại_raw", value_name="Số đơn",
-            )
-            .assign(Loại=lambda x: x["Loại_raw"].map(_LOAI_RAW_MAP))
-        )
-        np_melted["Nhóm"]  = np_melted["Loại"] + " " + np_melted["Năm"]
-        np_melted["label"] = np_melted["Số đơn"].apply(lambda v: f"{int(v):,}")
-        _np_color = alt.Color(
-            "Nhóm:N",
-            legend=None,
-            scale=alt.Scale(domain=nhom_domain_np, range=nhom_range_np),
-        )
-        np_bars = (
-            alt.Chart(np_melted)
-            .mark_bar()
-            .encode(
-                x=alt.X("PROD_CODE:N", title=None, sort=new_prod_order, axis=alt.Axis(labelAngle=0, labelFontSize=11, labelLimit=0)),
-                y=alt.Y("Số đơn:Q", title=None, axis=None),
-                xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_np),
-                color=_np_color,
-                tooltip=[
-                    alt.Tooltip("PROD_CODE:N", title="Sản phẩm"),
-                    alt.Tooltip("Loại:N", title="Loại"),
-                    alt.Tooltip("Năm:N", title="Năm"),
-                    alt.Tooltip("Số đơn:Q", title="Số đơn", format=",.0f"),
-                ],
-            )
-        )
-        np_labels = (
-            alt.Chart(np_melted[np_melted["Số đơn"] > 0])
-            .mark_text(dy=-6, fontSize=11, fontWeight="normal")
-            .encode(
-                x=alt.X("PROD_CODE:N", sort=new_prod_order),
-                y=alt.Y("Số đơn:Q"),
-                xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_np),
-                color=alt.Color("Nhóm:N", scale=alt.Scale(domain=nhom_domain_np, range=nhom_range_np)),
-                text=alt.Text("label:N"),
-            )
-        )
-        st.altair_chart((np_bars + np_labels).properties(height=266), width='stretch')
+        _new_cancel_by_product(totals)
 
     # ── Row 4: Số đơn cấp mới và số đơn hủy theo tháng ──────────────────────
+    mark("Cấp mới + hủy theo tháng")
     st.markdown('<div style="margin-top:8px;"></div>', unsafe_allow_html=True)
-    _chart_title("Số đơn cấp mới và số đơn hủy theo tháng")
-    selected_new_prods = st.multiselect(
-        "Lọc sản phẩm",
-        options=[_DISPLAY_NAMES.get(p, p) for p in sorted(NAMED_PRODUCTS)] + ["Sản phẩm khác"],
-        default=[],
-        placeholder="Tất cả sản phẩm",
-        key="new_month_prods",
-    )
-    if selected_new_prods:
-        mask_new = _group_prod(df["PROD_CODE"]).map(lambda c: _DISPLAY_NAMES.get(c, c)).isin(selected_new_prods)
-        df_new_month = df[mask_new]
-    else:
-        df_new_month = df
-    new_monthly_agg = (
-        df_new_month.assign(
-            Tháng=df_new_month["Ngày phát sinh"].dt.month,
-            Năm=df_new_month["Năm"].astype(str),
-        )
-        .groupby(["Năm", "Tháng"], as_index=False)[["Số đơn cấp mới", "Số đơn hủy webview"]]
-        .sum()
-    )
-    year_list_new = new_monthly_agg["Năm"].unique().tolist()
-    full_grid_new = pd.DataFrame(
-        [(y, m) for y in year_list_new for m in range(1, 13)],
-        columns=["Năm", "Tháng"],
-    )
-    new_monthly_agg = full_grid_new.merge(new_monthly_agg, on=["Năm", "Tháng"], how="left").fillna(0)
-    years_nm = sorted(new_monthly_agg["Năm"].unique().tolist())
-    nhom_domain_nm, nhom_range_nm = _build_nhom_scale(years_nm)
-    nm_melted = (
-        new_monthly_agg
-        .melt(
-            id_vars=["Năm", "Tháng"],
-            value_vars=["Số đơn cấp mới", "Số đơn hủy webview"],
-            var_name="Loại_raw", value_name="Số đơn",
-        )
-        .assign(Loại=lambda x: x["Loại_raw"].map(_LOAI_RAW_MAP))
-    )
-    nm_melted["Nhóm"] = nm_melted["Loại"] + " " + nm_melted["Năm"]
-    _nm_color = alt.Color(
-        "Nhóm:N",
-        legend=None,
-        scale=alt.Scale(domain=nhom_domain_nm, range=nhom_range_nm),
-    )
-    nm_bars = (
-        alt.Chart(nm_melted)
-        .mark_bar()
-        .encode(
-            x=alt.X("Tháng:O", title=None, axis=alt.Axis(labelAngle=0)),
-            y=alt.Y("Số đơn:Q", title=None, axis=None),
-            xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_nm),
-            color=_nm_color,
-            tooltip=[
-                alt.Tooltip("Tháng:O", title="Tháng"),
-                alt.Tooltip("Loại:N", title="Loại"),
-                alt.Tooltip("Năm:N", title="Năm"),
-                alt.Tooltip("Số đơn:Q", title="Số đơn", format=",.0f"),
-            ],
-        )
-    )
-    nm_melted["label"] = nm_melted["Số đơn"].apply(lambda v: f"{int(v):,}" if v > 0 else "")
-    nm_labels = (
-        alt.Chart(nm_melted[nm_melted["Số đơn"] > 0])
-        .mark_text(dy=-6, fontSize=11, fontWeight="normal")
-        .encode(
-            x=alt.X("Tháng:O"),
-            y=alt.Y("Số đơn:Q"),
-            xOffset=alt.XOffset("Nhóm:N", sort=nhom_domain_nm),
-            color=alt.Color("Nhóm:N", scale=alt.Scale(domain=nhom_domain_nm, range=nhom_range_nm)),
-            text=alt.Text("label:N"),
-        )
-    )
-    st.altair_chart((nm_bars + nm_labels).properties(height=266), width='stretch')
+    _new_cancel_by_month(totals)
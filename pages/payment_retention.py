@@ -13,10 +13,14 @@ Trang phân tích tỉ lệ thu phí và duy trì đóng phí theo kỳ.
 import streamlit as st
 import pandas as pd
 import altair as alt
-import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
+from cohort_matrix import load_cohort_matrix
 from data_loader import load_all_payment_tracking, load_portfolio_health, load_payment_retention_by_ky_thu
-from ui_helpers import kpi_card
+from instrumentation import mark
+from parallel_fetch import fetch_parallel
+from ui_helpers import chart_table, data_as_of_caption, kpi_card, refresh_button, refresh_error
 
 _PRODUCTS = ["Cyber Risk", "HomeSaving", "I-Safe", "TapCare"]
 
@@ -344,9 +348,11 @@ def _render_scorecard(
 
 # ── Tab Q1: Hiệu quả thu trong kỳ ────────────────────────────────────────────
 
-def _render_q1_tab(df_ky: pd.DataFrame, products: list[str]) -> None:
-    df = df_ky[df_ky["san_pham"].isin(products) & (df_ky["ky"] >= 2)].copy()
-    if df.empty:
+def _render_q1_tab(products: list[str]) -> None:
+    # Ma trận cohort × kỳ build sẵn mỗi lần dữ liệu đổi — đổi sản phẩm chỉ chọn lại bảng
+    matrix = load_cohort_matrix()
+    shown = matrix.available(products)
+    if not shown:
         st.info("Không có dữ liệu.")
         return
 
@@ -357,44 +363,12 @@ def _render_q1_tab(df_ky: pd.DataFrame, products: list[str]) -> None:
         "Vùng trống góc phải = kỳ chưa đến hạn với các hợp đồng mới."
     )
 
-    grp_hm = (
-        df.groupby(["san_pham", "cohort_month", "ky", "trang_thai"])["so_gcn"]
-        .sum()
-        .reset_index()
-    )
-    wide_hm = grp_hm.pivot_table(
-        index=["san_pham", "cohort_month", "ky"],
-        columns="trang_thai",
-        values="so_gcn",
-        aggfunc="sum",
-    ).fillna(0).reset_index()
-    wide_hm.columns.name = None
-    if "da_thu" not in wide_hm.columns:
-        wide_hm["da_thu"] = 0
-    if "chua_thu_qua_han" not in wide_hm.columns:
-        wide_hm["chua_thu_qua_han"] = 0
-
-    da_hm   = np.array(wide_hm["da_thu"].fillna(0), dtype=float)
-    chua_hm = np.array(wide_hm["chua_thu_qua_han"].fillna(0), dtype=float)
-    tong_hm = da_hm + chua_hm
-    wide_hm["ty_le"] = np.where(
-        tong_hm > 0,
-        np.round(da_hm / np.where(tong_hm > 0, tong_hm, 1.0), 4),
-        np.nan,
-    )
-    wide_hm["cohort_str"]    = wide_hm["cohort_month"].dt.strftime("%Y-%m")
-    wide_hm["ty_le_pct_str"] = wide_hm["ty_le"].apply(
-        lambda x: f"{x*100:.1f}%" if pd.notna(x) else "—"
-    )
-
-    n_hm = len(wide_hm["san_pham"].unique())
-    cols_hm = st.columns(min(n_hm, 2))
-    for i, sp in enumerate(sorted(wide_hm["san_pham"].unique())):
-        sp_df = wide_hm[wide_hm["san_pham"] == sp].copy()
+    cols_hm = st.columns(min(len(shown), 2))
+    for i, sp in enumerate(shown):
         with cols_hm[i % 2]:
             st.markdown(f"**{sp}**")
             hm_chart = (
-                alt.Chart(sp_df)
+                alt.Chart(matrix.table(sp))
                 .mark_rect(stroke="white", strokeWidth=0.5)
                 .encode(
                     x=alt.X(
@@ -422,7 +396,7 @@ def _render_q1_tab(df_ky: pd.DataFrame, products: list[str]) -> None:
                         alt.Tooltip("chua_thu_qua_han:Q", title="Quá hạn chưa thu", format=","),
                     ],
                 )
-                .properties(height=max(200, len(sp_df["ky"].unique()) * 30 + 60))
+                .properties(height=max(200, matrix.n_kys(sp) * 30 + 60))
             )
             st.altair_chart(hm_chart, width="stretch")
 
@@ -465,7 +439,7 @@ def _render_q2_tab(df_health: pd.DataFrame, products: list[str]) -> None:
     ]
 
     for i, sp in enumerate(sp_list):
-        sp_df = df[df["san_pham"] == sp]
+        sp_df = chart_table(df[df["san_pham"] == sp], ["thang", "ty_le_pct", "thang_str", "gcn_fmt", "hl_fmt"])
         sp_color = _PRODUCT_COLORS.get(sp, "#1f77b4")
         line = (
             alt.Chart(sp_df)
@@ -595,13 +569,29 @@ _MONTH_NAMES = {
 }
 
 
-def _render_payment_date_table(df_date: pd.DataFrame, df_month: pd.DataFrame, products: list[str]) -> None:
+def _month_slice(tbl: pa.Table, year: int | None, month: int | None) -> pd.DataFrame:
+    """Các dòng của ``tbl`` thuộc tháng ``month``/``year`` — chỉ phần này được chuyển sang pandas."""
+    if year is None or month is None:
+        return tbl.slice(0, 0).to_pandas()
+    ngay = tbl["ngay_tra_ky_k"]
+    return tbl.filter(pc.and_(pc.equal(pc.year(ngay), year), pc.equal(pc.month(ngay), month))).to_pandas()
+
+
+@st.fragment
+def _render_payment_date_table(tbl_date: pa.Table, df_month: pd.DataFrame, products: list[str]) -> None:
+    """
+    Tab trạng thái thu phí theo ngày. Là fragment: đổi Năm / Tháng / Kỳ /
+    khoảng ngày (pdt_*) chỉ chạy lại tab này, với đầu vào của lượt chạy đầy đủ gần nhất.
+    """
     st.markdown("#### Trạng thái thu phí theo ngày")
 
-    df_filtered = df_date[df_date["san_pham"].isin(products)].copy()
+    tbl = tbl_date.filter(pc.is_in(
+        tbl_date["san_pham"], value_set=pa.array(products, type=tbl_date.schema.field("san_pham").type),
+    ))
+    years = pc.year(tbl["ngay_tra_ky_k"])
 
     # ── Filters: Năm | Tháng | Kỳ thu phí ───────────────────────────────────
-    available_years = sorted(df_filtered["ngay_tra_ky_k"].dt.year.unique(), reverse=True)
+    available_years = sorted(pc.unique(years).drop_null().to_pylist(), reverse=True)
 
     fc1, fc2, fc3 = st.columns([1, 1, 2])
     with fc1:
@@ -610,9 +600,8 @@ def _render_payment_date_table(df_date: pd.DataFrame, df_month: pd.DataFrame, pr
         )
     with fc2:
         months_in_year = sorted(
-            df_filtered[df_filtered["ngay_tra_ky_k"].dt.year == selected_year][
-                "ngay_tra_ky_k"
-            ].dt.month.unique(),
+            pc.unique(pc.month(tbl["ngay_tra_ky_k"]).filter(pc.equal(years, selected_year))).to_pylist()
+            if selected_year is not None else [],
             reverse=True,
         )
         _prev_month_num = (pd.Timestamp.now() - pd.DateOffset(months=1)).month
@@ -627,10 +616,7 @@ def _render_payment_date_table(df_date: pd.DataFrame, df_month: pd.DataFrame, pr
         )
 
     # Data cả tháng — dùng cho charts và bảng
-    df_month_data = df_filtered[
-        (df_filtered["ngay_tra_ky_k"].dt.year == selected_year)
-        & (df_filtered["ngay_tra_ky_k"].dt.month == selected_month)
-    ].copy()
+    df_month_data = _month_slice(tbl, selected_year, selected_month)
 
     with fc3:
         available_ky = sorted(df_month_data["ky"].unique())
@@ -678,7 +664,7 @@ def _render_payment_date_table(df_date: pd.DataFrame, df_month: pd.DataFrame, pr
             {"da_thu": "Đã thu kỳ tiếp", "chua_thu": "Chưa thu kỳ tiếp"}
         )
         bar = (
-            alt.Chart(melted)
+            alt.Chart(chart_table(melted, ["ngay", "trang_thai", "so_gcn"]))
             .mark_bar()
             .encode(
                 x=alt.X("ngay:O", title="Ngày", axis=alt.Axis(labelAngle=0)),
@@ -850,31 +836,33 @@ def render_payment_retention_page():
             "PHÂN TÍCH THU PHÍ VÀ DUY TRÌ ĐÓNG PHÍ THEO KỲ</h1>",
             unsafe_allow_html=True,
         )
+        data_as_of_caption(("payment_tracking", "portfolio_health", "retention_by_ky_thu"))
     with col_refresh:
-        if st.button(
-            "⟳ Làm mới",
-            width="stretch",
-            help="Xóa cache và tải lại dữ liệu mới nhất từ MotherDuck",
-        ):
-            load_all_payment_tracking.clear()
-            load_portfolio_health.clear()
-            load_payment_retention_by_ky_thu.clear()
-            st.rerun()
+        refresh_button()
+    refresh_error()
 
     # ── Load data ─────────────────────────────────────────────────────────────
-    try:
-        df_ky, df_month, df_date = load_all_payment_tracking()
-        df_health = load_portfolio_health()
-        df_retention = load_payment_retention_by_ky_thu()
-    except Exception as e:
-        st.error(f"Không thể tải dữ liệu: {e}")
+    mark("Tải dữ liệu")
+    # Ba dataset độc lập → tải song song; lần tải nguội chỉ chờ dataset chậm nhất
+    results = fetch_parallel({
+        "payment_tracking":    load_all_payment_tracking,
+        "portfolio_health":    load_portfolio_health,
+        "retention_by_ky_thu": load_payment_retention_by_ky_thu,
+    })
+    errors = [f"{name}: {r.error}" for name, r in results.items() if not r.ok]
+    if errors:
+        st.error("Không thể tải dữ liệu: " + "; ".join(errors))
         st.info(
             "Chạy lệnh sau để xây dựng các bảng tracking:\n"
             "```\npython Scripts/transform_data/build_payment_tracking.py\n```"
         )
         return
+    df_ky, df_month, tbl_date = results["payment_tracking"].value
+    df_health = results["portfolio_health"].value
+    df_retention = results["retention_by_ky_thu"].value
 
     # ── Global filters ────────────────────────────────────────────────────────
+    mark("Bộ lọc")
     selected_products = st.segmented_control(
         "Sản phẩm",
         options=_PRODUCTS,
@@ -885,8 +873,9 @@ def render_payment_retention_page():
 
     f_col2, f_col3 = st.columns([3, 1])
     with f_col2:
-        d_min = df_date["ngay_tra_ky_k"].min().date()
-        d_max = df_date["ngay_tra_ky_k"].max().date()
+        d_range = pc.min_max(tbl_date["ngay_tra_ky_k"])
+        d_min = d_range["min"].as_py().date()
+        d_max = d_range["max"].as_py().date()
         date_range = st.date_input(
             "Khoảng thời gian",
             value=(d_min, d_max),
@@ -908,13 +897,12 @@ def render_payment_retention_page():
         st.warning("Vui lòng chọn ít nhất một sản phẩm.")
         return
 
-    # Apply date filter to df_date and df_month
+    # Apply date filter to tbl_date and df_month
     if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
         d_start = pd.Timestamp(date_range[0])
         d_end   = pd.Timestamp(date_range[1])
-        df_date  = df_date[
-            df_date["ngay_tra_ky_k"].between(d_start, d_end)
-        ]
+        ngay = tbl_date["ngay_tra_ky_k"]
+        tbl_date = tbl_date.filter(pc.and_(pc.greater_equal(ngay, d_start), pc.less_equal(ngay, d_end)))
         df_month = df_month[
             df_month["thang_tra_ky_k"].between(
                 d_start.to_period("M").to_timestamp(),
@@ -925,6 +913,7 @@ def render_payment_retention_page():
     st.divider()
 
     # ── Scorecard ─────────────────────────────────────────────────────────────
+    mark("Scorecard")
     _render_scorecard(df_ky, df_month, df_health, df_retention, selected_products)
 
     st.divider()
@@ -938,13 +927,17 @@ def render_payment_retention_page():
     ])
 
     with tab1:
-        _render_q1_tab(df_ky, selected_products)
+        mark("Thu phí theo tháng hiệu lực")
+        _render_q1_tab(selected_products)
 
     with tab2:
+        mark("Thu phí theo tháng thu phí")
         _render_q2_tab(df_health, selected_products)
 
     with tab3:
+        mark("Duy trì theo kỳ")
         _render_retention_curve(df_retention, selected_products, min_gcn)
 
     with tab4:
-        _render_payment_date_table(df_date, df_month, selected_products)
+        mark("Trạng thái theo ngày")
+        _render_payment_date_table(tbl_date, df_month, selected_products)
@@ -0,0 +1,464 @@
+"""
+Trang chi tiết sản phẩm dùng chung cho Cyber Risk, I-Safe, TapCare và Nhà và bạn.
+
+Mọi khác biệt giữa các sản phẩm nằm trong ``ProductSpec`` (product_metrics);
+số liệu lấy từ ``load_product_metrics`` / ``product_kpis`` đã cache theo sản phẩm.
+"""
+
+import streamlit as st
+import pandas as pd
+import altair as alt
+
+from data_loader import load_thu_phi_by_day
+from daily_metrics import doi_soat_by_day, month_metrics, render_daily_table
+from instrumentation import mark
+from product_metrics import ProductMetrics, ProductSpec, load_product_metrics, product_kpis
+from ui_helpers import render_action_buttons, fmt_currency, kpi_card, yoy_caption
+
+
+@st.fragment
+def _daily_table(spec: ProductSpec, metrics: ProductMetrics, all_years: list[int]) -> None:
+    """Bảng chi tiết theo ngày: fragment — đổi Tháng/Năm chỉ chạy lại bảng, không chạy lại cả trang."""
+    _now = pd.Timestamp.now()
+    tbl_cols = st.columns([1, 1, 6])
+    with tbl_cols[0]:
+        tbl_month = st.selectbox(
+            "Tháng",
+            options=list(range(1, 13)),
+            index=_now.month - 1,
+            key=f"{spec.key}_tbl_month",
+        )
+    with tbl_cols[1]:
+        tbl_year = st.selectbox(
+            "Năm", options=all_years, index=0, key=f"{spec.key}_tbl_year"
+        )
+
+    m = month_metrics(metrics.totals[spec.code], tbl_year, tbl_month, fee=spec.fee)
+    if m is None:
+        st.info("Không có dữ liệu cho tháng/năm đã chọn.")
+    else:
+        d = m["Ngày phát sinh"]
+        m["tien_dk"]  = metrics.forecast(spec, d)
+        m["doi_soat"] = doi_soat_by_day(load_thu_phi_by_day(), spec.san_pham, d, fee=spec.fee)
+        st.markdown(render_daily_table(m, show_so_don=spec.fee is not None), unsafe_allow_html=True)
+
+
+def render_product_page(spec: ProductSpec):
+    st.markdown(
+        '<style>section[data-testid="stMain"]{zoom:1;}</style>',
+        unsafe_allow_html=True,
+    )
+    st.markdown(
+        '<h1 style="font-size:1.4rem;font-weight:700;white-space:nowrap;margin-bottom:0.5rem;">'
+        f'BÁO CÁO CHI TIẾT SẢN PHẨM {spec.title}</h1>',
+        unsafe_allow_html=True,
+    )
+    render_action_buttons(("product_metrics", "metric_cube"))
+
+    try:
+        metrics = load_product_metrics(spec.key)
+    except Exception as e:
+        st.error(f"Không thể tải dữ liệu: {e}")
+        return
+
+    # ── Year filter ────────────────────────────────────────────────────────────
+    mark("Bộ lọc")
+    all_years = sorted(metrics.rows["Năm"].dropna().unique().astype(int).tolist(), reverse=True)
+    default_years = [2026] if 2026 in all_years else (all_years[:1] if all_years else [])
+    selected_years = st.multiselect(
+        "Năm",
+        options=all_years,
+        default=default_years,
+        placeholder="Chọn năm...",
+    )
+
+    # ── Guard ─────────────────────────────────────────────────────────────────
+    k = product_kpis(spec.key, tuple(sorted(selected_years)))
+    if k is None:
+        st.warning("Không đủ dữ liệu để hiển thị. Vui lòng chọn thêm năm.")
+        return
+    prev_year = k["prev_year"]
+
+    # ── Scorecards ────────────────────────────────────────────────────────────
+    mark("Scorecard")
+    _prev_str = k["prev_date"].strftime("%d-%m-%Y")
+    st.markdown(
+        f'<p style="font-size:0.78rem;color:#888;margin-bottom:4px">'
+        f'↕ Mũi tên xanh/đỏ: so với ngày trước đó ({_prev_str})</p>',
+        unsafe_allow_html=True,
+    )
+
+    cols = st.columns(5)
+
+    with cols[0]:
+        _ds = "+" if k["delta_tien"] >= 0 else ""
+        st.markdown(kpi_card(
+            label="Tổng tiền thực thu",
+            value=fmt_currency(k["tong_tien"]),
+            delta_str=f"{_ds}{fmt_currency(k['delta_tien'])}",
+            delta_color="#2e7d32",
+            accent_color="#2C4C7B",
+            yoy_html=yoy_caption(k["tong_tien"], k["yoy_tien"], fmt_currency, prev_year),
+        ), unsafe_allow_html=True)
+
+    with cols[1]:
+        _tg_color = "#2e7d32" if k["delta_tang_truong"] >= 0 else "#c62828"
+        _tg_sign  = "+" if k["delta_tang_truong"] >= 0 else ""
+        st.markdown(kpi_card(
+            label="Số KH tăng trưởng",
+            value=f"{k['tong_tang_truong']:,}",
+            delta_str=f"{_tg_sign}{k['delta_tang_truong']:,}",
+            delta_color=_tg_color,
+            accent_color="#6A415E",
+            yoy_html=yoy_caption(k["tong_tang_truong"], k["yoy_tang_truong"], lambda v: f"{int(v):,}", prev_year),
+            tooltip="Cấp mới − Hủy − Tái tục dự kiến + Tái tục thực tế",
+        ), unsafe_allow_html=True)
+
+    with cols[2]:
+        _kh_color = "#2e7d32" if k["delta_kh"] >= 0 else "#c62828"
+        _kh_sign  = "+" if k["delta_kh"] >= 0 else ""
+        st.markdown(kpi_card(
+            label="Số GCN có hiệu lực",
+            value=f"{k['kh_hien_huu']:,}",
+            delta_str=f"{_kh_sign}{k['delta_kh']:,}",
+            delta_color=_kh_color,
+            accent_color="#22B2FA",
+            yoy_html=yoy_caption(k["kh_hien_huu"], k["yoy_kh"], lambda v: f"{int(v):,}", prev_year),
+        ), unsafe_allow_html=True)
+
+    with cols[3]:
+        _huy_color = "#c62828" if k["delta_ty_le"] > 0 else "#2e7d32"
+        st.markdown(kpi_card(
+            label="Tỷ lệ hủy chủ động",
+            value=f"{k['ty_le_huy']:.1%}",
+            delta_str=f"{k['delta_ty_le']:+.2%}",
+            delta_color=_huy_color,
+            accent_color="#d71149",
+        ), unsafe_allow_html=True)
+
+    with cols[4]:
+        _tt_color = "#2e7d32" if k["delta_tai_tuc"] >= 0 else "#c62828"
+        st.markdown(kpi_card(
+            label="Tỷ lệ tái tục / dự kiến",
+            value=f"{k['ty_le_tai_tuc']:.1%}",
+            delta_str=f"{k['delta_tai_tuc']:+.2%}",
+            delta_color=_tt_color,
+            accent_color="#2C7B6F",
+            yoy_html=yoy_caption(k["ty_le_tai_tuc"], k["yoy_ty_le_tai_tuc"], lambda v: f"{v:.1%}", prev_year),
+        ), unsafe_allow_html=True)
+
+    # ── Row 2: Charts ─────────────────────────────────────────────────────────
+    mark("Biểu đồ doanh thu")
+    st.markdown('<div style="margin-top:24px;"></div>', unsafe_allow_html=True)
+
+    _cutoff_dt = metrics.cutoff
+    _monthly_all = metrics.monthly
+    _monthly_12 = _monthly_all[_monthly_all["Tháng"] >= _cutoff_dt] if _cutoff_dt is not None else _monthly_all
+    _monthly_12 = _monthly_12.assign(Tháng=_monthly_12["Tháng"].dt.strftime("%Y-%m"))
+    if _cutoff_dt is not None:
+        _monthly = _monthly_12[["Tháng", "tien", "tien_dk"]].rename(
+            columns={"tien": "Thực thu", "tien_dk": "Dự kiến"}
+        )
+        _melted = _monthly.melt(
+            id_vars="Tháng",
+            value_vars=["Thực thu", "Dự kiến"],
+            var_name="Loại",
+            value_name="Tiền (VND)",
+        )
+    else:
+        _melted = pd.DataFrame(columns=["Tháng", "Loại", "Tiền (VND)"])
+
+    _kh_active    = float(k["kh_hien_huu"])
+    _kh_tam_nguong = k["kh_tam_ngung"]
+    _pie_df = pd.DataFrame({
+        "Loại KH": ["Có hiệu lực", "Tạm ngưng"],
+        "Số đơn": [_kh_active, _kh_tam_nguong],
+    })
+
+    chart_cols = st.columns([1, 2])
+
+    with chart_cols[0]:
+        st.markdown(
+            '<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);margin:0 0 0.28rem 0;">'
+            'KH hiện hữu</p>',
+            unsafe_allow_html=True,
+        )
+        st.markdown(
+            '<div style="display:flex;gap:14px;margin-bottom:6px;font-size:0.57rem;">'
+            '<span><span style="display:inline-block;width:8px;height:8px;border-radius:50%;'
+            'background:#22B2FA;margin-right:4px;vertical-align:middle;"></span>Có hiệu lực</span>'
+            '<span><span style="display:inline-block;width:8px;height:8px;border-radius:50%;'
+            'background:#98EEFF;margin-right:4px;vertical-align:middle;"></span>Tạm ngưng</span>'
+            '</div>',
+            unsafe_allow_html=True,
+        )
+        _pie = (
+            alt.Chart(_pie_df)
+            .mark_arc(innerRadius=42)
+            .encode(
+                theta=alt.Theta("Số đơn:Q"),
+                color=alt.Color(
+                    "Loại KH:N",
+                    scale=alt.Scale(
+                        domain=["Có hiệu lực", "Tạm ngưng"],
+                        range=["#22B2FA", "#98EEFF"],
+                    ),
+                    legend=None,
+                ),
+                tooltip=[
+                    alt.Tooltip("Loại KH:N", title="Loại"),
+                    alt.Tooltip("Số đơn:Q", title="Số đơn", format=",.0f"),
+                ],
+            )
+            .properties(height=185)
+        )
+        st.altair_chart(_pie, width='stretch')
+        _kh_total = _kh_active + _kh_tam_nguong
+        _kh_total_str = (
+            f"{_kh_total / 1e6:.3f} triệu" if _kh_total >= 1_000_000 else f"{int(_kh_total):,}"
+        )
+        _pct_hieu_luc = _kh_active / _kh_total if _kh_total > 0 else 0
+        st.markdown(
+            f'<div style="text-align:center;font-size:0.60rem;color:#444;margin-top:-6px;">'
+            f'Tổng KH hiện hữu<br>'
+            f'<strong style="font-size:0.70rem;color:#1a1a2e;">{_kh_total_str}</strong>'
+            f'</div>'
+            f'<div style="text-align:center;font-size:0.57rem;color:#22B2FA;margin-top:3px;">'
+            f'Có hiệu lực: <strong>{_pct_hieu_luc:.1%}</strong>'
+            f'</div>',
+            unsafe_allow_html=True,
+        )
+
+    with chart_cols[1]:
+        st.markdown(
+            '<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);margin:0 0 0.28rem 0;">'
+            'Tiền thực thu vs dự kiến theo tháng</p>',
+            unsafe_allow_html=True,
+        )
+        if not _melted.empty:
+            _melted["label"] = _melted["Tiền (VND)"].apply(fmt_currency)
+            _bar_order = ["Thực thu", "Dự kiến"]
+            _bars = (
+                alt.Chart(_melted)
+                .mark_bar()
+                .encode(
+                    x=alt.X("Tháng:N", title=None, axis=alt.Axis(labelAngle=0)),
+                    y=alt.Y("Tiền (VND):Q", title=None, axis=None),
+                    color=alt.Color(
+                        "Loại:N",
+                        scale=alt.Scale(
+                            domain=_bar_order,
+                            range=["#2C4C7B", "#6B9ED4"],
+                        ),
+                        legend=None,
+                    ),
+                    xOffset=alt.XOffset("Loại:N", sort=_bar_order),
+                    tooltip=[
+                        alt.Tooltip("Tháng:N", title="Tháng"),
+                        alt.Tooltip("Loại:N", title="Loại"),
+                        alt.Tooltip("label:N", title="Tiền"),
+                    ],
+                )
+            )
+            _bar_labels = (
+                alt.Chart(_melted[_melted["Tiền (VND)"] > 0])
+                .mark_text(dy=-6, fontSize=11, fontWeight="normal")
+                .encode(
+                    x=alt.X("Tháng:N", sort=None),
+                    y=alt.Y("Tiền (VND):Q"),
+                    xOffset=alt.XOffset("Loại:N", sort=_bar_order),
+                    color=alt.Color(
+                        "Loại:N",
+                        scale=alt.Scale(domain=_bar_order, range=["#2C4C7B", "#6B9ED4"]),
+                    ),
+                    text=alt.Text("label:N"),
+                )
+            )
+            st.markdown(
+                '<div style="display:flex;gap:14px;margin-bottom:6px;font-size:0.57rem;">'
+                '<span><span style="display:inline-block;width:8px;height:8px;border-radius:2px;'
+                'background:#2C4C7B;margin-right:4px;vertical-align:middle;"></span>Thực thu</span>'
+                '<span><span style="display:inline-block;width:8px;height:8px;border-radius:2px;'
+                'background:#6B9ED4;margin-right:4px;vertical-align:middle;"></span>Dự kiến</span>'
+                '</div>',
+                unsafe_allow_html=True,
+            )
+            st.altair_chart((_bars + _bar_labels).properties(height=280), width='stretch')
+
+    # ── Row 3: Tỷ lệ hủy & KH tăng trưởng theo tháng ────────────────────────
+    mark("Tỷ lệ hủy + KH tăng trưởng")
+    st.markdown('<div style="margin-top:24px;"></div>', unsafe_allow_html=True)
+    rate_cols = st.columns(2)
+
+    with rate_cols[0]:
+        st.markdown(
+            '<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);margin:0 0 0.28rem 0;">'
+            'Tỷ lệ hủy theo tháng</p>',
+            unsafe_allow_html=True,
+        )
+        _monthly_huy = _monthly_12[["Tháng", "huy", "cap_moi", "tai_tuc"]].rename(columns={"cap_moi": "cap"})
+        _monthly_huy["Tỷ lệ hủy"] = (
+            _monthly_huy["huy"]
+            / (_monthly_huy["cap"] + _monthly_huy["tai_tuc"]).replace(0, float("nan"))
+        )
+        _monthly_huy["label"] = _monthly_huy["Tỷ lệ hủy"].apply(
+            lambda v: f"{v:.1%}" if pd.notna(v) else ""
+        )
+        if not _monthly_huy.empty:
+            _huy_m_line = (
+                alt.Chart(_monthly_huy)
+                .mark_line(color="#d71149", strokeWidth=2.5, point=alt.OverlayMarkDef(color="#d71149", size=60))
+                .encode(
+                    x=alt.X("Tháng:N", title=None, axis=alt.Axis(labelAngle=0)),
+                    y=alt.Y("Tỷ lệ hủy:Q", title=None, axis=None),
+                    tooltip=[
+                        alt.Tooltip("Tháng:N", title="Tháng"),
+                        alt.Tooltip("label:N", title="Tỷ lệ hủy"),
+                    ],
+                )
+            )
+            _huy_m_labels = (
+                alt.Chart(_monthly_huy[_monthly_huy["Tỷ lệ hủy"] > 0])
+                .mark_text(dy=-12, fontSize=11, fontWeight="normal", color="#d71149")
+                .encode(
+                    x=alt.X("Tháng:N"),
+                    y=alt.Y("Tỷ lệ hủy:Q"),
+                    text=alt.Text("label:N"),
+                )
+            )
+            st.altair_chart(
+                (_huy_m_line + _huy_m_labels).properties(height=220),
+                width='stretch',
+            )
+
+    with rate_cols[1]:
+        st.markdown(
+            '<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);margin:0 0 0.28rem 0;">'
+            'KH tăng trưởng theo tháng</p>',
+            unsafe_allow_html=True,
+        )
+        _monthly_tg = _monthly_12[["Tháng", "cap_moi", "huy", "tai_tuc", "tai_tuc_dk"]].copy()
+        _monthly_tg["KH tăng trưởng"] = (
+            _monthly_tg["cap_moi"] - _monthly_tg["huy"]
+            - _monthly_tg["tai_tuc_dk"] + _monthly_tg["tai_tuc"]
+        )
+        _monthly_tg["label"] = _monthly_tg["KH tăng trưởng"].apply(lambda v: f"{int(v):,}")
+        if not _monthly_tg.empty:
+            _tg_bars = (
+                alt.Chart(_monthly_tg)
+                .mark_bar()
+                .encode(
+                    x=alt.X("Tháng:N", title=None, axis=alt.Axis(labelAngle=0)),
+                    y=alt.Y("KH tăng trưởng:Q", title=None, axis=None),
+                    color=alt.condition(
+                        alt.datum["KH tăng trưởng"] >= 0,
+                        alt.value("#6A415E"),
+                        alt.value("#e57373"),
+                    ),
+                    tooltip=[
+                        alt.Tooltip("Tháng:N", title="Tháng"),
+                        alt.Tooltip("label:N", title="KH tăng trưởng"),
+                    ],
+                )
+            )
+            _tg_labels_pos = (
+                alt.Chart(_monthly_tg[_monthly_tg["KH tăng trưởng"] >= 0])
+                .mark_text(dy=-8, fontSize=11, fontWeight="normal", color="#6A415E")
+                .encode(
+                    x=alt.X("Tháng:N", sort=None),
+                    y=alt.Y("KH tăng trưởng:Q"),
+                    text=alt.Text("label:N"),
+                )
+            )
+            _tg_labels_neg = (
+                alt.Chart(_monthly_tg[_monthly_tg["KH tăng trưởng"] < 0])
+                .mark_text(dy=10, fontSize=11, fontWeight="normal", color="#e57373")
+                .encode(
+                    x=alt.X("Tháng:N", sort=None),
+                    y=alt.Y("KH tăng trưởng:Q"),
+                    text=alt.Text("label:N"),
+                )
+            )
+            st.altair_chart(
+                (_tg_bars + _tg_labels_pos + _tg_labels_neg).properties(height=220),
+                width='stretch',
+            )
+
+    # ── Row 4: Tái tục thực tế vs dự kiến theo tháng ─────────────────────────
+    mark("Tái tục")
+    if spec.renewal_chart:
+        st.markdown('<div style="margin-top:24px;"></div>', unsafe_allow_html=True)
+        st.markdown(
+            '<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);margin:0 0 0.28rem 0;">'
+            'Tái tục thực tế vs dự kiến theo tháng</p>',
+            unsafe_allow_html=True,
+        )
+        _monthly_tt = _monthly_12[["Tháng", "tai_tuc", "tai_tuc_dk"]]
+        _tt_order = ["Thực tế", "Dự kiến"]
+        _melted_tt = _monthly_tt.melt(
+            id_vars="Tháng",
+            value_vars=["tai_tuc", "tai_tuc_dk"],
+            var_name="Loại_raw",
+            value_name="Số đơn",
+        ).assign(
+            Loại=lambda x: x["Loại_raw"].map({"tai_tuc": "Thực tế", "tai_tuc_dk": "Dự kiến"})
+        )
+        _melted_tt["label"] = _melted_tt["Số đơn"].apply(lambda v: f"{int(v):,}")
+        if not _melted_tt.empty:
+            st.markdown(
+                '<div style="display:flex;gap:14px;margin-bottom:6px;font-size:0.57rem;">'
+                '<span><span style="display:inline-block;width:8px;height:8px;border-radius:2px;'
+                'background:#2C7B6F;margin-right:4px;vertical-align:middle;"></span>Thực tế</span>'
+                '<span><span style="display:inline-block;width:8px;height:8px;border-radius:2px;'
+                'background:#6DB4AC;margin-right:4px;vertical-align:middle;"></span>Dự kiến</span>'
+                '</div>',
+                unsafe_allow_html=True,
+            )
+            _tt_bars = (
+                alt.Chart(_melted_tt)
+                .mark_bar()
+                .encode(
+                    x=alt.X("Tháng:N", title=None, axis=alt.Axis(labelAngle=0)),
+                    y=alt.Y("Số đơn:Q", title=None, axis=None),
+                    color=alt.Color(
+                        "Loại:N",
+                        scale=alt.Scale(domain=_tt_order, range=["#2C7B6F", "#6DB4AC"]),
+                        legend=None,
+                    ),
+                    xOffset=alt.XOffset("Loại:N", sort=_tt_order),
+                    tooltip=[
+                        alt.Tooltip("Tháng:N", title="Tháng"),
+                        alt.Tooltip("Loại:N", title="Loại"),
+                        alt.Tooltip("label:N", title="Số đơn"),
+                    ],
+                )
+            )
+            _tt_labels = (
+                alt.Chart(_melted_tt[_melted_tt["Số đơn"] > 0])
+                .mark_text(dy=-6, fontSize=11, fontWeight="normal")
+                .encode(
+                    x=alt.X("Tháng:N", sort=None),
+                    y=alt.Y("Số đơn:Q"),
+                    xOffset=alt.XOffset("Loại:N", sort=_tt_order),
+                    color=alt.Color(
+                        "Loại:N",
+                        scale=alt.Scale(domain=_tt_order, range=["#2C7B6F", "#6DB4AC"]),
+                    ),
+                    text=alt.Text("label:N"),
+                )
+            )
+            st.altair_chart(
+                (_tt_bars + _tt_labels).properties(height=220),
+                width='stretch',
+            )
+
+    # ── Daily detail table ────────────────────────────────────────────────────
+    mark("Bảng theo ngày")
+    st.markdown('<div style="margin-top:28px;"></div>', unsafe_allow_html=True)
+    st.markdown(
+        '<p style="font-size:0.89rem;font-weight:600;color:rgb(49,51,63);'
+        'margin:0 0 0.5rem 0;line-height:1.3;">Bảng chi tiết theo ngày</p>',
+        unsafe_allow_html=True,
+    )
+
+    _daily_table(spec, metrics, all_years)
@@ -0,0 +1,96 @@
+"""
+parallel_fetch.py
+-----------------
+Chạy song song các truy vấn / loader độc lập trong một lượt render.
+
+Mỗi task chạy trên một thread của pool dùng chung, nên có cursor DuckDB riêng
+(MotherDuckPool và mirror cấp cursor theo thread). Lỗi của một task không làm
+hỏng các task khác: kết quả được gom lại theo tên cùng thời gian chạy và lỗi
+(nếu có), caller tự quyết định cách xử lý.
+
+Thread gọi ``fetch_parallel`` tự chạy task đầu tiên và cả các task mà pool
+chưa nhận, nên gọi lồng nhau (loader chạy trong pool lại gọi
+``fetch_parallel``) không bị treo khi pool đã kín.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+_MAX_WORKERS = 8
+_pool = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="ipay-query")
+
+
+@dataclass
+class TaskResult:
+    name: str
+    value: Any = None
+    error: BaseException | None = None
+    seconds: float = 0.0
+    thread: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def get(self) -> Any:
+        """Giá trị của task, hoặc raise lại lỗi của nó."""
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _run(name: str, fn: Callable[[], Any]) -> TaskResult:
+    t0 = time.perf_counter()
+    try:
+        res = TaskResult(name, value=fn())
+    except Exception as e:
+        logger.warning("%s: lỗi khi tải song song", name, exc_info=True)
+        res = TaskResult(name, error=e)
+    res.seconds = time.perf_counter() - t0
+    res.thread = threading.current_thread().name
+    instrumentation.record("task", name, res.seconds, ok=res.ok)
+    return res
+
+
+def fetch_parallel(tasks: dict[str, Callable[[], Any]]) -> dict[str, TaskResult]:
+    """
+    Chạy đồng thời các hàm không tham số trong ``tasks`` và chờ tất cả xong.
+
+    Trả về ``{tên: TaskResult}`` theo thứ tự của ``tasks``; tổng thời gian
+    xấp xỉ task chậm nhất thay vì tổng các task.
+    """
+    items = list(tasks.items())
+    if len(items) <= 1:
+        return {name: _run(name, fn) for name, fn in items}
+
+    # Thread hiện tại chạy task đầu, pool chạy phần còn lại
+    (first, first_fn), rest = items[0], items[1:]
+    futures: list[tuple[str, Callable, Future]] = [
+        (name, fn, _pool.submit(_run, name, fn)) for name, fn in rest
+    ]
+    results = {first: _run(first, first_fn)}
+    for name, fn, future in futures:
+        # Xong task của mình mà pool vẫn chưa nhận task này (pool đang kín) → tự chạy
+        results[name] = _run(name, fn) if future.cancel() else future.result()
+    return {name: results[name] for name, _ in items}
+
+
+def fetch_all(tasks: dict[str, Callable[[], Any]]) -> dict[str, Any]:
+    """Như ``fetch_parallel`` nhưng trả về giá trị; raise lỗi đầu tiên (sau khi mọi task đã xong)."""
+    return {name: res.get() for name, res in fetch_parallel(tasks).items()}
+
+
+def recent_timings() -> list[dict]:
+    """Các task đã chạy gần đây: name, seconds, ok, at (epoch)."""
+    return [
+        {"name": t.name, "seconds": t.seconds, "ok": t.ok, "at": t.at}
+        for t in instrumentation.samples("task")
+    ]
@@ -0,0 +1,173 @@
+"""
+product_metrics.py
+------------------
+Khai báo các trang sản phẩm (ProductSpec) và engine tính chỉ số dùng chung.
+
+Mỗi sản phẩm chỉ khác nhau ở mã PROD_CODE, phí mỗi đơn và công thức Tiền TT
+dự kiến. ``load_product_metrics`` kéo chuỗi theo ngày của sản phẩm (và các mã
+con mà công thức cần) trong một truy vấn, tính Tiền TT dự kiến + tổng theo
+tháng một lần rồi cache theo sản phẩm; ``product_kpis`` tra scorecard từ khối
+chỉ số dùng chung (metric_cube). Chuyển qua lại giữa các trang không tính lại.
+"""
+
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from daily_metrics import daily_totals, lag
+from cache_registry import dataset
+from data_loader import load_product_series
+from metric_cube import load_metric_cube, scorecard
+
+# lk(col, days=0, code=None) → giá trị cột ``col`` tại (ngày + days) của mã ``code``
+Lookup = Callable[..., np.ndarray]
+
+
+@dataclass(frozen=True)
+class ProductSpec:
+    key: str                                          # tiền tố widget key, vd "cyber"
+    code: str                                         # PROD_CODE trong gold
+    title: str                                        # tên trên tiêu đề trang
+    san_pham: str                                     # tên trong silver.payment_by_day
+    forecast: Callable[[Lookup, int | None], np.ndarray]  # Tiền TT dự kiến theo ngày
+    fee: int | None = None                            # phí/đơn; None = không có cột Số đơn thu phí,
+                                                      # đối soát lấy tong_phi
+    sub_codes: tuple[str, ...] = ()                   # mã con mà forecast cần
+    renewal_chart: bool = True                        # chart Tái tục thực tế vs dự kiến
+    cap_latest_at_today: bool = False                 # mốc 12 tháng không vượt quá hôm nay
+
+
+# ── Công thức Tiền TT dự kiến ─────────────────────────────────────────────────
+def _forecast_cyber(lk: Lookup, fee: int) -> np.ndarray:
+    return (lk("huy", -30) + lk("tai_tuc_dk") * 0.9 - lk("tai_tuc_dk", +5)) * fee * 0.95 + lk("tien", -30) * 0.95
+
+
+def _forecast_isafe(lk: Lookup, fee: int) -> np.ndarray:
+    return (
+        (lk("cap_moi", -30) - lk("huy", -30) + lk("tai_tuc_dk") * 0.9 - lk("tai_tuc_dk", +5)) * fee * 0.95
+        + lk("tien", -30) * 0.95
+    )
+
+
+def _forecast_tapcare(lk: Lookup, fee: int) -> np.ndarray:
+    return (lk("cap_moi", -10) - lk("huy", -30)) * fee * 0.95 + lk("tien", -30) * 0.95
+
+
+def _forecast_homesaving(lk: Lookup, fee: None) -> np.ndarray:
+    # Phí khác nhau theo gói → tính riêng HS15 / HS25 rồi cộng
+    out = lk("tien", -30) * 0.95
+    for code, pkg_fee in (("VTB_HS_15", 15000), ("VTB_HS_25", 25000)):
+        out = out + (
+            lk("cap_moi", -30, code) - lk("huy", -30, code)
+            + lk("tai_tuc_dk", 0, code) * 0.9 - lk("tai_tuc_dk", +5, code)
+        ) * pkg_fee * 0.95
+    return out
+
+
+PRODUCTS: dict[str, ProductSpec] = {s.key: s for s in [
+    ProductSpec("cyber",      "MIX_01",         "CYBER RISK", "Cyber Risk", _forecast_cyber,   fee=3000,
+                cap_latest_at_today=True),
+    ProductSpec("isafe",      "ISAFE_CYBER",    "I-SAFE",     "I-Safe",     _forecast_isafe,   fee=5000),
+    ProductSpec("tapcare",    "TAPCARE",        "TAPCARE",    "TapCare",    _forecast_tapcare, fee=6000,
+                renewal_chart=False),
+    ProductSpec("homesaving", "VTB_HOMESAVING", "NHÀ VÀ BẠN", "HomeSaving", _forecast_homesaving,
+                sub_codes=("VTB_HS_15", "VTB_HS_25"), renewal_chart=False),
+]}
+
+
+# ── Engine ───────────────────────────────────────────────────────────────────
+@dataclass
+class ProductMetrics:
+    rows: pd.DataFrame               # một dòng / ngày có dữ liệu: "Năm", "Ngày phát sinh" + tổng các cột số
+    daily: pd.DataFrame              # liên tục từ ngày đầu → cuối (index ngày), cột ngắn + tien_dk
+    monthly: pd.DataFrame            # theo tháng ("Tháng" = ngày đầu tháng), tổng của ``daily``
+    totals: dict[str, pd.DataFrame]  # daily_totals theo từng mã (chính + mã con) cho lookup
+    cutoff: pd.Timestamp | None      # đầu tháng của cửa sổ 12 tháng gần nhất
+
+    def forecast(self, spec: ProductSpec, dates) -> np.ndarray:
+        """Tiền TT dự kiến cho một dãy ngày bất kỳ (kể cả ngoài khoảng có dữ liệu)."""
+        return _forecast(spec, self.totals, dates)
+
+
+def _forecast(spec: ProductSpec, totals: dict[str, pd.DataFrame], dates) -> np.ndarray:
+    def lk(col: str, days: int = 0, code: str | None = None) -> np.ndarray:
+        return lag(totals[code or spec.code], dates, col, days)
+    return spec.forecast(lk, spec.fee)
+
+
+@dataset("product_metrics", depends=("product_series",), ttl=300, warm=[(key,) for key in PRODUCTS])
+def load_product_metrics(key: str) -> ProductMetrics:
+    spec = PRODUCTS[key]
+    series = load_product_series((spec.code,) + spec.sub_codes, by_product=True)
+    by_code = {code: g.drop(columns="PROD_CODE") for code, g in series.groupby("PROD_CODE", observed=True)}
+    empty = series.iloc[:0].drop(columns="PROD_CODE")
+    rows = by_code.get(spec.code, empty).sort_values("Ngày phát sinh").reset_index(drop=True)
+    totals = {code: daily_totals(by_code.get(code, empty)) for code in (spec.code,) + spec.sub_codes}
+
+    daily, cutoff = totals[spec.code].iloc[:0].assign(tien_dk=0.0), None
+    if not rows.empty:
+        dates = pd.date_range(rows["Ngày phát sinh"].min(), rows["Ngày phát sinh"].max(),
+                              freq="D", name="Ngày phát sinh")
+        daily = totals[spec.code].reindex(dates, fill_value=0.0).astype(float)
+        daily["tien_dk"] = _forecast(spec, totals, dates)
+        latest = dates.max()
+        if spec.cap_latest_at_today:
+            latest = min(latest, pd.Timestamp.now().normalize())
+        cutoff = (latest - pd.DateOffset(months=11)).replace(day=1)
+
+    monthly = (
+        daily.groupby(daily.index.to_period("M").to_timestamp())
+        .sum()
+        .rename_axis("Tháng")
+        .reset_index()
+    )
+    return ProductMetrics(rows, daily, monthly, totals, cutoff)
+
+
+def product_kpis(key: str, years: tuple[int, ...]) -> dict | None:
+    """
+    Scorecard của sản phẩm cho tập năm ``years`` (rỗng = mọi năm), tra từ
+    khối chỉ số dùng chung. None nếu chưa đủ 2 ngày dữ liệu.
+    """
+    s = scorecard(load_metric_cube(), PRODUCTS[key].code, years)
+    if s is None:
+        return None
+
+    def _tang_truong(v):
+        return int(
+            v["Số đơn cấp mới"] - v["Số đơn hủy webview"]
+            - v["Số đơn tái tục dự kiến"] + v["Số đơn cấp tái tục"]
+        )
+
+    def _ty_le_huy(v):
+        denom = v["Số đơn cấp mới"] + v["Số đơn cấp tái tục"]
+        return v["Số đơn hủy webview"] / denom if denom > 0 else 0
+
+    def _tt_rate(v):
+        dk = v["Số đơn tái tục dự kiến"]
+        return v["Số đơn cấp tái tục"] / dk if dk > 0 else 0
+
+    total, last, yoy = s["total"], s["last"], s["yoy"]
+    kh_hien_huu = int(last["Số đơn có hiệu lực"])
+    return {
+        "last_date":         s["last_date"],
+        "prev_date":         s["prev_date"],
+        "prev_year":         s["prev_year"],
+        "tong_tien":         total["Tiền thực thu"],
+        "tong_tang_truong":  _tang_truong(total),
+        "kh_hien_huu":       kh_hien_huu,
+        "kh_tam_ngung":      float(last["Số đơn tạm ngưng"]),
+        "ty_le_huy":         _ty_le_huy(total),
+        "ty_le_tai_tuc":     _tt_rate(total),
+        "delta_tien":        last["Tiền thực thu"],
+        "delta_tang_truong": _tang_truong(last),
+        "delta_kh":          kh_hien_huu - int(s["prev"]["Số đơn có hiệu lực"]),
+        "delta_ty_le":       _ty_le_huy(s["cum_last"]) - _ty_le_huy(s["cum_prev"]),
+        "delta_tai_tuc":     _tt_rate(s["cum_last"]) - _tt_rate(s["cum_prev"]),
+        "yoy_tien":          yoy["Tiền thực thu"],
+        "yoy_tang_truong":   _tang_truong(yoy),
+        "yoy_kh":            int(s["yoy_last"]["Số đơn có hiệu lực"]) if s["yoy_last"] is not None else 0,
+        "yoy_ty_le_tai_tuc": _tt_rate(yoy),
+    }
@@ -0,0 +1,14 @@
+import pytest
+
+import local_mirror
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    """Mirror cục bộ rỗng, không sync (IPAY_OFFLINE) — bảng nguồn do từng test tạo và sửa."""
+    monkeypatch.setenv("IPAY_USE_MIRROR", "1")
+    monkeypatch.setenv("IPAY_OFFLINE", "1")
+    monkeypatch.setenv("IPAY_MIRROR_PATH", str(tmp_path / "mirror.duckdb"))
+    local_mirror.get_mirror.clear()
+    yield local_mirror.get_mirror()
+    local_mirror.get_mirror.clear()
@@ -0,0 +1,115 @@
+"""Kiểm thử cache_registry bằng loader giả (``stamp=``), không cần MotherDuck."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cache_registry
+from cache_registry import dataset
+
+
+@pytest.fixture
+def source():
+    """Nguồn giả: dấu phiên bản = giá trị hiện tại; bỏ các dataset giả sau mỗi test."""
+    state = {"value": 1}
+    yield state
+    for name in [n for n in cache_registry.DATASETS if n.startswith("_test_")]:
+        del cache_registry.DATASETS[name]
+
+
+def _eventually(fn, expected, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        value = fn()
+        if value == expected or time.monotonic() > deadline:
+            return value
+        time.sleep(0.05)
+
+
+def test_derived_dataset_follows_dependency_after_source_change(source):
+    @dataset("_test_base", ttl=0.2, stamp=lambda: source["value"])
+    def base():
+        return source["value"]
+
+    @dataset("_test_derived", depends=("_test_base",), ttl=0.2, stamp=lambda: source["value"])
+    def derived():
+        return base() * 10
+
+    assert derived() == 10
+    assert base() == 1
+
+    source["value"] = 2
+    time.sleep(0.3)             # cả hai quá ttl: lượt gọi sau trả bản cũ, làm mới ở nền
+    assert _eventually(derived, 20) == 20
+    assert base() == 2
+
+
+def _blocking_loader(source, calls, release):
+    """Loader giả đếm số lần chạy và chờ ``release`` — để các lượt gọi khác kịp xếp hàng."""
+    def load():
+        calls.append(source["value"])
+        assert release.wait(5)
+        if isinstance(source["value"], Exception):
+            raise source["value"]
+        return source["value"]
+    return load
+
+
+def _run_concurrently(fn, n: int, release: threading.Event, delay: float = 0.2) -> list:
+    """Gọi ``fn`` từ ``n`` thread cùng lúc rồi mở ``release``; trả về kết quả hoặc exception của từng lượt."""
+    with ThreadPoolExecutor(n) as pool:
+        futures = [pool.submit(fn) for _ in range(n)]
+        time.sleep(delay)
+        release.set()
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_concurrent_callers_share_one_load(source):
+    calls, release = [], threading.Event()
+    ds = dataset("_test_flight", stamp=lambda: source["value"])(_blocking_loader(source, calls, release))
+
+    assert _run_concurrently(ds, 8, release) == [1] * 8
+    assert calls == [1]
+    stats = ds.stats()
+    assert (stats["loads"], stats["joined"]) == (1, 7)
+
+
+def test_leader_error_reaches_every_waiter(source):
+    calls, release = [], threading.Event()
+    ds = dataset("_test_flight_error", stamp=lambda: 1)(_blocking_loader(source, calls, release))
+    source["value"] = ValueError("MotherDuck down")
+
+    results = _run_concurrently(ds, 5, release)
+    assert len(calls) == 1
+    assert all(isinstance(r, ValueError) and str(r) == "MotherDuck down" for r in results)
+
+    source["value"] = 2         # lỗi không được giữ lại: lượt sau tải lại
+    assert ds() == 2
+    assert len(calls) == 2
+
+
+def test_refresh_clicks_within_window_coalesce(source, monkeypatch):
+    monkeypatch.setattr(cache_registry, "_REFRESH_WINDOW", 0.5)
+    calls, release = [], threading.Event()
+    ds = dataset("_test_refresh", stamp=lambda: source["value"])(_blocking_loader(source, calls, release))
+    release.set()
+    assert ds() == 1
+
+    source["value"] = 2
+    release.clear()
+    # Các lần bấm trong lúc một lần làm mới đang chạy chờ chung lần đó
+    assert _run_concurrently(lambda: cache_registry.refresh(["_test_refresh"]), 4, release) == [["_test_refresh"]] * 4
+    assert calls == [1, 2]
+
+    # Bấm lại trong cửa sổ: dùng lại kết quả, không đọc dấu / tải lại dù nguồn đã đổi
+    source["value"] = 3
+    assert cache_registry.refresh(["_test_refresh"]) == ["_test_refresh"]
+    assert calls == [1, 2]
+    assert ds() == 2
+
+    time.sleep(0.6)             # hết cửa sổ → lần bấm sau làm mới thật
+    assert cache_registry.refresh(["_test_refresh"]) == ["_test_refresh"]
+    assert calls == [1, 2, 3]
+    assert ds() == 3
@@ -0,0 +1,119 @@
+"""Phân trang keyset của bảng chi tiết khiếu nại, so với cách cũ: sắp bảng facts rồi cắt ``iloc`` theo trang."""
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import data_loader
+from pages import complaints
+
+_PAGE_SIZE = 4
+_ALL = (date(2026, 9, 1), date(2026, 9, 30), (), ())
+
+
+@pytest.fixture
+def source(mirror):
+    """
+    25 email, từng cặp hai email cùng thời điểm nhận (thứ tự id khác thứ tự
+    chèn), 1–6 cặp sản phẩm × loại mỗi email; kèm email không có cặp nào và
+    email không có ngày — cả hai không hiện trong bảng chi tiết.
+    """
+    with mirror.pool.cursor() as cur:
+        cur.execute("CREATE SCHEMA silver")
+        cur.execute("""
+            CREATE TABLE silver.classified_complaints AS
+            SELECT 'k' || lpad(((i * 7) % 25)::VARCHAR, 2, '0') AS id,
+                   strftime(TIMESTAMP '2026-09-01 08:00:00' + INTERVAL ((i // 2) * 6) HOUR, '%Y-%m-%d %H:%M:%S')
+                                                                         AS received_date_time,
+                   ['Tapcare', 'i-Safe;Cyber Risk', 'HomeSaving;Tapcare;i-Safe'][i % 3 + 1] AS products,
+                   ['Hoàn phí', 'Trừ tiền;Hủy'][i % 2 + 1]             AS complaint_types,
+                   CASE WHEN i % 5 = 0 THEN NULL ELSE ['Cao', 'Thấp'][i % 2 + 1] END AS priority,
+                   ['VietinBank', 'VBI HO'][i % 3 % 2 + 1]              AS sender,
+                   'Khiếu nại ' || i AS subject, 'Yêu cầu ' || i AS customer_request, 'Nguyên nhân' AS cause
+            FROM range(25) t(i)
+        """)
+        cur.execute("""
+            INSERT INTO silver.classified_complaints VALUES
+                ('k_empty',  '2026-09-02 09:00:00', ' ; ', 'Hoàn phí', 'Cao', 'VBI HO', 's', 'r', 'c'),
+                ('k_nodate', NULL,                  'Tapcare', 'Hoàn phí', 'Cao', 'VBI HO', 's', 'r', 'c')
+        """)
+    return mirror
+
+
+def _old_pages(filters) -> list[pd.DataFrame]:
+    """Các trang theo cách cũ: lọc facts, sắp ổn định theo thời điểm nhận giảm dần, cắt theo vị trí."""
+    detail = complaints._filter(data_loader.load_complaint_facts.fn(), *filters).sort_values(
+        "received_date_time", ascending=False, kind="stable",
+    )
+    return [detail.iloc[i:i + _PAGE_SIZE] for i in range(0, len(detail), _PAGE_SIZE)]
+
+
+def _rows(df: pd.DataFrame) -> list[tuple]:
+    cols = ["id", "received_date_time", "Sản phẩm - Loại khiếu nại", "priority"]
+    return [tuple(None if pd.isna(v) else str(v) for v in r) for r in df[cols].itertuples(index=False)]
+
+
+def _show(filters, page: int, anchor: tuple, total_rows: int) -> tuple[int, pd.DataFrame]:
+    return complaints._keyset_page(filters, page, anchor, total_rows, _PAGE_SIZE)
+
+
+@pytest.mark.parametrize("filters", [_ALL, (date(2026, 9, 2), date(2026, 9, 6), ("VBI HO",), ("Cao", "Thấp"))])
+def test_forward_and_backward_paging_match_old_slicing(source, filters):
+    old = _old_pages(filters)
+    total_rows = sum(len(p) for p in old)
+    assert len(old) >= 3
+
+    page, anchor = 1, (None, False)
+    for expected in range(1, len(old) + 1):              # "Tiếp →" tới trang cuối
+        page, rows = _show(filters, page, anchor, total_rows)
+        assert page == expected
+        assert _rows(rows) == _rows(old[page - 1])
+        page, anchor = page + 1, (complaints._row_key(rows.iloc[-1]), False)
+
+    page, anchor = len(old), (None, True)                # "Cuối ⏭" rồi "← Trước" về trang đầu
+    for expected in range(len(old), 0, -1):
+        page, rows = _show(filters, page, anchor, total_rows)
+        assert page == expected
+        assert _rows(rows) == _rows(old[page - 1])
+        page, anchor = page - 1, (complaints._row_key(rows.iloc[0]), True)
+
+
+def test_last_page_fetches_only_the_remainder(source):
+    old = _old_pages(_ALL)
+    total_rows = sum(len(p) for p in old)
+    page, rows = _show(_ALL, len(old), (None, True), total_rows)
+    assert len(rows) == total_rows - (len(old) - 1) * _PAGE_SIZE
+    assert _rows(rows) == _rows(old[-1])
+
+    # Dữ liệu ít đi (trang đang xem vượt số trang) → trang cuối
+    assert _show(_ALL, len(old) + 3, (None, False), total_rows)[0] == len(old)
+
+
+def test_falls_back_to_first_page_when_nothing_follows_the_anchor(source):
+    old = _old_pages(_ALL)
+    total_rows = sum(len(p) for p in old)
+    _, first = _show(_ALL, 1, (None, False), total_rows)
+    anchor = complaints._row_key(first.iloc[-1])
+
+    with source.pool.cursor() as cur:                   # làm mới: mốc và mọi email cũ hơn đã bị xóa
+        cur.execute("DELETE FROM silver.classified_complaints WHERE received_date_time <= ?", [str(anchor[0])])
+    page, rows = _show(_ALL, 2, (anchor, False), total_rows)
+    assert page == 1
+    assert _rows(rows) == _rows(_old_pages(_ALL)[0])
+
+
+def test_paging_continues_after_the_anchor_email_is_deleted(source):
+    old = _old_pages(_ALL)
+    total_rows = sum(len(p) for p in old)
+    _, first = _show(_ALL, 1, (None, False), total_rows)
+    anchor = complaints._row_key(first.iloc[-1])
+
+    with source.pool.cursor() as cur:
+        cur.execute("DELETE FROM silver.classified_complaints WHERE id = ?", [anchor[1]])
+    page, rows = _show(_ALL, 2, (anchor, False), total_rows)
+    # Trang sau = các dòng ngay sau vị trí mốc trong thứ tự cũ, trừ email đã xóa
+    after = pd.concat(old).iloc[_PAGE_SIZE:]
+    after = after[after["id"] != anchor[1]]
+    assert page == 2
+    assert _rows(rows) == _rows(after.iloc[:_PAGE_SIZE])
@@ -0,0 +1,157 @@
+"""Kiểm thử cập nhật tăng dần của data_loader: so với một lần tải lại toàn bộ trên mirror tạm (IPAY_OFFLINE)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loader
+
+
+def _execute(mirror, *statements: str) -> None:
+    with mirror.pool.cursor() as cur:
+        for sql in statements:
+            cur.execute(sql)
+
+
+def _normalized(df: pd.DataFrame, keys: list[str] | None) -> pd.DataFrame:
+    """Categorical → chuỗi; sắp theo ``keys`` (None = giữ thứ tự, so cả thứ tự dòng)."""
+    df = df.astype({c: str for c, t in df.dtypes.items() if isinstance(t, pd.CategoricalDtype)})
+    if keys is not None:
+        df = df.sort_values(keys, na_position="last")
+    return df.reset_index(drop=True)
+
+
+def _fingerprints(df: pd.DataFrame) -> np.ndarray:
+    return np.sort(np.frombuffer(df.attrs["fingerprints"], data_loader._FINGERPRINT_DTYPE), order="day")
+
+
+def _assert_same_as_full(updated: pd.DataFrame, full: pd.DataFrame, keys: list[str] | None) -> None:
+    assert updated is not None
+    pd.testing.assert_frame_equal(_normalized(updated, keys), _normalized(full, keys))
+    assert _fingerprints(updated).tobytes() == _fingerprints(full).tobytes()    # NaT ≠ NaT với array_equal
+
+
+# ── gold.ipay_quantity_rev_data ──────────────────────────────────────────────
+_IPAY_KEYS = ["PROD_CODE", "Ngày phát sinh"]
+
+
+@pytest.fixture
+def ipay(mirror):
+    """3 sản phẩm × 30 ngày (01/09 → 30/09) và một dòng không có ngày."""
+    counters = ", ".join(f'(d % 7)::INTEGER AS "{c}"' for c in data_loader._NUMERIC_COLS[1:])
+    _execute(
+        mirror,
+        "CREATE SCHEMA gold",
+        f"""
+        CREATE TABLE gold.ipay_quantity_rev_data AS
+        SELECT p AS PROD_CODE, 2026 AS "Năm", DATE '2026-09-01' + d::INTEGER AS "Ngày phát sinh",
+               (1000 * d)::DOUBLE AS "Tiền thực thu", {counters}
+        FROM (VALUES ('TAPCARE'), ('ISAFE_CYBER'), ('XE')) products(p), range(30) days(d)
+        """,
+        "INSERT INTO gold.ipay_quantity_rev_data BY NAME SELECT 'XE' AS PROD_CODE, 2026 AS \"Năm\"",
+    )
+    return mirror
+
+
+def test_ipay_update_matches_full_reload_after_changes_in_window(ipay):
+    prev = data_loader.load_ipay_data.fn()
+    _execute(
+        ipay,
+        # Trong đoạn lookback (từ 23/09): sửa, xóa, thêm sản phẩm / ngày mới
+        """UPDATE gold.ipay_quantity_rev_data SET "Tiền thực thu" = -1
+           WHERE PROD_CODE = 'TAPCARE' AND "Ngày phát sinh" = DATE '2026-09-28'""",
+        """DELETE FROM gold.ipay_quantity_rev_data
+           WHERE PROD_CODE = 'XE' AND "Ngày phát sinh" = DATE '2026-09-25'""",
+        """INSERT INTO gold.ipay_quantity_rev_data BY NAME
+           SELECT 'MIX_01' AS PROD_CODE, 2026 AS "Năm", DATE '2026-10-01' AS "Ngày phát sinh",
+                  5.0 AS "Tiền thực thu\"""",
+    )
+    updated = data_loader._update_ipay_data(prev)
+    _assert_same_as_full(updated, data_loader.load_ipay_data.fn(), _IPAY_KEYS)
+
+
+def test_ipay_update_falls_back_to_full_reload_after_change_outside_window(ipay):
+    prev = data_loader.load_ipay_data.fn()
+    _execute(ipay, """
+        UPDATE gold.ipay_quantity_rev_data SET "Số đơn cấp mới" = 99
+        WHERE PROD_CODE = 'ISAFE_CYBER' AND "Ngày phát sinh" = DATE '2026-09-02'
+    """)
+    assert data_loader._update_ipay_data(prev) is None
+
+
+def test_ipay_update_chains_across_several_changes(ipay):
+    prev = data_loader.load_ipay_data.fn()
+    for day in ("2026-10-01", "2026-10-02", "2026-10-03"):
+        _execute(ipay, f"""
+            INSERT INTO gold.ipay_quantity_rev_data BY NAME
+            SELECT 'TAPCARE' AS PROD_CODE, 2026 AS "Năm", DATE '{day}' AS "Ngày phát sinh"
+        """)
+        prev = data_loader._update_ipay_data(prev)
+        _assert_same_as_full(prev, data_loader.load_ipay_data.fn(), _IPAY_KEYS)
+
+
+# ── silver.classified_complaints ─────────────────────────────────────────────
+@pytest.fixture
+def complaints(mirror, monkeypatch):
+    """
+    40 email, mỗi ngày 2 email từ 01/09 (received_date_time dạng chuỗi như
+    nguồn), danh sách sản phẩm / loại phân tách bằng ";", kèm email không có
+    ngày và email thiếu priority / sender.
+    """
+    monkeypatch.setattr(data_loader, "COMPLAINTS_LOOKBACK_DAYS", 2)
+    _execute(
+        mirror,
+        "CREATE SCHEMA silver",
+        """
+        CREATE TABLE silver.classified_complaints AS
+        SELECT 'm' || lpad(i::VARCHAR, 3, '0') AS id,
+               strftime(TIMESTAMP '2026-09-01 08:00:00' + INTERVAL (i * 12) HOUR, '%Y-%m-%d %H:%M:%S')
+                                                              AS received_date_time,
+               ['Tapcare', 'i-Safe;Cyber Risk', 'HomeSaving'][i % 3 + 1] AS products,
+               ['Hoàn phí', 'Trừ tiền; Hủy'][i % 2 + 1]      AS complaint_types,
+               CASE WHEN i % 5 = 0 THEN NULL ELSE ['Cao', 'Thấp'][i % 2 + 1] END AS priority,
+               CASE WHEN i % 7 = 0 THEN NULL ELSE ['VietinBank', 'VBI HO'][i % 2 + 1] END AS sender,
+               'Khiếu nại ' || i AS subject, 'Yêu cầu' AS customer_request, 'Nguyên nhân' AS cause
+        FROM range(40) t(i)
+        """,
+        """INSERT INTO silver.classified_complaints VALUES
+           ('m_nodate', NULL, 'Tapcare', 'Hoàn phí', 'Cao', 'VBI HO', 's', 'r', 'c')""",
+    )
+    return mirror
+
+
+def _assert_complaint_updates_match_full(prev_complaints, prev_facts) -> None:
+    _assert_same_as_full(
+        data_loader._update_complaints_data(prev_complaints), data_loader.load_complaints_data.fn(), ["id"],
+    )
+    # Frame dài giữ đúng thứ tự của lần tải toàn bộ (ngày nhận, id, thứ tự cặp)
+    _assert_same_as_full(
+        data_loader._update_complaint_facts(prev_facts), data_loader.load_complaint_facts.fn(), None,
+    )
+
+
+def test_complaint_updates_match_full_reload_after_changes_in_window(complaints):
+    prev_complaints, prev_facts = data_loader.load_complaints_data.fn(), data_loader.load_complaint_facts.fn()
+    _execute(
+        complaints,
+        # Email cuối nhận 20/09 20:00 → đoạn lookback từ 18/09
+        "UPDATE silver.classified_complaints SET products = 'Sản phẩm khác;Tapcare' WHERE id = 'm038'",
+        "UPDATE silver.classified_complaints SET priority = 'Cao', sender = NULL WHERE id = 'm036'",
+        "DELETE FROM silver.classified_complaints WHERE id = 'm039'",
+        """INSERT INTO silver.classified_complaints VALUES
+           ('m100', '2026-09-21 09:30:00', 'Nhà và bạn', 'Bồi thường', 'Thấp', 'VietinBank', 's', 'r', 'c')""",
+    )
+    _assert_complaint_updates_match_full(prev_complaints, prev_facts)
+
+
+def test_complaint_updates_fall_back_to_full_reload_after_change_outside_window(complaints):
+    prev_complaints, prev_facts = data_loader.load_complaints_data.fn(), data_loader.load_complaint_facts.fn()
+    # Phân loại lại muộn một email cũ (01/09)
+    _execute(complaints, "UPDATE silver.classified_complaints SET complaint_types = 'Bồi thường' WHERE id = 'm001'")
+    assert data_loader._update_complaints_data(prev_complaints) is None
+    assert data_loader._update_complaint_facts(prev_facts) is None
+
+
+def test_complaint_updates_without_changes_keep_the_frames(complaints):
+    prev_complaints, prev_facts = data_loader.load_complaints_data.fn(), data_loader.load_complaint_facts.fn()
+    _assert_complaint_updates_match_full(prev_complaints, prev_facts)
@@ -0,0 +1,156 @@
+"""Kiểm thử LocalMirror.sync: mirror là file .duckdb tạm, "MotherDuck" là một file DuckDB thứ hai."""
+
+import duckdb
+import pandas as pd
+import pytest
+
+import local_mirror
+from local_mirror import LocalMirror, MirrorTable
+from motherduck import MotherDuckPool
+
+_TABLE = "src.events"
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    """Nguồn giả: 10 ngày, mỗi ngày một dòng; watermark là VARCHAR như dữ liệu thô."""
+    pool = MotherDuckPool(str(tmp_path / "remote.duckdb"))
+    with pool.cursor() as cur:
+        cur.execute("CREATE SCHEMA src")
+        cur.execute(f"CREATE TABLE {_TABLE} (id INTEGER, ts VARCHAR, v INTEGER)")
+        cur.execute(f"""
+            INSERT INTO {_TABLE}
+            SELECT i, strftime(DATE '2026-01-01' + i::INTEGER, '%Y-%m-%d %H:%M:%S'), 0
+            FROM range(10) t(i)
+        """)
+    monkeypatch.setattr(local_mirror, "get_pool", lambda: pool)
+    monkeypatch.delenv("IPAY_OFFLINE", raising=False)
+    return pool
+
+
+def _mirror(tmp_path, monkeypatch, **spec) -> LocalMirror:
+    spec = MirrorTable(_TABLE, **spec)
+    monkeypatch.setattr(local_mirror, "MIRROR_TABLES", {_TABLE: spec})
+    return LocalMirror(tmp_path / "mirror.duckdb")
+
+
+def _rows(pool: MotherDuckPool) -> list[tuple]:
+    with pool.cursor() as cur:
+        return cur.execute(f"SELECT * FROM {_TABLE} ORDER BY id").fetchall()
+
+
+def test_incremental_sync_replaces_only_the_lookback_window(tmp_path, monkeypatch, remote):
+    mirror = _mirror(tmp_path, monkeypatch, watermark="ts", lookback_days=2)
+    assert mirror.sync(_TABLE) == 10
+    assert mirror._status[_TABLE]["full"]
+
+    with remote.cursor() as cur:
+        cur.execute(f"UPDATE {_TABLE} SET v = 1 WHERE id IN (2, 8)")   # ngoài / trong cửa sổ
+        cur.execute(f"INSERT INTO {_TABLE} VALUES (10, '2026-01-11 00:00:00', 0)")
+
+    # watermark = 01-10 → cutoff 01-08: kéo lại id 7..10
+    assert mirror.sync(_TABLE) == 4
+    assert not mirror._status[_TABLE]["full"]
+    got = dict((r[0], r[2]) for r in _rows(mirror.pool))
+    assert len(got) == 11
+    assert got[8] == 1          # trong cửa sổ → thấy thay đổi
+    assert got[2] == 0          # ngoài cửa sổ → chờ lần full resync
+
+    mirror.sync(_TABLE, full=True)
+    assert _rows(mirror.pool) == _rows(remote)
+
+
+def test_schema_change_falls_back_to_full_copy(tmp_path, monkeypatch, remote):
+    mirror = _mirror(tmp_path, monkeypatch, watermark="ts", lookback_days=1)
+    mirror.sync(_TABLE)
+
+    with remote.cursor() as cur:
+        cur.execute(f"ALTER TABLE {_TABLE} ADD COLUMN note VARCHAR DEFAULT 'x'")
+
+    assert mirror.sync(_TABLE) == 10
+    assert mirror._status[_TABLE]["full"]
+    assert _rows(mirror.pool) == _rows(remote)
+
+
+def test_on_sync_runs_inside_the_sync_transaction(tmp_path, monkeypatch, remote):
+    calls = []
+
+    def on_sync(cur, cutoff):
+        # Thấy dữ liệu vừa ghi (cùng transaction) và ghi bảng dẫn xuất
+        n = cur.execute(f"SELECT count(*) FROM {_TABLE}").fetchone()[0]
+        calls.append((cutoff, n))
+        cur.execute(f"CREATE OR REPLACE TABLE src.derived AS SELECT count(*) AS n FROM {_TABLE}")
+        if fail["on"]:
+            raise RuntimeError("index build failed")
+
+    fail = {"on": False}
+    mirror = _mirror(tmp_path, monkeypatch, watermark="ts", lookback_days=2, on_sync=on_sync)
+    mirror.sync(_TABLE)
+    with remote.cursor() as cur:
+        cur.execute(f"INSERT INTO {_TABLE} VALUES (10, '2026-01-11 00:00:00', 0)")
+    mirror.sync(_TABLE)
+    assert calls == [(None, 10), (pd.Timestamp("2026-01-08").to_pydatetime(), 11)]
+
+    # on_sync lỗi → cả bảng lẫn bảng dẫn xuất giữ nguyên bản trước
+    fail["on"] = True
+    with remote.cursor() as cur:
+        cur.execute(f"INSERT INTO {_TABLE} VALUES (11, '2026-01-12 00:00:00', 0)")
+    with pytest.raises(RuntimeError):
+        mirror.sync(_TABLE)
+    with mirror.pool.cursor() as cur:
+        assert cur.execute(f"SELECT count(*) FROM {_TABLE}").fetchone()[0] == 11
+        assert cur.execute("SELECT n FROM src.derived").fetchone()[0] == 11
+
+    fail["on"] = False
+    mirror.sync(_TABLE)         # cursor không bị kẹt trong transaction dở
+    assert _rows(mirror.pool) == _rows(remote)
+
+
+def test_ensure_fresh_serves_stale_data_and_backs_off(tmp_path, monkeypatch, remote):
+    mirror = _mirror(tmp_path, monkeypatch, watermark="ts", lookback_days=1)
+    mirror.ensure_fresh([_TABLE])
+    before = _rows(mirror.pool)
+
+    attempts = []
+
+    def unreachable():
+        attempts.append(1)
+        raise duckdb.IOException("MotherDuck unreachable")
+
+    monkeypatch.setattr(local_mirror, "get_pool", unreachable)
+
+    def ensure_after(seconds: float):
+        # Giả lập lần thử gần nhất đã cách đây ``seconds`` giây
+        mirror._last_sync[_TABLE] -= seconds
+        mirror.ensure_fresh([_TABLE])
+
+    ensure_after(local_mirror._MIN_SYNC_INTERVAL + 1)
+    assert len(attempts) == 1
+    assert "MotherDuck unreachable" in mirror._status[_TABLE]["error"]
+    assert mirror.stale_tables() == [_TABLE]
+    assert _rows(mirror.pool) == before                  # vẫn phục vụ bản cũ
+
+    mirror.ensure_fresh([_TABLE])                       # ngay sau lỗi → không thử lại
+    ensure_after(local_mirror._MIN_SYNC_INTERVAL + 1)   # chưa hết thời gian chờ đã gấp đôi
+    assert len(attempts) == 1
+    ensure_after(local_mirror._MIN_SYNC_INTERVAL)
+    assert len(attempts) == 2
+    assert mirror._sync_interval(_TABLE) == 4 * local_mirror._MIN_SYNC_INTERVAL
+
+    monkeypatch.setattr(local_mirror, "get_pool", lambda: remote)
+    ensure_after(local_mirror._MAX_SYNC_BACKOFF)
+    assert mirror._status[_TABLE]["error"] is None
+    assert mirror.stale_tables() == []
+    assert mirror._sync_interval(_TABLE) == local_mirror._MIN_SYNC_INTERVAL
+
+
+def test_ensure_fresh_raises_when_nothing_to_serve(tmp_path, monkeypatch, remote):
+    mirror = _mirror(tmp_path, monkeypatch, watermark="ts")
+
+    def unreachable():
+        raise duckdb.IOException("MotherDuck unreachable")
+
+    monkeypatch.setattr(local_mirror, "get_pool", unreachable)
+    with pytest.raises(duckdb.IOException):
+        mirror.ensure_fresh([_TABLE])
+    assert _TABLE not in mirror._last_sync      # lần gọi sau thử lại ngay
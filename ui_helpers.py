@@ -1,6 +1,9 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 import streamlit as st
 
-from data_loader import load_ipay_data
+from cache_registry import data_as_of, refresh, refreshing
 
 # ── Shared product constants ──────────────────────────────────────────────────
 NAMED_PRODUCTS: set = {"MIX_01", "VTB_HOMESAVING", "TAPCARE", "ISAFE_CYBER"}
@@ -22,6 +25,29 @@ PRODUCT_DISPLAY_NAMES: dict = {
 }
 
 
+def group_products(codes: pd.Series) -> pd.Series:
+    """
+    PROD_CODE → chính nó nếu thuộc NAMED_PRODUCTS, ngược lại "Sản phẩm khác"
+    (kể cả NULL). Với cột categorical chỉ phân loại các category rồi tra theo
+    mã số, kết quả là cột object như khi gọi ``.where`` trên cột chuỗi.
+    """
+    codes = codes.astype("category")
+    cats = codes.cat.categories
+    # Phần tử cuối dành cho NULL (cat.codes = -1)
+    labels = np.append(np.where(cats.isin(NAMED_PRODUCTS), cats, "Sản phẩm khác").astype(object),
+                       "Sản phẩm khác")
+    return pd.Series(labels[codes.cat.codes.to_numpy()], index=codes.index, name=codes.name)
+
+
+def chart_table(df: pd.DataFrame, cols: list[str]) -> pa.Table:
+    """
+    Chỉ các cột ``cols`` của ``df`` ở dạng bảng Arrow để đưa vào alt.Chart.
+    Streamlit gửi dataset của Vega-Lite bằng Arrow IPC, nên đưa thẳng Arrow
+    bỏ qua một lần chuyển đổi, còn cột thừa (và index) chỉ tốn băng thông.
+    """
+    return pa.Table.from_pandas(df[cols], preserve_index=False)
+
+
 # ── Shared formatting helpers ─────────────────────────────────────────────────
 def fmt_currency(value: float) -> str:
     billions = value / 1_000_000_000
@@ -86,11 +112,46 @@ def kpi_card(
 
 
 # ── Action buttons ────────────────────────────────────────────────────────────
-def render_action_buttons() -> None:
-    """Render a Làm mới (refresh) button in the top-right area."""
-    _, col_refresh = st.columns([8, 1])
+def data_as_of_caption(datasets) -> None:
+    """Dòng nhỏ "Dữ liệu tính đến ..." cho các dataset của trang (cache_registry)."""
+    as_of = data_as_of(datasets)
+    if as_of is None:
+        return
+    text = f"Dữ liệu tính đến {as_of:%H:%M %d/%m/%Y}"
+    if refreshing(datasets):
+        text += " · đang làm mới…"
+    st.markdown(
+        f'<div style="text-align:right;font-size:0.7rem;color:#888;">{text}</div>',
+        unsafe_allow_html=True,
+    )
+
+
+def _refresh_data() -> None:
+    # Callback chạy ngoài try/except của trang: giữ lỗi lại để báo ở lượt chạy sau
+    try:
+        refresh()
+    except Exception as e:
+        st.session_state["refresh_error"] = str(e)
+
+
+def refresh_button() -> None:
+    """Nút "⟳ Làm mới": đọc lại dấu nguồn và tải lại các dataset đã thay đổi."""
+    st.button("⟳ Làm mới", width="stretch",
+              help="Tải lại các dữ liệu đã thay đổi trên MotherDuck", on_click=_refresh_data)
+
+
+def refresh_error() -> None:
+    """Báo lỗi của lần bấm làm mới trước (nếu có)."""
+    error = st.session_state.pop("refresh_error", None)
+    if error:
+        st.error(f"Không thể làm mới dữ liệu: {error}")
+
+
+def render_action_buttons(datasets=()) -> None:
+    """Render a Làm mới (refresh) button in the top-right area, plus the page's data-as-of time."""
+    col_as_of, col_refresh = st.columns([8, 1])
+    with col_as_of:
+        data_as_of_caption(datasets)
     with col_refresh:
-        if st.button("⟳ Làm mới", width="stretch",
-                     help="Xóa cache và tải lại dữ liệu mới nhất từ MotherDuck"):
-            load_ipay_data.clear()
-            st.rerun()
+        refresh_button()
+    refresh_error()